@@ -1,12 +1,20 @@
 import os
-from google import genai
-import speech_recognition as sr
 import re
 import sys 
-import schemdraw
-import schemdraw.elements as elm
-from collections import defaultdict
+from collections import Counter, defaultdict, deque, OrderedDict
 import json
+import io
+import functools
+import math
+import hashlib
+import heapq
+import sqlite3
+import unicodedata
+import time
+import mmap
+import struct
+import zlib
+from array import array
 from datetime import datetime
 
 # --- ۱. تنظیمات API و احراز هویت ---
@@ -15,117 +23,1053 @@ if 'GEMINI_API_KEY' not in os.environ:
     print("❌ اخطار: کلید API جِمنای در متغیر محیطی GEMINI_API_KEY تنظیم نشده است.")
     sys.exit(1)
 
+# --- ابزار دقیق خط لوله (بازه‌های زمانی، شمارنده‌ها و قلاب‌ها) ---
+
+class Span:
+    """یک بازه زمانی اندازه‌گیری‌شده؛ ویژگی‌ها (تعداد قطعات، ...) در attrs ثبت می‌شوند"""
+    __slots__ = ('name', 'attrs', 'start', 'duration', 'parent', '_metrics')
+    
+    def __init__(self, metrics, name, attrs, parent):
+        self._metrics = metrics
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.start = 0.0
+        self.duration = None
+    
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+    
+    def __enter__(self):
+        self._metrics._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        stack = self._metrics._stack()
+        # در کدهای asyncio بازه‌ها ممکن است به ترتیب غیرتودرتو بسته شوند
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            stack.remove(self)
+        self._metrics._finish(self)
+        return False
+
+class _NullSpan:
+    """بازه بی‌اثر وقتی ابزار دقیق خاموش است"""
+    __slots__ = ()
+    
+    def set(self, **attrs):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Metrics:
+    """جمع‌آوری بازه‌های زمانی مراحل و شمارنده‌ها با سربار کم (قابل روشن ماندن در تولید)
+    
+    هر بازه پایان‌یافته در آمار تجمعی مرحله (تعداد، مجموع، بیشینه) و یک بافر حلقوی
+    از رویدادهای اخیر ثبت و به قلاب‌های ثبت‌شده داده می‌شود.
+    """
+    
+    def __init__(self, enabled=True, max_events=1000):
+        import threading
+        
+        self.enabled = enabled
+        self.hooks = []
+        self.events = deque(maxlen=max_events)
+        self.stages = {}                 # نام → [تعداد، مجموع ثانیه، بیشینه]
+        self.counters = defaultdict(float)  # (نام، برچسب‌ها) → مقدار
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+    
+    def span(self, name, **attrs):
+        """context manager اندازه‌گیری یک مرحله: with metrics.span('parse') as s: ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        stack = self._stack()
+        return Span(self, name, attrs, stack[-1].name if stack else None)
+    
+    def count(self, name, value=1, **labels):
+        """افزایش یک شمارنده (مثلاً count('render_cache', result='hit'))"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+        if self.hooks:
+            self._emit({'type': 'counter', 'name': name, 'value': value, 'labels': labels,
+                        'ts': time.time()})
+    
+    def _finish(self, span):
+        self.record({'type': 'span', 'name': span.name, 'seconds': span.duration,
+                     'parent': span.parent, 'attrs': span.attrs, 'ts': time.time()})
+    
+    def record(self, event):
+        """ثبت یک رویداد span آماده (مثلاً رسیده از پروسه کارگر)"""
+        with self._lock:
+            stats = self.stages.get(event['name'])
+            if stats is None:
+                stats = self.stages[event['name']] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += event['seconds']
+            if event['seconds'] > stats[2]:
+                stats[2] = event['seconds']
+            self.events.append(event)
+        if self.hooks:
+            self._emit(event)
+    
+    def drain(self):
+        """برداشتن همه رویدادها و شمارنده‌ها (برای ارسال از پروسه کارگر به پروسه اصلی)"""
+        with self._lock:
+            state = {'events': list(self.events),
+                     'counters': [(name, dict(labels), value)
+                                  for (name, labels), value in self.counters.items()]}
+        self.reset()
+        return state
+    
+    def absorb(self, state):
+        """ادغام خروجی drain یک پروسه دیگر"""
+        for event in state['events']:
+            self.record(event)
+        for name, labels, value in state['counters']:
+            self.count(name, value, **labels)
+    
+    def _emit(self, event):
+        for hook in list(self.hooks):
+            try:
+                hook(event)
+            except Exception as e:
+                print(f"⚠️ خطا در قلاب ابزار دقیق: {e}")
+    
+    def add_hook(self, hook):
+        """ثبت تابعی که هر رویداد (span یا counter) را به صورت دیکشنری دریافت می‌کند"""
+        self.hooks.append(hook)
+        return hook
+    
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+    
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.stages.clear()
+            self.counters.clear()
+    
+    def snapshot(self):
+        """آمار تجمعی مراحل و شمارنده‌ها به صورت دیکشنری قابل JSON"""
+        with self._lock:
+            return {
+                'stages': {name: {'count': c, 'seconds_total': total, 'seconds_max': peak}
+                           for name, (c, total, peak) in self.stages.items()},
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in self.counters.items()],
+            }
+    
+    def to_json_lines(self):
+        """رویدادهای اخیر به فرمت JSON lines (هر خط یک رویداد)"""
+        with self._lock:
+            events = list(self.events)
+        return ''.join(json.dumps(e, ensure_ascii=False, default=str) + '\n' for e in events)
+    
+    def to_prometheus(self, prefix='prg'):
+        """آمار تجمعی به فرمت متنی Prometheus"""
+        def labels_text(labels):
+            if not labels:
+                return ''
+            pairs = []
+            for key, value in labels:
+                value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                pairs.append(f'{key}="{value}"')
+            return '{' + ','.join(pairs) + '}'
+        
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent in each pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, stats in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stats["seconds_total"]:.9f}')
+        lines.append(f"# TYPE {prefix}_stage_seconds_max gauge")
+        for name, stats in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{name}"}} {stats["seconds_max"]:.9f}')
+        
+        by_name = defaultdict(list)
+        for counter in snapshot['counters']:
+            by_name[counter['name']].append(counter)
+        for name in sorted(by_name):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for counter in by_name[name]:
+                labels = labels_text(sorted(counter['labels'].items()))
+                lines.append(f"{prefix}_{name}_total{labels} {counter['value']:g}")
+        return '\n'.join(lines) + '\n'
+
+# نمونه سراسری؛ PRG_METRICS=0 ابزار دقیق را خاموش می‌کند
+METRICS = Metrics(enabled=os.environ.get('PRG_METRICS', '1') != '0')
+
+def get_metrics():
+    return METRICS
+
+def export_metrics(jsonl_path=None, prometheus_path=None, metrics=None):
+    """ذخیره رویدادها (JSON lines، افزودنی) و/یا آمار تجمعی (Prometheus) در فایل"""
+    metrics = metrics or METRICS
+    if jsonl_path:
+        with open(jsonl_path, 'a', encoding='utf-8') as f:
+            f.write(metrics.to_json_lines())
+    if prometheus_path:
+        tmp_path = f"{prometheus_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(metrics.to_prometheus())
+        os.replace(tmp_path, prometheus_path)
+
 # --- ۲. توابع تحلیل و رسم شماتیک ---
 
-def parse_netlist(text):
-    """تبدیل متن نت‌لیست به لیست قطعات"""
-    components = []
-    for line in text.strip().split('\n'):
-        line = line.strip()
+def _iter_raw_lines(source):
+    """خواندن خط‌به‌خط منبع نت‌لیست (متن، فایل یا mmap) بدون بارگذاری کامل آن"""
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    
+    if isinstance(source, mmap.mmap):
+        for raw in iter(source.readline, b''):
+            yield raw.decode('utf-8', errors='replace')
+        return
+    
+    for raw in source:
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8', errors='replace')
+        yield raw
+
+def iter_logical_lines(source):
+    """ادغام خطوط ادامه‌دار (+) و حذف توضیحات؛ خروجی خطوط منطقی نت‌لیست است"""
+    pending = None
+    for raw in _iter_raw_lines(source):
+        line = raw.strip()
         
-        if not line or line.startswith('*') or line.startswith('.'):
+        if not line or line.startswith('*'):
             continue
         
-        parts = line.split()
-        if len(parts) < 3:
+        # خط ادامه: به خط منطقی قبلی می‌چسبد
+        if line.startswith('+'):
+            if pending is not None:
+                pending = f"{pending} {line[1:].strip()}"
             continue
         
-        comp_type = parts[0][0].upper()
-        name = parts[0]
+        if pending is not None:
+            yield pending
+        pending = line
+    
+    if pending is not None:
+        yield pending
+
+def parse_component_line(line):
+    """تبدیل یک خط منطقی نت‌لیست به دیکشنری قطعه (یا None)"""
+    parts = line.split()
+    if len(parts) < 3:
+        return None
+    
+    comp_type = parts[0][0].upper()
+    name = parts[0]
+    # نام عناصر SPICE با حرف لاتین شروع می‌شود؛ جمله‌های فارسی در پاسخ مدل قطعه نیستند
+    if not comp_type.isascii():
+        return None
+    
+    if comp_type in ['D']:
+        if len(parts) < 3:
+            return None
+        node1, node2 = parts[1], parts[2]
+        value = parts[3] if len(parts) > 3 else "1N4148"
+        return {
+            'type': comp_type,
+            'name': name,
+            'node1': node1,
+            'node2': node2,
+            'value': value,
+            'pins': 2
+        }
+    elif comp_type in ['Q']:
+        if len(parts) < 4:
+            return None
+        collector, base, emitter = parts[1], parts[2], parts[3]
+        model = parts[4] if len(parts) > 4 else "2N2222"
+        return {
+            'type': comp_type,
+            'name': name,
+            'collector': collector,
+            'base': base,
+            'emitter': emitter,
+            'node1': collector,  # برای الگوریتم مسیریابی
+            'node2': emitter,
+            'value': model,
+            'pins': 3
+        }
+    elif comp_type in ['M']:
+        if len(parts) < 5:
+            return None
+        drain, gate, source, body = parts[1], parts[2], parts[3], parts[4]
+        model = parts[5] if len(parts) > 5 else "IRF530"
+        return {
+            'type': comp_type,
+            'name': name,
+            'drain': drain,
+            'gate': gate,
+            'source': source,
+            'body': body,
+            'node1': drain,  # برای الگوریتم مسیریابی
+            'node2': source,
+            'value': model,
+            'pins': 4
+        }
+    elif comp_type in ['U', 'X']:
+        # آپ‌امپ یا IC
+        # فرمت: U1 out in+ in- vcc vee model
+        if len(parts) < 4:
+            return None
         
-        if comp_type in ['D']:
-            if len(parts) < 3:
-                continue
-            node1, node2 = parts[1], parts[2]
-            value = parts[3] if len(parts) > 3 else "1N4148"
-            components.append({
-                'type': comp_type,
-                'name': name,
-                'node1': node1,
-                'node2': node2,
-                'value': value,
-                'pins': 2
-            })
-        elif comp_type in ['Q']:
-            if len(parts) < 4:
-                continue
-            collector, base, emitter = parts[1], parts[2], parts[3]
-            model = parts[4] if len(parts) > 4 else "2N2222"
-            components.append({
-                'type': comp_type,
-                'name': name,
-                'collector': collector,
-                'base': base,
-                'emitter': emitter,
-                'node1': collector,  # برای الگوریتم مسیریابی
-                'node2': emitter,
-                'value': model,
-                'pins': 3
-            })
-        elif comp_type in ['M']:
-            if len(parts) < 5:
-                continue
-            drain, gate, source, body = parts[1], parts[2], parts[3], parts[4]
-            model = parts[5] if len(parts) > 5 else "IRF530"
-            components.append({
-                'type': comp_type,
-                'name': name,
-                'drain': drain,
-                'gate': gate,
-                'source': source,
-                'body': body,
-                'node1': drain,  # برای الگوریتم مسیریابی
-                'node2': source,
-                'value': model,
-                'pins': 4
-            })
-        elif comp_type in ['U', 'X']:
-            # آپ‌امپ یا IC
-            # فرمت: U1 out in+ in- vcc vee model
+        # پارامترهای نمونه (R=1k) از نودها جدا می‌شوند
+        params = dict(p.split('=', 1) for p in parts[1:] if '=' in p)
+        if params:
+            parts = [p for p in parts if '=' not in p]
             if len(parts) < 4:
-                continue
-            
-            # استخراج نودها و مدل
-            all_nodes = parts[1:-1]  # همه به جز نام و مدل
-            model = parts[-1]
-            
-            # برای آپ‌امپ معمولی: out, in+, in-, vcc, vee
-            comp_data = {
-                'type': comp_type,
-                'name': name,
-                'all_nodes': all_nodes,
-                'value': model,
-                'pins': len(all_nodes)
-            }
+                return None
+        
+        # استخراج نودها و مدل
+        all_nodes = parts[1:-1]  # همه به جز نام و مدل
+        model = parts[-1]
+        
+        # برای آپ‌امپ معمولی: out, in+, in-, vcc, vee
+        comp_data = {
+            'type': comp_type,
+            'name': name,
+            'all_nodes': all_nodes,
+            'value': model,
+            'pins': len(all_nodes)
+        }
+        if params:
+            comp_data['params'] = params
+        
+        # اگر نودهای کافی داریم، آنها را نام‌گذاری کنیم
+        if len(all_nodes) >= 3:
+            comp_data['out'] = all_nodes[0]
+            comp_data['in_p'] = all_nodes[1]
+            comp_data['in_n'] = all_nodes[2]
+            comp_data['node1'] = all_nodes[1]  # ورودی برای مسیریابی
+            comp_data['node2'] = all_nodes[0]  # خروجی
+        
+        if len(all_nodes) >= 5:
+            comp_data['vcc'] = all_nodes[3]
+            comp_data['vee'] = all_nodes[4]
+        
+        return comp_data
+    else:  # R, C, L, V
+        if len(parts) < 4:
+            return None
+        node1, node2 = parts[1], parts[2]
+        value = parts[3]
+        # منابع با فرم «V1 1 0 DC 5»
+        if comp_type in ['V', 'I'] and value.upper() == 'DC' and len(parts) > 4:
+            value = parts[4]
+        return {
+            'type': comp_type,
+            'name': name,
+            'node1': node1,
+            'node2': node2,
+            'value': value,
+            'pins': 2
+        }
+
+def iter_components(source, base_dir=None, subckts=None, _include_stack=(), allow_include=False):
+    """پارس جریانی نت‌لیست: قطعات یکی‌یکی و به‌صورت تنبل تولید می‌شوند
+    
+    source می‌تواند متن، شیء فایل (متنی یا باینری) یا mmap باشد.
+    تعریف‌های .subckt در دیکشنری subckts (در صورت ارسال) جمع می‌شوند و
+    قطعات داخل آنها در خروجی سطح بالا ظاهر نمی‌شوند.
+    .include/.inc فقط با allow_include=True دنبال می‌شوند (فایل‌هایی که کاربر خودش
+    نام برده، مثل iter_netlist_file)؛ متن مدل، شبکه یا JSON هیچ فایلی از دیسک را
+    باز نمی‌کند. .lib همیشه نادیده گرفته می‌شود.
+    """
+    current_subckt = None
+    
+    for line in iter_logical_lines(source):
+        if line.startswith('.'):
+            parts = line.split()
+            directive = parts[0].lower()
             
-            # اگر نودهای کافی داریم، آنها را نام‌گذاری کنیم
-            if len(all_nodes) >= 3:
-                comp_data['out'] = all_nodes[0]
-                comp_data['in_p'] = all_nodes[1]
-                comp_data['in_n'] = all_nodes[2]
-                comp_data['node1'] = all_nodes[1]  # ورودی برای مسیریابی
-                comp_data['node2'] = all_nodes[0]  # خروجی
+            if directive in ('.include', '.inc') and len(parts) > 1:
+                if not allow_include:
+                    continue
+                path = parts[1].strip('\'"')
+                if base_dir and not os.path.isabs(path):
+                    path = os.path.join(base_dir, path)
+                if not os.path.isfile(path):
+                    # مثل دستورات ناشناخته: هشدار و ادامه پارس بقیه نت‌لیست
+                    print(f"⚠️ فایل include یافت نشد و نادیده گرفته شد: {parts[1]}")
+                    continue
+                included = iter_netlist_file(path, subckts=subckts, _include_stack=_include_stack)
+                if current_subckt is not None:
+                    current_subckt['components'].extend(included)
+                else:
+                    yield from included
+            elif directive == '.subckt' and len(parts) > 1:
+                current_subckt = {
+                    'name': parts[1],
+                    'pins': [p for p in parts[2:] if '=' not in p],
+                    'components': []
+                }
+            elif directive == '.ends':
+                if current_subckt is not None and subckts is not None:
+                    subckts[current_subckt['name']] = current_subckt
+                current_subckt = None
+            elif directive == '.end':
+                break
+            continue
+        
+        comp = parse_component_line(line)
+        if comp is None:
+            continue
+        
+        if current_subckt is not None:
+            current_subckt['components'].append(comp)
+        else:
+            yield comp
+
+def iter_netlist_file(path, subckts=None, use_mmap=True, _include_stack=()):
+    """پارس جریانی یک فایل نت‌لیست با mmap؛ مسیرهای .include نسبت به همین فایل هستند"""
+    path = os.path.abspath(path)
+    if path in _include_stack:
+        print(f"⚠️ include حلقوی نادیده گرفته شد: {path}")
+        return
+    
+    include_stack = _include_stack + (path,)
+    base_dir = os.path.dirname(path)
+    
+    with open(path, 'rb') as f:
+        # فایل خالی قابل mmap نیست
+        if use_mmap and os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from iter_components(mm, base_dir, subckts, include_stack, allow_include=True)
+        else:
+            yield from iter_components(f, base_dir, subckts, include_stack, allow_include=True)
+
+def parse_netlist(text, allow_include=False):
+    """تبدیل متن نت‌لیست به لیست قطعات"""
+    with METRICS.span('parse') as span:
+        components = list(iter_components(text, allow_include=allow_include))
+        span.set(components=len(components))
+    return components
+
+# --- زیرمدارهای سلسله‌مراتبی (.subckt) با بسط حافظه‌دار و تنبل ---
+
+def _node_keys(comp):
+    """کلیدهای دیکشنری قطعه که مقدارشان نام نود است (به جز all_nodes)"""
+    keys = [key for key in ('node1', 'node2') if key in comp]
+    keys.extend(role for role in PIN_ROLES.get(comp['type'], ()) if role in comp)
+    return keys
+
+class SubcircuitLibrary:
+    """تعریف‌های .subckt؛ هر تعریف یک بار کامپایل و نمونه‌ها فقط هنگام نیاز بسط داده می‌شوند
+    
+    کامپایل، نودهای تعریف را به شماره‌های محلی (اول پایه‌ها، بعد نودهای داخلی) تبدیل
+    می‌کند و حافظه‌دار است؛ بسط هر نمونه فقط جایگذاری نام نودهاست. نام قطعات و نودهای
+    داخلی بسط‌یافته با مسیر نمونه پیشوند می‌گیرند (X1.X2.R1، X1.mid) و زمین سراسری است.
+    """
+    
+    def __init__(self, definitions=None):
+        self.definitions = definitions if definitions is not None else {}
+        self._compiled = {}
+        self._flat_counts = {}
+    
+    def __contains__(self, name):
+        return name in self.definitions
+    
+    def __len__(self):
+        return len(self.definitions)
+    
+    def definition_of(self, comp):
+        """نام تعریف زیرمدار برای یک خط X/U (None اگر نمونه زیرمدار نباشد)"""
+        if comp['type'] in ('X', 'U') and comp.get('value') in self.definitions:
+            return comp['value']
+        return None
+    
+    def _check_pins(self, comp, name):
+        pins = self.definitions[name]['pins']
+        nodes = comp.get('all_nodes', ())
+        if len(nodes) != len(pins):
+            raise ValueError(f"{comp['name']} connects {len(nodes)} nodes but subcircuit "
+                             f"{name} has {len(pins)} pins")
+    
+    def compile(self, name, _stack=()):
+        """(نام نودهای داخلی، ورودی‌ها) یک تعریف؛ نتیجه برای همه نمونه‌ها مشترک است"""
+        compiled = self._compiled.get(name)
+        if compiled is not None:
+            return compiled
+        if name in _stack:
+            raise ValueError(f"recursive subcircuit: {' -> '.join(_stack + (name,))}")
+        
+        definition = self.definitions[name]
+        slots = {pin: i for i, pin in enumerate(definition['pins'])}
+        internal = []
+        
+        def slot(node):
+            if is_ground(node):
+                return node
+            index = slots.get(node)
+            if index is None:
+                index = slots[node] = len(slots)
+                internal.append(node)
+            return index
+        
+        entries = []
+        for comp in definition['components']:
+            sub = self.definition_of(comp)
+            if sub is not None:
+                self._check_pins(comp, sub)
+                self.compile(sub, _stack + (name,))
+                entries.append(('instance', comp['name'], sub, [slot(n) for n in comp['all_nodes']]))
+            else:
+                all_nodes = comp.get('all_nodes')
+                entries.append(('component', comp, [(key, slot(comp[key])) for key in _node_keys(comp)],
+                                [slot(n) for n in all_nodes] if all_nodes is not None else None))
+        
+        compiled = self._compiled[name] = (internal, entries)
+        return compiled
+    
+    def flat_count(self, name):
+        """تعداد قطعات یک نمونه پس از بسط کامل (بدون بسط واقعی)"""
+        count = self._flat_counts.get(name)
+        if count is None:
+            _, entries = self.compile(name)
+            count = sum(self.flat_count(e[2]) if e[0] == 'instance' else 1 for e in entries)
+            self._flat_counts[name] = count
+        return count
+    
+    def expand(self, name, prefix, pins):
+        """بسط تنبل یک نمونه: قطعات اولیه با نودهای واقعی یکی‌یکی تولید می‌شوند"""
+        internal, entries = self.compile(name)
+        nodes = list(pins) + [prefix + n for n in internal]
+        
+        def node(s):
+            return nodes[s] if s.__class__ is int else s
+        
+        for entry in entries:
+            if entry[0] == 'instance':
+                _, inst_name, sub, inst_slots = entry
+                yield from self.expand(sub, f"{prefix}{inst_name}.", [node(s) for s in inst_slots])
+                continue
+            _, template, keyed, all_slots = entry
+            comp = dict(template)
+            comp['name'] = prefix + template['name']
+            for key, s in keyed:
+                comp[key] = node(s)
+            if all_slots is not None:
+                comp['all_nodes'] = [node(s) for s in all_slots]
+            yield comp
+    
+    def flatten(self, components):
+        """جریان قطعات تخت: نمونه‌های زیرمدار بسط و بقیه قطعات بدون تغییر عبور می‌کنند"""
+        for comp in components:
+            name = self.definition_of(comp)
+            if name is None:
+                yield comp
+            else:
+                self._check_pins(comp, name)
+                yield from self.expand(name, comp['name'] + '.', comp['all_nodes'])
+    
+    def annotate(self, components):
+        """افزودن نام پایه‌های تعریف (pin_names) به نمونه‌ها برای برچسب قاب در شماتیک"""
+        for comp in components:
+            name = self.definition_of(comp)
+            if name is not None:
+                comp['pin_names'] = list(self.definitions[name]['pins'])
+        return components
+
+class HierarchicalNetlist:
+    """نت‌لیست سطح بالا (نمونه‌های زیرمدار بسط‌نیافته) به همراه کتابخانه زیرمدارها"""
+    
+    def __init__(self, components, library=None):
+        self.library = library or SubcircuitLibrary()
+        self.components = self.library.annotate(components)
+    
+    @classmethod
+    def from_text(cls, text, base_dir=None):
+        definitions = {}
+        with METRICS.span('parse') as span:
+            components = list(iter_components(text, base_dir, subckts=definitions))
+            span.set(components=len(components), subckts=len(definitions))
+        return cls(components, SubcircuitLibrary(definitions))
+    
+    @classmethod
+    def from_file(cls, path):
+        """فایل نت‌لیست یا circuit_*.json"""
+        if path.lower().endswith('.json'):
+            return cls.from_text(read_netlist_file(path))
+        definitions = {}
+        with METRICS.span('parse') as span:
+            components = list(iter_netlist_file(path, subckts=definitions))
+            span.set(components=len(components), subckts=len(definitions))
+        return cls(components, SubcircuitLibrary(definitions))
+    
+    def flat(self):
+        """قطعات تخت به صورت جریان (برای تحلیل‌هایی که به مدار کامل نیاز دارند)"""
+        return self.library.flatten(self.components)
+    
+    def flat_count(self):
+        return sum(self.library.flat_count(name) if name is not None else 1
+                   for name in map(self.library.definition_of, self.components))
+    
+    def used_definitions(self):
+        """نام تعریف‌های به‌کاررفته (مستقیم یا تودرتو) به ترتیب اولین استفاده"""
+        used = []
+        queue = deque(self.components)
+        while queue:
+            name = self.library.definition_of(queue.popleft())
+            if name is not None and name not in used:
+                used.append(name)
+                queue.extend(self.library.definitions[name]['components'])
+        return used
+    
+    def sheets(self):
+        """برگه‌های شماتیک سلسله‌مراتبی: [(نام، قطعات، پایه‌ها)] برای سطح بالا و هر تعریف"""
+        sheets = [('top', self.components, [])]
+        for name in self.used_definitions():
+            definition = self.library.definitions[name]
+            sheets.append((name, self.library.annotate(definition['components']),
+                           definition['pins']))
+        return sheets
+
+# --- نمایش فشرده و ستونی نت‌لیست ---
+
+# نقش پایه‌ها برای قطعات چندپایه (به ترتیب پایه‌ها در نت‌لیست)
+PIN_ROLES = {
+    'Q': ('collector', 'base', 'emitter'),
+    'M': ('drain', 'gate', 'source', 'body'),
+    'U': ('out', 'in_p', 'in_n', 'vcc', 'vee'),
+    'X': ('out', 'in_p', 'in_n', 'vcc', 'vee'),
+}
+
+def _pin_index(comp_type, pin_count, role):
+    """اندیس پایه متناظر با یک کلید دیکشنری قطعه (node1، collector، ...) یا None"""
+    if comp_type in ['U', 'X']:
+        # نام‌گذاری پایه‌ها فقط وقتی حداقل سه نود داریم (مثل parse_netlist)
+        if pin_count < 3:
+            return None
+        if role == 'node1':
+            return 1
+        if role == 'node2':
+            return 0
+        roles = PIN_ROLES[comp_type][:3] if pin_count < 5 else PIN_ROLES[comp_type]
+        return roles.index(role) if role in roles else None
+    
+    if comp_type in PIN_ROLES:
+        roles = PIN_ROLES[comp_type]
+        if role == 'node1':
+            return 0
+        if role == 'node2':
+            return roles.index('emitter' if comp_type == 'Q' else 'source')
+        return roles.index(role) if role in roles else None
+    
+    if role == 'node1':
+        return 0
+    if role == 'node2':
+        return 1
+    return None
+
+def component_nodes(comp):
+    """لیست مرتب نودهای همه پایه‌های یک قطعه (دیکشنری یا نمای فشرده)"""
+    if isinstance(comp, ComponentView):
+        return comp.nodes
+    
+    ctype = comp['type']
+    if ctype in ['U', 'X']:
+        return list(comp.get('all_nodes', []))
+    if ctype in PIN_ROLES:
+        return [comp[role] for role in PIN_ROLES[ctype]]
+    return [comp['node1'], comp['node2']]
+
+class ComponentView:
+    """نمای سبک (با __slots__) از یک قطعه در CompactNetlist با رابط شبیه دیکشنری"""
+    __slots__ = ('_net', '_idx')
+    
+    def __init__(self, net, idx):
+        self._net = net
+        self._idx = idx
+    
+    @property
+    def index(self):
+        return self._idx
+    
+    @property
+    def nodes(self):
+        net = self._net
+        start, end = net.pin_offsets[self._idx], net.pin_offsets[self._idx + 1]
+        return [net.node_names[n] for n in net.pin_nodes[start:end]]
+    
+    def _keys(self):
+        net, i = self._net, self._idx
+        ctype = chr(net.types[i])
+        count = net.pin_offsets[i + 1] - net.pin_offsets[i]
+        keys = ['type', 'name']
+        if ctype in ['U', 'X']:
+            keys.append('all_nodes')
+        keys += [k for k in ('collector', 'base', 'emitter', 'drain', 'gate', 'source', 'body',
+                             'out', 'in_p', 'in_n', 'vcc', 'vee', 'node1', 'node2')
+                 if _pin_index(ctype, count, k) is not None]
+        return keys + ['value', 'pins']
+    
+    def __getitem__(self, key):
+        net, i = self._net, self._idx
+        if key == 'type':
+            return chr(net.types[i])
+        if key == 'name':
+            return net.names[i]
+        if key == 'value':
+            return net.value_table[net.value_ids[i]]
+        
+        start, end = net.pin_offsets[i], net.pin_offsets[i + 1]
+        if key == 'pins':
+            return end - start
+        
+        ctype = chr(net.types[i])
+        if key == 'all_nodes' and ctype in ['U', 'X']:
+            return self.nodes
+        
+        pin = _pin_index(ctype, end - start, key)
+        if pin is None:
+            raise KeyError(key)
+        return net.node_names[net.pin_nodes[start + pin]]
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def keys(self):
+        return self._keys()
+    
+    def to_dict(self):
+        return {k: self[k] for k in self._keys()}
+    
+    def __repr__(self):
+        return f"ComponentView({self.to_dict()!r})"
+
+class CompactNetlist:
+    """نت‌لیست ستونی: نودهای اینترن‌شده به شناسه عددی، کد نوع و جدول پایه‌ها در آرایه‌ها
+    
+    پایه‌ها به شکل CSR ذخیره می‌شوند: پایه‌های قطعه i در
+    pin_nodes[pin_offsets[i]:pin_offsets[i+1]] قرار دارند.
+    """
+    __slots__ = ('node_names', '_node_ids', 'types', 'names', 'value_table', '_value_ids',
+                 'value_ids', 'pin_offsets', 'pin_nodes', '_index')
+    
+    def __init__(self):
+        self.node_names = []
+        self._node_ids = {}
+        self.types = array('B')
+        self.names = []
+        self.value_table = []
+        self._value_ids = {}
+        self.value_ids = array('l')
+        self.pin_offsets = array('l', [0])
+        self.pin_nodes = array('l')
+        self._index = None
+    
+    @classmethod
+    def from_components(cls, components):
+        """ساخت از هر iterable قطعات (مثلاً خروجی جریانی iter_components)"""
+        net = cls()
+        for comp in components:
+            net.append(comp)
+        return net
+    
+    @classmethod
+    def from_source(cls, source):
+        """پارس مستقیم متن/فایل/mmap به نمایش فشرده بدون ساخت لیست دیکشنری‌ها"""
+        return cls.from_components(iter_components(source))
+    
+    def node_id(self, name):
+        """شناسه عددی نود (با اینترن کردن نام)"""
+        node = self._node_ids.get(name)
+        if node is None:
+            node = len(self.node_names)
+            self._node_ids[name] = node
+            self.node_names.append(name)
+        return node
+    
+    def append(self, comp):
+        value = comp.get('value', '')
+        value_id = self._value_ids.get(value)
+        if value_id is None:
+            value_id = len(self.value_table)
+            self._value_ids[value] = value_id
+            self.value_table.append(value)
+        
+        self.types.append(ord(comp['type']))
+        self.names.append(comp['name'])
+        self.value_ids.append(value_id)
+        for node in component_nodes(comp):
+            self.pin_nodes.append(self.node_id(node))
+        self.pin_offsets.append(len(self.pin_nodes))
+        self._index = None
+    
+    def __len__(self):
+        return len(self.types)
+    
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return ComponentView(self, idx)
+    
+    def __iter__(self):
+        for idx in range(len(self.types)):
+            yield ComponentView(self, idx)
+    
+    def pins(self, idx):
+        """شناسه‌های عددی نودهای پایه‌های قطعه idx"""
+        return self.pin_nodes[self.pin_offsets[idx]:self.pin_offsets[idx + 1]]
+    
+    def to_dicts(self):
+        return [view.to_dict() for view in self]
+    
+    def nbytes(self):
+        """تخمین حافظه مصرفی (بایت)"""
+        arrays = (self.types, self.value_ids, self.pin_offsets, self.pin_nodes)
+        size = sum(a.itemsize * len(a) for a in arrays)
+        size += sum(sys.getsizeof(s) for s in self.node_names)
+        size += sum(sys.getsizeof(s) for s in self.names)
+        size += sum(sys.getsizeof(s) for s in self.value_table)
+        return size
+    
+    def to_numpy(self):
+        """آرایه‌های NumPy (بدون کپی) برای پردازش برداری کل نت‌لیست"""
+        import numpy as np
+        return {
+            'types': np.frombuffer(self.types, dtype=np.uint8),
+            'value_ids': np.frombuffer(self.value_ids, dtype=np.dtype(self.value_ids.typecode)),
+            'pin_offsets': np.frombuffer(self.pin_offsets, dtype=np.dtype(self.pin_offsets.typecode)),
+            'pin_nodes': np.frombuffer(self.pin_nodes, dtype=np.dtype(self.pin_nodes.typecode)),
+        }
+    
+    def short_circuit_mask(self):
+        """ماسک برداری قطعاتی که دو سر مسیرشان (node1/node2) به یک نود وصل است"""
+        import numpy as np
+        cols = self.to_numpy()
+        types, offsets, pins = cols['types'], cols['pin_offsets'], cols['pin_nodes']
+        counts = np.diff(offsets)
+        starts = offsets[:-1]
+        
+        # اندیس پایه node1 و node2 برای هر نوع قطعه
+        first = np.zeros(len(types), dtype=starts.dtype)
+        second = np.ones(len(types), dtype=starts.dtype)
+        is_fet_or_bjt = (types == ord('Q')) | (types == ord('M'))
+        second[is_fet_or_bjt] = 2
+        is_ic = (types == ord('U')) | (types == ord('X'))
+        first[is_ic], second[is_ic] = 1, 0
+        
+        valid = counts > np.maximum(first, second)
+        mask = np.zeros(len(types), dtype=bool)
+        mask[valid] = pins[starts[valid] + first[valid]] == pins[starts[valid] + second[valid]]
+        return mask
+
+# --- ایندکس اتصالات (مجاورت نود به پایه‌ها + union-find شبکه‌ها) ---
+
+def _through_pins(comp_type, pin_count):
+    """پایه‌هایی که مسیر اصلی جریان از آنها عبور می‌کند (ورودی/خروجی پیمایش)"""
+    if comp_type in ['U', 'X']:
+        if pin_count >= 3:
+            return (1, 0)  # ورودی مثبت → خروجی
+        return (0, 1) if pin_count == 2 else ()
+    if comp_type in ['Q', 'M']:
+        return (0, 2)  # کلکتور → امیتر / درین → سورس
+    return (0, 1) if pin_count >= 2 else ()
+
+class ConnectivityIndex:
+    """ایندکس پایدار اتصالات یک نت‌لیست که فقط یک بار ساخته می‌شود
+    
+    node_pins[n] لیست (اندیس قطعه، اندیس پایه) متصل به نود n است و
+    union-find روی نودها، بخش‌های به‌هم‌پیوسته مدار را مشخص می‌کند.
+    """
+    
+    def __init__(self, components):
+        if isinstance(components, CompactNetlist):
+            # استفاده مستقیم از شناسه‌های اینترن‌شده نت‌لیست فشرده
+            self.components = components
+            self.node_names = components.node_names
+            self._node_ids = components._node_ids
+            self.comp_nodes = [components.pins(i) for i in range(len(components))]
+            self.types = [chr(t) for t in components.types]
+        else:
+            self.components = list(components)
+            self.node_names = []
+            self._node_ids = {}
+            self.comp_nodes = []
+            self.types = []
+            for comp in self.components:
+                self.comp_nodes.append([self._intern(n) for n in component_nodes(comp)])
+                self.types.append(comp['type'])
+        
+        node_count = len(self.node_names)
+        self.node_pins = [[] for _ in range(node_count)]
+        self._parent = array('l', range(node_count))
+        self._size = array('l', [1]) * node_count
+        
+        for comp_idx, nodes in enumerate(self.comp_nodes):
+            for pin, node in enumerate(nodes):
+                self.node_pins[node].append((comp_idx, pin))
+                if pin:
+                    self._union(nodes[0], node)
+    
+    def _intern(self, name):
+        node = self._node_ids.get(name)
+        if node is None:
+            node = len(self.node_names)
+            self._node_ids[name] = node
+            self.node_names.append(name)
+        return node
+    
+    def node_id(self, name):
+        return self._node_ids.get(name)
+    
+    def _find(self, node):
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    
+    def _union(self, a, b):
+        ra, rb = self._find(a), self._find(b)
+        if ra == rb:
+            return
+        if self._size[ra] < self._size[rb]:
+            ra, rb = rb, ra
+        self._parent[rb] = ra
+        self._size[ra] += self._size[rb]
+    
+    def connected(self, node_a, node_b):
+        """آیا دو نود (با نام) از طریق قطعات به هم وصل‌اند؟"""
+        a, b = self._node_ids.get(node_a), self._node_ids.get(node_b)
+        if a is None or b is None:
+            return False
+        return self._find(a) == self._find(b)
+    
+    def islands(self):
+        """گروه‌بندی نام نودها بر اساس بخش‌های جدا از هم مدار"""
+        groups = defaultdict(list)
+        for node, name in enumerate(self.node_names):
+            groups[self._find(node)].append(name)
+        return list(groups.values())
+    
+    def circuit_path(self, start_node='1', skip_types=('V',)):
+        """پیمایش O(V+E) کل مدار و گروه‌بندی قطعات موازی (بدون سقف تعداد گام)"""
+        comps = self.components
+        comp_nodes = self.comp_nodes
+        node_pins = self.node_pins
+        
+        visited = bytearray(len(comp_nodes))
+        for comp_idx, ctype in enumerate(self.types):
+            if ctype in skip_types:
+                visited[comp_idx] = 1
+        
+        ground = self._node_ids.get('0')
+        seen = bytearray(len(self.node_names))
+        queue = deque()       # نودهای مسیر اصلی
+        side_nodes = deque()  # نودهای پایه‌های فرعی (بیس، گیت، تغذیه، ...)
+        deferred = deque()    # قطعاتی که فقط از پایه فرعی دیده شده‌اند
+        path = []
+        
+        def enqueue(node, target):
+            if node != ground and not seen[node]:
+                seen[node] = 1
+                target.append(node)
+        
+        def visit_device(comp_idx):
+            """ثبت قطعه چندپایه و صف کردن نود خروجی و نودهای فرعی آن"""
+            nodes = comp_nodes[comp_idx]
+            through = _through_pins(self.types[comp_idx], len(nodes))
+            for pin, node in enumerate(nodes):
+                enqueue(node, queue if pin in through else side_nodes)
+        
+        start = self._node_ids.get(str(start_node))
+        if start is not None:
+            enqueue(start, queue)
+        
+        sweep = 0
+        while True:
+            while queue:
+                node = queue.popleft()
+                groups = {}
+                for comp_idx, pin in node_pins[node]:
+                    if visited[comp_idx]:
+                        continue
+                    nodes = comp_nodes[comp_idx]
+                    through = _through_pins(self.types[comp_idx], len(nodes))
+                    if pin not in through:
+                        deferred.append(comp_idx)
+                        continue
+                    
+                    visited[comp_idx] = 1
+                    if len(nodes) == 2:
+                        # قطعات دوپایه با مقصد یکسان موازی هستند
+                        other = nodes[through[1] if pin == through[0] else through[0]]
+                        groups.setdefault(('2', other), []).append(comps[comp_idx])
+                        enqueue(other, queue)
+                    else:
+                        groups[('n', comp_idx)] = [comps[comp_idx]]
+                        visit_device(comp_idx)
+                path.extend(groups.values())
             
-            if len(all_nodes) >= 5:
-                comp_data['vcc'] = all_nodes[3]
-                comp_data['vee'] = all_nodes[4]
+            if deferred:
+                comp_idx = deferred.popleft()
+                if not visited[comp_idx]:
+                    visited[comp_idx] = 1
+                    path.append([comps[comp_idx]])
+                    visit_device(comp_idx)
+                continue
             
-            components.append(comp_data)
-        else:  # R, C, L, V
-            if len(parts) < 4:
+            if side_nodes:
+                node = side_nodes.popleft()
+                queue.append(node)
                 continue
-            node1, node2 = parts[1], parts[2]
-            value = parts[3]
-            components.append({
-                'type': comp_type,
-                'name': name,
-                'node1': node1,
-                'node2': node2,
-                'value': value,
-                'pins': 2
-            })
-    
-    return components
+            
+            # بخش‌هایی که فقط از طریق زمین یا اصلاً وصل نیستند
+            while sweep < len(visited) and visited[sweep]:
+                sweep += 1
+            if sweep == len(visited):
+                break
+            visited[sweep] = 1
+            path.append([comps[sweep]])
+            visit_device(sweep)
+        
+        return path
+
+def get_connectivity_index(components):
+    """ایندکس اتصالات؛ برای CompactNetlist یک بار ساخته و نگه داشته می‌شود"""
+    if isinstance(components, CompactNetlist):
+        if components._index is None:
+            components._index = ConnectivityIndex(components)
+        return components._index
+    return ConnectivityIndex(components)
 
 def build_node_graph(components):
     """ساخت گراف نودها برای ترتیب صحیح رسم"""
@@ -159,125 +1103,831 @@ def build_node_graph(components):
                 node_connections[comp['all_nodes'][0]].append(comp)
     
     return node_connections
-def validate_components(components):
-    errors = []
-    warnings = []
+# --- مقادیر SPICE با پسوندهای مهندسی ---
 
-    for comp in components:
-        ctype = comp['type']
-        value = comp.get('value', '')
+# ضرایب پسوندهای مهندسی SPICE (بدون حساسیت به حروف؛ M یعنی میلی و MEG یعنی مگا)
+SPICE_SCALE = {
+    't': 1e12, 'g': 1e9, 'meg': 1e6, 'k': 1e3, 'mil': 25.4e-6,
+    'm': 1e-3, 'u': 1e-6, 'µ': 1e-6, 'n': 1e-9, 'p': 1e-12, 'f': 1e-15,
+}
+_SPICE_VALUE_RE = re.compile(
+    r'^([+-]?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?)(meg|mil|[tgkmuµnpf])?[a-zµΩ]*$', re.IGNORECASE
+)
 
-        # --- مقاومت منفی ---
-        if ctype == 'R':
-            try:
-                r = float(value.replace('k','e3').replace('m','e-3'))
-                if r <= 0:
-                    errors.append(
-                        f"❌ مقاومت {comp['name']} مقدار غیرواقعی دارد: {value}"
-                    )
-            except:
-                pass
+@functools.lru_cache(maxsize=4096)
+def parse_spice_value(value):
+    """تبدیل مقدار SPICE (مثل 10k، 1meg، 100uF، 12V) به عدد؛ ValueError اگر نامعتبر باشد"""
+    match = _SPICE_VALUE_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"invalid SPICE value: {value!r}")
+    number, suffix = match.groups()
+    return float(number) * (SPICE_SCALE[suffix.lower()] if suffix else 1.0)
+
+# --- موتور اعتبارسنجی قاعده‌محور (یک گذر خطی + بررسی‌های سطح شبکه) ---
+
+class UnionFind:
+    """union-find ساده روی کلیدهای دلخواه (نام نودها)"""
+    
+    def __init__(self):
+        self._parent = {}
+    
+    def find(self, item):
+        parent = self._parent
+        root = parent.setdefault(item, item)
+        while root != parent[root]:
+            parent[root] = parent[parent[root]]
+            root = parent[root]
+        return root
+    
+    def union(self, a, b):
+        """اتصال دو عضو؛ اگر از قبل در یک مجموعه بودند False برمی‌گرداند"""
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        self._parent[rb] = ra
+        return True
+
+class ValidationContext:
+    """وضعیت مشترک یک گذر اعتبارسنجی که بین همه قواعد به اشتراک گذاشته می‌شود"""
+    
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.pin_count = defaultdict(int)  # نود → تعداد پایه‌های متصل
+        self.first_pin = {}                 # نود → (قطعه، اندیس پایه) اولین اتصال
+        self.component_count = 0
+        self.focus = None                   # اگر تعیین شود، قواعد سطح نود فقط این نودها را گزارش می‌کنند
+
+class ValidationRule:
+    """قاعده اعتبارسنجی: check برای هر قطعه در همان گذر و finish پس از پایان آن"""
+    name = 'rule'
+    # دامنه وابستگی قاعده (برای اعتبارسنجی افزایشی در EditSession):
+    # 'component' فقط خود قطعه، 'node' قطعات متصل به هر نود، 'topology' نودها و نوع
+    # همه قطعات، 'netlist' کل نت‌لیست با مقادیر
+    scope = 'netlist'
+    # نوع قطعاتی که قاعده 'topology' به آنها نگاه می‌کند؛ تغییر بقیه نتیجه را عوض
+    # نمی‌کند و در اجرای دوباره به قاعده داده نمی‌شوند (None یعنی همه)
+    trigger_types = None
+    # قاعده 'topology' می‌تواند recheck(session, affected, state) داشته باشد تا EditSession
+    # فقط اطراف نودهای تحت تأثیر را دوباره بررسی کند؛ خروجی (state، خطاها، هشدارها)
+    recheck = None
+    
+    def check(self, comp, nodes, ctx):
+        pass
+    
+    def finish(self, ctx):
+        pass
 
-        # --- خازن الکترولیتی ---
-        if ctype == 'C':
-            if value.lower().endswith('u') or value.lower().endswith('µ'):
-                warnings.append(
-                    f"⚠️ خازن {comp['name']} احتمالاً الکترولیتی است؛ پلاریته بررسی نشده"
+# قواعد پیش‌فرض (به ترتیب اجرا)؛ قواعد جدید با register_validation_rule اضافه می‌شوند
+VALIDATION_RULES = []
+
+def register_validation_rule(rule_class):
+    VALIDATION_RULES.append(rule_class)
+    return rule_class
+
+@register_validation_rule
+class NegativeResistanceRule(ValidationRule):
+    """مقاومت منفی یا صفر"""
+    name = 'negative_resistance'
+    scope = 'component'
+    
+    def check(self, comp, nodes, ctx):
+        if comp['type'] != 'R':
+            return
+        value = comp.get('value', '')
+        try:
+            r = parse_spice_value(value)
+            if r <= 0:
+                ctx.errors.append(
+                    f"❌ مقاومت {comp['name']} مقدار غیرواقعی دارد: {value}"
                 )
+        except ValueError:
+            pass
+
+@register_validation_rule
+class ElectrolyticCapacitorRule(ValidationRule):
+    """خازن الکترولیتی (مقادیر میکروفاراد)"""
+    name = 'electrolytic_capacitor'
+    scope = 'component'
+    
+    def check(self, comp, nodes, ctx):
+        if comp['type'] != 'C':
+            return
+        value = comp.get('value', '')
+        try:
+            # از حدود ۱ میکروفاراد به بالا معمولاً الکترولیتی است (100u، 4.7uF، 1000µ، ...)
+            electrolytic = parse_spice_value(value) >= 1e-6
+        except ValueError:
+            electrolytic = False
+        if electrolytic:
+            ctx.warnings.append(
+                f"⚠️ خازن {comp['name']} احتمالاً الکترولیتی است؛ پلاریته بررسی نشده"
+            )
 
-        # --- اتصال کوتاه ---
-        if comp.get('node1') == comp.get('node2'):
-            errors.append(
+@register_validation_rule
+class ShortCircuitRule(ValidationRule):
+    """دو سر مسیر اصلی قطعه به یک نود وصل است"""
+    name = 'short_circuit'
+    scope = 'component'
+    
+    def check(self, comp, nodes, ctx):
+        node1 = comp.get('node1')
+        if node1 is not None and node1 == comp.get('node2'):
+            ctx.errors.append(
                 f"❌ {comp['name']} به یک نود متصل شده (اتصال کوتاه)"
             )
 
-    return errors, warnings
+@register_validation_rule
+class FloatingNodeRule(ValidationRule):
+    """نودی که فقط به یک پایه از یک قطعه دوپایه وصل است (سر آزاد)"""
+    name = 'floating_node'
+    scope = 'node'
+    
+    def finish(self, ctx):
+        for node, count in ctx.pin_count.items():
+            if count != 1 or node == '0' or (ctx.focus is not None and node not in ctx.focus):
+                continue
+            comp, _ = ctx.first_pin[node]
+            if comp['type'] not in PIN_ROLES:
+                ctx.warnings.append(
+                    f"⚠️ نود {node} شناور است (فقط به {comp['name']} وصل شده)"
+                )
 
-def find_circuit_path(components, start_node='1'):
-    """پیدا کردن مسیر مدار از شروع تا پایان"""
-    path = []
-    visited = set()
+@register_validation_rule
+class UnconnectedPinRule(ValidationRule):
+    """پایه ترانزیستور یا آپ‌امپ/IC که به هیچ قطعه دیگری وصل نیست"""
+    name = 'unconnected_pin'
+    scope = 'node'
     
-    # ساخت نقشه نود به قطعات
-    node_map = defaultdict(list)
-    for comp in components:
-        if comp['type'] == 'V':
-            continue
-        
-        if comp.get('pins', 2) == 2 and 'node1' in comp:
-            node_map[comp['node1']].append(comp)
-        elif comp['type'] == 'Q':
-            node_map[comp['collector']].append(comp)
-        elif comp['type'] == 'M':
-            node_map[comp['drain']].append(comp)
-        elif comp['type'] in ['U', 'X']:
-            # آپ‌امپ: از ورودی شروع می‌شود
-            if 'in_p' in comp:
-                node_map[comp['in_p']].append(comp)
-            elif 'all_nodes' in comp and len(comp['all_nodes']) > 1:
-                node_map[comp['all_nodes'][1]].append(comp)  # ورودی مثبت
+    def finish(self, ctx):
+        for node, count in ctx.pin_count.items():
+            if count != 1 or node == '0' or (ctx.focus is not None and node not in ctx.focus):
+                continue
+            comp, pin = ctx.first_pin[node]
+            roles = PIN_ROLES.get(comp['type'])
+            if roles is not None:
+                role = roles[pin] if pin < len(roles) else f"pin{pin + 1}"
+                ctx.warnings.append(
+                    f"⚠️ پایه {role} از {comp['name']} (نود {node}) به جایی وصل نیست"
+                )
+
+def _dc_conducting_pins(comp, nodes):
+    """گروه پایه‌هایی از قطعه که در DC به هم مسیر رسانا دارند"""
+    ctype = comp['type']
+    if ctype in ['C', 'I']:
+        return []
+    if ctype == 'M':
+        # گیت عایق است؛ درین، سورس و بادی از طریق کانال/دیود بدنه به هم راه دارند
+        return [nodes[0], nodes[2], nodes[3]] if len(nodes) >= 4 else []
+    if ctype == 'U' and len(nodes) >= 5:
+        # آپ‌امپ: ورودی‌ها امپدانس بالا دارند؛ خروجی از تغذیه تأمین می‌شود
+        return [nodes[0], nodes[3], nodes[4]]
+    return nodes
+
+@register_validation_rule
+class DcPathToGroundRule(ValidationRule):
+    """نودهایی که هیچ مسیر DC به زمین (نود 0) ندارند"""
+    name = 'dc_path_to_ground'
+    scope = 'topology'
     
-    # پیمایش از نود شروع
-    current_node = start_node
+    def __init__(self):
+        self.dc = UnionFind()
     
-    while current_node != '0' and len(path) < 20:
-        if current_node not in node_map or not node_map[current_node]:
-            break
-            
-        # پیدا کردن قطعات متصل به این نود
-        available_comps = [c for c in node_map[current_node] if c['name'] not in visited]
+    def check(self, comp, nodes, ctx):
+        pins = _dc_conducting_pins(comp, nodes)
+        for node in pins[1:]:
+            self.dc.union(pins[0], node)
+    
+    def finish(self, ctx):
+        if '0' not in ctx.pin_count:
+            if ctx.component_count:
+                ctx.warnings.append("⚠️ مدار نود زمین (0) ندارد")
+            return
+        ground = self.dc.find('0')
+        for node in ctx.pin_count:
+            if self.dc.find(node) != ground:
+                ctx.warnings.append(f"⚠️ نود {node} هیچ مسیر DC به زمین ندارد")
+    
+    @staticmethod
+    def recheck(session, affected, floating):
+        """بررسی افزایشی: فقط مؤلفه‌های DC شامل نودهای تحت تأثیر یا نودهای بی‌مسیر قبلی
         
-        if not available_comps:
-            break
+        هر نودی که وضعیتش عوض شده یا با نودی تحت تأثیر هم‌مؤلفه است یا قبلاً بی‌مسیر
+        بوده. جستجو از هر نود با رسیدن به زمین متوقف می‌شود، پس هزینه به اندازه
+        مؤلفه‌های بی‌مسیر و فاصله تا زمین بستگی دارد، نه به کل مدار.
+        """
+        def neighbors(node):
+            for comp in session.net_components(node):
+                pins = _dc_conducting_pins(comp, component_nodes(comp))
+                if node in pins:
+                    yield from pins
         
-        # گروه‌بندی قطعات موازی
-        parallel_group = []
-        next_node = None
+        nodes = session.nodes()
+        grounded, now_floating = {'0'}, set()
+        for start in affected | (floating or set()):
+            if start in grounded or start in now_floating or start not in nodes:
+                continue
+            seen, stack, found = {start}, [start], False
+            while stack and not found:
+                for other in neighbors(stack.pop()):
+                    if other in grounded:
+                        found = True
+                        break
+                    if other not in seen:
+                        seen.add(other)
+                        stack.append(other)
+            (grounded if found else now_floating).update(seen)
         
-        for comp in available_comps:
-            if comp.get('pins', 2) == 2 and 'node1' in comp and 'node2' in comp:
-                n1, n2 = comp['node1'], comp['node2']
-                # تعیین نود بعدی
-                if n1 == current_node:
-                    comp_next = n2
-                else:
-                    comp_next = n1
-                
-                # اگر همه قطعات به یک نود می‌رسند، موازی هستند
-                if next_node is None:
-                    next_node = comp_next
-                
-                if comp_next == next_node:
-                    parallel_group.append(comp)
-                    visited.add(comp['name'])
-            elif comp['type'] == 'Q':
-                parallel_group.append(comp)
-                visited.add(comp['name'])
-                next_node = comp['emitter']
-            elif comp['type'] == 'M':
-                parallel_group.append(comp)
-                visited.add(comp['name'])
-                next_node = comp['source']
-            elif comp['type'] in ['U', 'X']:
-                # آپ‌امپ: از خروجی ادامه می‌یابد
-                parallel_group.append(comp)
-                visited.add(comp['name'])
-                if 'out' in comp:
-                    next_node = comp['out']
-                elif 'all_nodes' in comp and len(comp['all_nodes']) > 0:
-                    next_node = comp['all_nodes'][0]  # خروجی
-        
-        if parallel_group:
-            path.append(parallel_group)
-        
-        current_node = next_node
-        
-        if current_node is None:
-            break
+        if '0' not in nodes:
+            return now_floating, [], ["⚠️ مدار نود زمین (0) ندارد"] if nodes else []
+        return now_floating, [], [f"⚠️ نود {node} هیچ مسیر DC به زمین ندارد"
+                                  for node in sorted(now_floating, key=lambda n: (len(n), n))]
+
+@register_validation_rule
+class SourceInductorLoopRule(ValidationRule):
+    """حلقه‌ای که فقط از منابع ولتاژ و سلف‌ها تشکیل شده (در DC اتصال کوتاه)"""
+    name = 'source_inductor_loop'
+    scope = 'topology'
+    trigger_types = ('V', 'L')
+    
+    def __init__(self):
+        self.loops = UnionFind()
+    
+    def check(self, comp, nodes, ctx):
+        if comp['type'] not in ['V', 'L'] or len(nodes) < 2 or nodes[0] == nodes[1]:
+            return
+        if not self.loops.union(nodes[0], nodes[1]):
+            ctx.errors.append(
+                f"❌ {comp['name']} حلقه‌ای از منابع ولتاژ/سلف‌ها می‌سازد"
+            )
+
+@register_validation_rule
+class SeriesCurrentSourceRule(ValidationRule):
+    """نودی که فقط به منابع جریان وصل است (منابع جریان سری)"""
+    name = 'series_current_sources'
+    scope = 'node'
+    
+    def __init__(self):
+        self.current_pins = defaultdict(list)
+    
+    def check(self, comp, nodes, ctx):
+        if comp['type'] == 'I':
+            for node in nodes:
+                self.current_pins[node].append(comp['name'])
+    
+    def finish(self, ctx):
+        for node, names in self.current_pins.items():
+            if ctx.focus is not None and node not in ctx.focus:
+                continue
+            if node != '0' and len(names) >= 2 and ctx.pin_count[node] == len(names):
+                # ترتیب نام‌ها مستقل از ترتیب خطوط (برای یکسانی با اعتبارسنجی افزایشی)
+                ctx.errors.append(
+                    f"❌ منابع جریان {'، '.join(sorted(names))} در نود {node} سری شده‌اند"
+                )
+
+class ValidationReport:
+    """نتیجه اعتبارسنجی به همراه زمان صرف‌شده هر قاعده"""
+    
+    def __init__(self, errors, warnings, timings, component_count, node_count):
+        self.errors = errors
+        self.warnings = warnings
+        self.timings = timings
+        self.component_count = component_count
+        self.node_count = node_count
+    
+    def format_timings(self):
+        lines = [f"⏱️ اعتبارسنجی {self.component_count} قطعه / {self.node_count} نود:"]
+        for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1]):
+            lines.append(f"   {name:<24} {seconds * 1000:8.2f} ms")
+        return '\n'.join(lines)
+
+def run_validation(components, rules=None, focus=None):
+    """اجرای همه قواعد در یک گذر خطی روی نت‌لیست (لیست، جریان یا CompactNetlist)"""
+    with METRICS.span('validate') as span:
+        if rules is None:
+            rules = [rule_class() for rule_class in VALIDATION_RULES]
+    
+        ctx = ValidationContext()
+        ctx.focus = focus
+        clock = time.perf_counter
+        timings = [0.0] * len(rules)
+        checks = [(i, rule.check) for i, rule in enumerate(rules)
+                  if type(rule).check is not ValidationRule.check]
+        pin_count, first_pin = ctx.pin_count, ctx.first_pin
+    
+        for comp in components:
+            ctx.component_count += 1
+            nodes = component_nodes(comp)
+            for pin, node in enumerate(nodes):
+                if node not in first_pin:
+                    first_pin[node] = (comp, pin)
+                pin_count[node] += 1
+        
+            for i, check in checks:
+                start = clock()
+                check(comp, nodes, ctx)
+                timings[i] += clock() - start
+    
+        for i, rule in enumerate(rules):
+            start = clock()
+            rule.finish(ctx)
+            timings[i] += clock() - start
+    
+        span.set(components=ctx.component_count, nodes=len(pin_count),
+                 errors=len(ctx.errors), warnings=len(ctx.warnings))
+        return ValidationReport(ctx.errors, ctx.warnings,
+                                {rule.name: timings[i] for i, rule in enumerate(rules)},
+                                ctx.component_count, len(pin_count))
+
+def validate_components(components):
+    report = run_validation(components)
+    return report.errors, report.warnings
+
+def find_circuit_path(components, start_node='1', index=None):
+    """پیدا کردن مسیر مدار از شروع تا پایان (پیمایش کامل روی ایندکس اتصالات)"""
+    with METRICS.span('circuit_path'):
+        if index is None:
+            index = get_connectivity_index(components)
+        return index.circuit_path(start_node)
+
+# --- شکل متعارف نت‌لیست (مستقل از ترتیب خطوط و شماره‌گذاری نودها) ---
+
+# قطعاتی که جابه‌جایی دو پایه‌شان مدار را عوض نمی‌کند
+SYMMETRIC_TYPES = ('R', 'C', 'L')
+CANONICAL_VALUE_TYPES = ('R', 'C', 'L', 'V', 'I')
+
+def _canonical_value(comp):
+    """مقدار نرمال‌شده (1k و 1000 و 1K یکسان‌اند؛ نام مدل‌ها با حروف بزرگ)"""
+    value = str(comp.get('value', ''))
+    if comp['type'] in CANONICAL_VALUE_TYPES:
+        try:
+            return f"{parse_spice_value(value):.12g}"
+        except ValueError:
+            pass
+    return value.upper()
+
+def _refine_partition(order, pos, start, cell_end, adjacency, queue, queued):
+    """پالایش افراز مرتب تا رسیدن به افراز همسان (equitable) با صف سلول‌های شکننده
+    
+    هر سلول بر اساس تعداد همسایه‌ها (به تفکیک برچسب پایه) در سلول شکننده تقسیم
+    می‌شود؛ ترتیب قطعه‌ها فقط به امضاها بستگی دارد، پس نتیجه متعارف است. با صف
+    کردن همه قطعه‌ها به جز بزرگ‌ترین، هر رأس O(log n) بار در شکننده‌ها ظاهر می‌شود.
+    """
+    while queue:
+        w = queue.popleft()
+        queued.discard(w)
+        touched = {}
+        for v in order[w:cell_end[w]]:
+            for u, label in adjacency[v]:
+                counts = touched.get(u)
+                if counts is None:
+                    counts = touched[u] = {}
+                counts[label] = counts.get(label, 0) + 1
+        
+        by_cell = defaultdict(list)
+        for u in touched:
+            by_cell[start[u]].append(u)
+        
+        for s in sorted(by_cell):
+            members = by_cell[s]
+            e = cell_end[s]
+            if e - s == 1:
+                continue
+            signature = {u: tuple(sorted(touched[u].items())) for u in members}
+            if len(members) == e - s and len(set(signature.values())) == 1:
+                continue
+            
+            # رئوس لمس‌شده به انتهای سلول و مرتب بر اساس امضا
+            k = e
+            for u in members:
+                k -= 1
+                p, other = pos[u], order[k]
+                order[p], order[k] = other, u
+                pos[other], pos[u] = p, k
+            members.sort(key=signature.__getitem__)
+            order[k:e] = members
+            for i, u in enumerate(members, k):
+                pos[u] = i
+            
+            fragments = [(s, k)] if k > s else []
+            i = k
+            while i < e:
+                j = i + 1
+                while j < e and signature[order[j]] == signature[order[i]]:
+                    j += 1
+                fragments.append((i, j))
+                i = j
+            if len(fragments) == 1:
+                continue
+            
+            for a, b in fragments:
+                cell_end[a] = b
+                if a != s:
+                    for v in order[a:b]:
+                        start[v] = a
+            if s in queued:
+                skip = s
+            else:
+                skip = max(fragments, key=lambda f: (f[1] - f[0], -f[0]))[0]
+            for a, _ in fragments:
+                if a != skip and a not in queued:
+                    queue.append(a)
+                    queued.add(a)
+
+def canonical_form(netlist, names=False):
+    """نت‌لیست متعارف: دو نت‌لیست هم‌ریخت (با هر ترتیب خط و هر نام‌گذاری نود) یکسان می‌شوند
+    
+    نودها با پالایش افراز روی گراف دوبخشی قطعه-نود و شکستن تقارن‌های باقی‌مانده
+    شماره‌گذاری می‌شوند؛ زمین همیشه 0 است. نام قطعات فقط با names=True در نظر
+    گرفته می‌شود (در غیر این صورت نام‌ها به ترتیب متعارف از نو ساخته می‌شوند).
+    """
+    if isinstance(netlist, str):
+        netlist = iter_components(netlist)
+    components = list(netlist)
+    
+    net_ids = {}
+    net_names = []
+    comp_pins = []
+    for comp in components:
+        pins = []
+        for node in component_nodes(comp):
+            node = '0' if is_ground(node) else node
+            net = net_ids.get(node)
+            if net is None:
+                net = net_ids[node] = len(net_names)
+                net_names.append(node)
+            pins.append(net)
+        comp_pins.append(pins)
+    
+    net_count = len(net_names)
+    adjacency = [[] for _ in range(net_count + len(components))]
+    keys = [(0, 0 if name == '0' else 1, '', '', 0) for name in net_names]
+    values = [_canonical_value(comp) for comp in components]
+    for i, (comp, pins) in enumerate(zip(components, comp_pins)):
+        v = net_count + i
+        symmetric = comp['type'] in SYMMETRIC_TYPES
+        for k, net in enumerate(pins):
+            label = 0 if symmetric else k + 1
+            adjacency[v].append((net, label))
+            adjacency[net].append((v, label))
+        keys.append((1, comp['type'], values[i], comp['name'] if names else '', len(pins)))
+    
+    # افراز اولیه مرتب بر اساس برچسب رئوس
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    pos = [0] * len(order)
+    start = [0] * len(order)
+    cell_end = {}
+    queue = deque()
+    s = 0
+    for i, v in enumerate(order):
+        pos[v] = i
+        if i > 0 and keys[v] != keys[order[i - 1]]:
+            cell_end[s] = i
+            queue.append(s)
+            s = i
+        start[v] = s
+    if order:
+        cell_end[s] = len(order)
+        queue.append(s)
+    queued = set(queue)
+    
+    with METRICS.span('canonical', components=len(components)):
+        _refine_partition(order, pos, start, cell_end, adjacency, queue, queued)
+        # نودهای هم‌ارز باقی‌مانده (تقارن) یکی‌یکی جدا و دوباره پالایش می‌شوند
+        s = 0
+        while s < len(order):
+            e = cell_end[s]
+            if e - s > 1 and order[s] < net_count:
+                v = order[e - 1]
+                cell_end[s] = e - 1
+                cell_end[e - 1] = e
+                start[v] = e - 1
+                queue.append(e - 1)
+                queued.add(e - 1)
+                _refine_partition(order, pos, start, cell_end, adjacency, queue, queued)
+                continue
+            s = e
+    
+    number = {}
+    for v in order:
+        if v < net_count and net_names[v] != '0':
+            number[v] = str(len(number) + 1)
+    
+    lines = []
+    for i, (comp, pins) in enumerate(zip(components, comp_pins)):
+        nodes = ['0' if net_names[n] == '0' else number[n] for n in pins]
+        if comp['type'] in SYMMETRIC_TYPES:
+            nodes.sort(key=lambda n: (len(n), n))
+        name = comp['name'] if names else ''
+        lines.append((comp['type'], name, nodes, values[i]))
+    lines.sort(key=lambda line: (line[0], line[1], [(len(n), n) for n in line[2]], line[3]))
+    
+    counters = Counter()
+    text = []
+    for comp_type, name, nodes, value in lines:
+        if not names:
+            counters[comp_type] += 1
+            name = f"{comp_type}{counters[comp_type]}"
+        text.append(' '.join([name] + nodes + [value]))
+    return '\n'.join(text)
+
+def canonical_hash(netlist, names=False):
+    """هش SHA-256 شکل متعارف؛ برای تشخیص مدارهای تکراری و کلید کش"""
+    return hashlib.sha256(canonical_form(netlist, names).encode('utf-8')).hexdigest()
+
+# --- چیدمان خودکار لایه‌ای شماتیک (مختصات مستقل از رسم) ---
+
+# ابعاد شبکه چیدمان (واحد schemdraw)
+LAYOUT_ELEMENT_LENGTH = 3.0   # طول قطعات دوپایه
+LAYOUT_GAP_WIDTH = 4.0        # فاصله دو ستون نود متوالی
+LAYOUT_ROW_PITCH = 2.5        # فاصله ردیف‌های قطعات سری (جای برچسب)
+LAYOUT_SHUNT_PITCH = 2.0      # فاصله افقی قطعات موازی با زمین
+LAYOUT_PIN_PITCH = 1.0        # فاصله پایه‌های قطعات چندپایه
+LAYOUT_ORDER_SWEEPS = 2       # تعداد گذرهای مرتب‌سازی باری‌سنتر
+
+class Placement:
+    """جایگاه یک قطعه: نوع چیدمان، نقطه شروع/پایان یا قاب و مختصات پایه‌ها"""
+    
+    def __init__(self, comp, kind):
+        self.name = comp['name']
+        self.type = comp['type']
+        self.value = comp['value']
+        self.kind = kind     # 'series' (افقی بین دو نود)، 'shunt' (عمودی تا زمین) یا 'box'
+        self.start = None    # محل پایه اول (قطعات دوپایه)
+        self.end = None      # محل پایه دوم
+        self.box = None      # (x0, y0, x1, y1) برای قطعات چندپایه
+        self.pins = []       # [(نام نود، نقش پایه، (x, y)), ...] به ترتیب نت‌لیست
+    
+    def to_dict(self):
+        return {
+            'name': self.name, 'type': self.type, 'value': self.value, 'kind': self.kind,
+            'start': self.start, 'end': self.end, 'box': self.box,
+            'pins': [{'node': node, 'role': role, 'at': at} for node, role, at in self.pins],
+        }
+
+class SchematicLayout:
+    """خروجی موتور چیدمان: جایگاه قطعات، سیم‌های افقی/عمودی و نقاط اتصال"""
+    
+    def __init__(self):
+        self.placements = []
+        self.wires = []        # [((x1, y1), (x2, y2)), ...] همگی افقی یا عمودی
+        self.junctions = []    # نقاطی که سه سیم یا بیشتر به هم می‌رسند
+        self.columns = {}      # نام نود → x باس عمودی آن
+        self.ground = None     # محل نماد زمین (ابتدای ریل زمین)
+    
+    def bounds(self):
+        """(xmin, ymin, xmax, ymax) همه سیم‌ها و قطعات"""
+        points = [p for wire in self.wires for p in wire]
+        for p in self.placements:
+            points.extend(at for _, _, at in p.pins)
+            if p.box:
+                points.extend([p.box[:2], p.box[2:]])
+        if not points:
+            return (0.0, 0.0, 0.0, 0.0)
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        return (min(xs), min(ys), max(xs), max(ys))
+    
+    def to_dict(self):
+        return {
+            'placements': [p.to_dict() for p in self.placements],
+            'wires': self.wires,
+            'junctions': self.junctions,
+            'columns': self.columns,
+            'ground': self.ground,
+            'bounds': self.bounds(),
+        }
+
+def _net_levels(components, nodes_of):
+    """سطح‌بندی نودها با BFS از سر مثبت منبع ولتاژ (زمین گسترش داده نمی‌شود)
+    
+    بخش‌های جدا از هم پشت سر هم با سطوح بعدی قرار می‌گیرند.
+    """
+    net_comps = defaultdict(list)
+    for i, nodes in enumerate(nodes_of):
+        for name in nodes:
+            if not is_ground(name):
+                net_comps[name].append(i)
+    
+    source = next((i for i, c in enumerate(components) if c['type'] == 'V'), None)
+    seeds = [n for n in (nodes_of[source] if source is not None else []) if not is_ground(n)]
+    seeds.extend(net_comps)
     
-    return path
+    levels = {}
+    next_level = 0
+    for seed in seeds:
+        if seed in levels:
+            continue
+        levels[seed] = next_level
+        queue = deque([seed])
+        deepest = next_level
+        while queue:
+            net = queue.popleft()
+            deepest = max(deepest, levels[net])
+            for i in net_comps[net]:
+                for other in nodes_of[i]:
+                    if other not in levels and not is_ground(other):
+                        levels[other] = levels[net] + 1
+                        queue.append(other)
+        next_level = deepest + 1
+    return levels, net_comps
+
+def _order_columns(levels, net_comps, nodes_of):
+    """ترتیب ستون نودها: سطح به سطح و داخل هر سطح با باری‌سنتر همسایه‌های سطح قبل"""
+    by_level = defaultdict(list)
+    for net, level in levels.items():
+        by_level[level].append(net)
+    
+    position = {}
+    for level in sorted(by_level):
+        nets = by_level[level]
+        # موقعیت‌های این سطح بعد از همه سطوح قبلی؛ در گذرهای بعدی ثابت می‌ماند
+        base = len(position)
+        
+        def barycenter(net):
+            # فقط همسایه‌های سطوح قبل (نه نودهای همین سطح یا خود نود)
+            neighbours = [position[other] for i in net_comps[net] for other in nodes_of[i]
+                          if other in position and levels[other] < level]
+            return sum(neighbours) / len(neighbours) if neighbours else float('inf')
+        
+        for _ in range(LAYOUT_ORDER_SWEEPS):
+            keys = {net: barycenter(net) for net in nets}
+            nets.sort(key=keys.__getitem__)
+            for offset, net in enumerate(nets, start=base):
+                position[net] = offset
+    
+    return sorted(position, key=position.__getitem__)
+
+def compute_layout(components):
+    """چیدمان لایه‌ای (سبک Sugiyama) با سیم‌کشی متعامد، در زمان تقریباً خطی
+    
+    هر نود یک باس عمودی در ستون خودش است؛ قطعات بین دو نود به صورت افقی در
+    فاصله ستون‌ها، قطعات متصل به زمین به صورت عمودی تا ریل زمین و قطعات
+    چندپایه به صورت قاب رسم می‌شوند.
+    """
+    components = [c.to_dict() if isinstance(c, ComponentView) else c for c in components]
+    layout = SchematicLayout()
+    nodes_of = [component_nodes(c) for c in components]
+    levels, net_comps = _net_levels(components, nodes_of)
+    columns = _order_columns(levels, net_comps, nodes_of)
+    column_of = {net: i for i, net in enumerate(columns)}
+    
+    # دسته‌بندی قطعات در فاصله ستون‌ها (فاصله i = بعد از ستون i)
+    series = defaultdict(list)
+    shunts = defaultdict(list)
+    for i, (comp, nodes) in enumerate(zip(components, nodes_of)):
+        cols = [column_of[n] for n in nodes if n in column_of]
+        gap = min(cols) if cols else 0
+        if comp['type'] not in PIN_ROLES and comp['type'] not in ['U', 'X'] and len(cols) < 2:
+            shunts[gap].append(i)
+        else:
+            series[gap].append(i)
+    
+    # ردیف‌ها: مرتب‌سازی بر اساس ستون مقصد و رزرو ردیف برای یال‌های بلند (گره‌های مجازی)
+    # ردیف‌های آزاد در یک heap؛ ردیف یال بلند تا فاصله بعد از ستون مقصدش آزاد نمی‌شود
+    free_rows = []
+    release = defaultdict(list)   # فاصله → ردیف‌هایی که از آن فاصله دوباره آزادند
+    row_count = 0
+    rows = {}
+    spans = {}
+    for gap in range(len(columns)):
+        for row in release.pop(gap, ()):
+            heapq.heappush(free_rows, row)
+        
+        def far_column(i):
+            return max((column_of[n] for n in nodes_of[i] if n in column_of), default=gap)
+        
+        items = sorted(series[gap], key=lambda i: (any(is_ground(n) for n in nodes_of[i]),
+                                                   far_column(i)))
+        for i in items:
+            if components[i]['type'] in PIN_ROLES or components[i]['type'] in ['U', 'X']:
+                left = sum(1 for n in nodes_of[i] if column_of.get(n) == gap)
+                right = sum(1 for n in nodes_of[i] if column_of.get(n, -1) > gap)
+                height = max(1, math.ceil(max(left, right, 1) * LAYOUT_PIN_PITCH
+                                          / LAYOUT_ROW_PITCH))
+            else:
+                height = 1
+            if height == 1 and free_rows:
+                row = heapq.heappop(free_rows)
+            else:
+                # قاب‌های چندردیفی ردیف‌های پیوسته تازه می‌گیرند
+                row = row_count
+                row_count += height
+            rows[i] = row
+            spans[i] = height
+            release[max(far_column(i), gap + 1)].extend(range(row, row + height))
+    
+    shunt_top = -row_count * LAYOUT_ROW_PITCH
+    ground_y = shunt_top - LAYOUT_ELEMENT_LENGTH - 0.5
+    
+    # موقعیت x ستون‌ها با عرض متغیر هر فاصله
+    x = 0.0
+    for gap, net in enumerate(columns):
+        layout.columns[net] = x
+        width = LAYOUT_GAP_WIDTH if series[gap] else 1.0
+        width = max(width, 1.0 + LAYOUT_SHUNT_PITCH * len(shunts[gap]))
+        x += width
+    
+    attachments = defaultdict(set)   # نود → y نقاط اتصال روی باس
+    ground_xs = set()
+    
+    def pin_role(comp, index, pin_count):
+        names = comp.get('pin_names')
+        if names and index < len(names):
+            return names[index]
+        roles = PIN_ROLES.get(comp['type'])
+        if roles and index < len(roles) and (comp['type'] not in ['U', 'X'] or pin_count >= 3):
+            return roles[index]
+        return str(index + 1)
+    
+    for gap, net in enumerate(columns):
+        col_x = layout.columns[net]
+        
+        previous = (col_x, shunt_top)
+        for k, i in enumerate(shunts[gap]):
+            comp = components[i]
+            placement = Placement(comp, 'shunt')
+            px = col_x + 1.0 + LAYOUT_SHUNT_PITCH * k
+            top, bottom = (px, shunt_top), (px, ground_y)
+            nodes = nodes_of[i]
+            ends = [bottom if is_ground(n) or n not in column_of else top for n in nodes]
+            if ends[0] == ends[1]:
+                ends = [top, bottom]
+            placement.start, placement.end = ends
+            placement.pins = [(n, str(k2 + 1), at) for k2, (n, at) in enumerate(zip(nodes, ends))]
+            if any(n in column_of for n in nodes):
+                # قطعات موازی با زمین پشت سر هم به باس نود وصل می‌شوند
+                layout.wires.append((previous, top))
+                attachments[net].add(shunt_top)
+                previous = top
+            ground_xs.add(px)
+            layout.placements.append(placement)
+        
+        for i in series[gap]:
+            comp = components[i]
+            nodes = nodes_of[i]
+            y = -rows[i] * LAYOUT_ROW_PITCH
+            if comp['type'] in PIN_ROLES or comp['type'] in ['U', 'X']:
+                placement = Placement(comp, 'box')
+                x0, x1 = col_x + 1.0, col_x + LAYOUT_GAP_WIDTH - 1.0
+                y0 = y + 0.5
+                y1 = y0 - max(spans[i] * LAYOUT_ROW_PITCH - 1.0, 1.0)
+                placement.box = (x0, y0, x1, y1)
+                left_y = y
+                right_y = y
+                ground_x = x0 + 0.5
+                for k, n in enumerate(nodes):
+                    if n in column_of and column_of[n] == gap:
+                        at = (x0, left_y)
+                        layout.wires.append(((col_x, left_y), at))
+                        attachments[n].add(left_y)
+                        left_y -= LAYOUT_PIN_PITCH
+                    elif n in column_of:
+                        at = (x1, right_y)
+                        layout.wires.append((at, (layout.columns[n], right_y)))
+                        attachments[n].add(right_y)
+                        right_y -= LAYOUT_PIN_PITCH
+                    else:
+                        at = (ground_x, y1)
+                        layout.wires.append((at, (ground_x, ground_y)))
+                        ground_xs.add(ground_x)
+                        ground_x = min(ground_x + 0.5, x1)
+                    placement.pins.append((n, pin_role(comp, k, len(nodes)), at))
+            else:
+                placement = Placement(comp, 'series')
+                a, b = nodes
+                left, right = (col_x + 0.5, y), (col_x + 0.5 + LAYOUT_ELEMENT_LENGTH, y)
+                far = b if column_of[a] == gap else a
+                layout.wires.append(((col_x, y), left))
+                layout.wires.append((right, (layout.columns[far], y)))
+                attachments[net].add(y)
+                attachments[far].add(y)
+                placement.start, placement.end = (left, right) if far == b else (right, left)
+                placement.pins = [(a, '1', placement.start), (b, '2', placement.end)]
+            layout.placements.append(placement)
+    
+    # باس‌های عمودی نودها و ریل زمین، شکسته در هر نقطه اتصال
+    for net, ys in attachments.items():
+        ys = sorted(ys, reverse=True)
+        col_x = layout.columns[net]
+        layout.wires.extend(((col_x, y1), (col_x, y2)) for y1, y2 in zip(ys, ys[1:]))
+    if ground_xs:
+        xs = sorted(ground_xs)
+        layout.wires.extend(((x1, ground_y), (x2, ground_y)) for x1, x2 in zip(xs, xs[1:]))
+        layout.ground = (xs[0], ground_y)
+    
+    # نقاط اتصال: جایی که سه سر سیم یا پایه به هم می‌رسند
+    degree = defaultdict(int)
+    for p1, p2 in layout.wires:
+        degree[p1] += 1
+        degree[p2] += 1
+    for placement in layout.placements:
+        for _, _, at in placement.pins:
+            degree[at] += 1
+    layout.junctions = sorted(p for p, count in degree.items() if count >= 3)
+    return layout
 
-def draw_schematic(netlist_text):
+def draw_schematic(netlist_text, cache=None):
     """تحلیل، اعتبارسنجی و رسم شماتیک مدار"""
 
     # 1️⃣ پارس نت‌لیست
@@ -286,6 +1936,16 @@ def draw_schematic(netlist_text):
         print("❌ هیچ قطعه‌ای برای رسم یافت نشد.")
         return
 
+    # کش رندر: همان نت‌لیست با همان برچسب‌ها دوباره رسم نمی‌شود
+    if cache is None:
+        cache = get_render_cache()
+    cache_key = RenderCache.make_key(components, fmt='png', backend='matplotlib')
+    cached = cache.get(cache_key, 'png')
+    if cached is not None:
+        print("⚡ شماتیک از کش بارگذاری شد.")
+        show_image(cached)
+        return
+
     # 2️⃣ اعتبارسنجی
     errors, warnings = validate_components(components)
 
@@ -301,357 +1961,4217 @@ def draw_schematic(netlist_text):
         for w in warnings:
             print(w)
 
-    # 3️⃣ رسم شماتیک
-    d = schemdraw.Drawing(unit=2.5)
-
-    # پیدا کردن منبع ولتاژ
-    voltage_source = next((c for c in components if c['type'] == 'V'), None)
-    if not voltage_source:
+    # 3️⃣ رسم شماتیک (یک بار رندر؛ همان بایت‌ها کش و نمایش داده می‌شوند)
+    data = render_schematic(components, 'png', backend='matplotlib')
+    if data is None:
         print("⚠️ منبع ولتاژ یافت نشد.")
         return
 
-    other_comps = [c for c in components if c['type'] != 'V']
+    cache.put(cache_key, data, 'png')
+    show_image(data)
+    print("✅ شماتیک مدار رسم شد!")
+
+
+def build_schematic(components, canvas=None, layout=None, require_source=True, ports=()):
+    """ساخت شیء Drawing از قطعات بدون باز کردن پنجره (None اگر منبع ولتاژ نباشد)
+    
+    برای برگه‌های زیرمدار require_source=False و ports نام پایه‌هایی است که بالای
+    باس نودشان برچسب می‌خورند.
+    """
+    import schemdraw
+    import schemdraw.elements as elm
+
+    if require_source and not any(c['type'] == 'V' for c in components):
+        return None
 
-    # پیدا کردن مسیر مدار
-    circuit_path = find_circuit_path(other_comps, start_node=voltage_source['node1'])
+    # مختصات از موتور چیدمان؛ اینجا فقط رسم انجام می‌شود
+    if layout is None:
+        with METRICS.span('layout', components=len(components)):
+            layout = compute_layout(components)
 
-    # رسم منبع ولتاژ
-    v_source = d.add(
-        elm.SourceV().up().label(f"{voltage_source['name']}\\n{voltage_source['value']}")
-    )
-    v_bottom = v_source.start
+    with METRICS.span('draw', elements=len(layout.placements)):
+        d = schemdraw.Drawing(unit=2.5, canvas=canvas, show=False)
 
-    d.add(elm.Line().right().length(1))
+        for start, end in layout.wires:
+            d.add(elm.Line().at(start).to(end))
 
-    MAX_PER_ROW = 3
-    row_count = 0
+        for placement in layout.placements:
+            label = f"{placement.name}\n{placement.value}"
+            if placement.kind == 'box':
+                draw_component_box(d, placement, label)
+                continue
+            element = component_element(placement)
+            # منبع ولتاژ از سر منفی به مثبت رسم می‌شود تا علامت + روی پایه اول باشد
+            start, end = ((placement.end, placement.start) if placement.type == 'V'
+                          else (placement.start, placement.end))
+            d.add(element.at(start).to(end).label(label))
+
+        for point in layout.junctions:
+            d.add(elm.Dot().at(point))
+        if layout.ground:
+            d.add(elm.Ground().at(layout.ground))
+        
+        for port in ports:
+            if port in layout.columns:
+                x = layout.columns[port]
+                top = max((y for wire in layout.wires for wx, y in wire if wx == x), default=0.0)
+                d.add(elm.Line().at((x, top)).to((x, 1.0)))
+                d.add(elm.Dot(open=True).at((x, 1.0)).label(port, loc='top'))
+
+    return d
+
+
+def component_element(placement):
+    """انتخاب نماد schemdraw برای یک قطعه دوپایه"""
+    import schemdraw.elements as elm
+    
+    comp_type = placement.type
+    if comp_type == 'R':
+        return elm.Resistor()
+    if comp_type == 'C':
+        return elm.Capacitor()
+    if comp_type == 'L':
+        return elm.Inductor2()
+    if comp_type == 'D':
+        if 'zener' in placement.value.lower():
+            return elm.Zener()
+        return elm.Diode()
+    if comp_type == 'V':
+        return elm.SourceV()
+    if comp_type == 'I':
+        return elm.SourceI()
+    return elm.Resistor()
+
+def draw_component_box(d, placement, label):
+    """رسم قطعه چندپایه (ترانزیستور، آپ‌امپ، IC) به صورت قاب با نام پایه‌ها"""
+    import schemdraw.elements as elm
+    
+    x0, y0, x1, y1 = placement.box
+    d.add(elm.Line().at((x0, y0)).to((x1, y0)))
+    d.add(elm.Line().at((x1, y0)).to((x1, y1)))
+    d.add(elm.Line().at((x1, y1)).to((x0, y1)))
+    d.add(elm.Line().at((x0, y1)).to((x0, y0)))
+    d.add(elm.Label().at(((x0 + x1) / 2, y0)).label(label, loc='top'))
+    
+    for _, role, (x, y) in placement.pins:
+        if x == x0:
+            d.add(elm.Label().at((x + 0.1, y)).label(role[:3], halign='left', fontsize=8))
+        elif x == x1:
+            d.add(elm.Label().at((x - 0.1, y)).label(role[:3], halign='right', fontsize=8))
+        else:
+            d.add(elm.Label().at((x, y + 0.1)).label(role[:3], valign='bottom', fontsize=8))
+
+# --- نویسنده SVG داخلی (مستقیم از مختصات چیدمان، بدون schemdraw و matplotlib) ---
+
+RENDER_BACKENDS = ('matplotlib', 'schemdraw-svg', 'svg')
+# فرمت‌های خروجی هر موتور رندر
+RENDER_BACKEND_FORMATS = {'matplotlib': ('svg', 'png'), 'schemdraw-svg': ('svg',), 'svg': ('svg',)}
+DEFAULT_RENDER_BACKEND = os.environ.get('PRG_RENDER_BACKEND', 'matplotlib')
+SVG_SCALE = 24.0       # پیکسل به ازای هر واحد چیدمان
+SVG_MARGIN = 2.0       # حاشیه اطراف شماتیک (واحد چیدمان)
+SVG_BODY = 1.2         # طول بدنه نماد قطعات دوپایه (واحد چیدمان)
+SVG_FONT_SIZE = 11
+
+def _svg_point(p):
+    return f"{p[0] * SVG_SCALE + 0.0:.1f} {-p[1] * SVG_SCALE + 0.0:.1f}"
+
+def _svg_two_terminal(placement, strokes, shapes, texts):
+    """نماد یک قطعه دوپایه در امتداد start → end (سیم‌ها در strokes، دایره‌ها در shapes)"""
+    (x1, y1), (x2, y2) = placement.start, placement.end
+    length = math.hypot(x2 - x1, y2 - y1) or 1.0
+    ux, uy = (x2 - x1) / length, (y2 - y1) / length
+    
+    def at(t, offset=0.0):
+        return _svg_point((x1 + ux * t - uy * offset, y1 + uy * t + ux * offset))
+    
+    mid = length / 2
+    a, b = mid - SVG_BODY / 2, mid + SVG_BODY / 2
+    comp_type = placement.type
+    if comp_type == 'C':
+        a, b = mid - 0.15, mid + 0.15
+        strokes.append(f"M{at(a, -0.5)}L{at(a, 0.5)}M{at(b, -0.5)}L{at(b, 0.5)}")
+    elif comp_type == 'L':
+        radius = SVG_BODY / 8 * SVG_SCALE
+        strokes.append(f"M{at(a)}" + ''.join(f"A{radius:.1f} {radius:.1f} 0 0 1 {at(a + SVG_BODY * k / 4)}"
+                                             for k in range(1, 5)))
+    elif comp_type == 'D':
+        strokes.append(f"M{at(a, -0.4)}L{at(a, 0.4)}L{at(b)}ZM{at(b, -0.4)}L{at(b, 0.4)}")
+        if 'zener' in placement.value.lower():
+            strokes.append(f"M{at(b, 0.4)}L{at(b + 0.15, 0.55)}M{at(b, -0.4)}L{at(b - 0.15, -0.55)}")
+    elif comp_type in ('V', 'I'):
+        a, b = mid - 0.6, mid + 0.6
+        cx, cy = at(mid).split()
+        shapes.append(f'<circle cx="{cx}" cy="{cy}" r="{0.6 * SVG_SCALE:.1f}"/>')
+        if comp_type == 'V':
+            # سر مثبت روی پایه اول
+            strokes.append(f"M{at(mid - 0.4, -0.12)}L{at(mid - 0.4, 0.12)}"
+                           f"M{at(mid - 0.52)}L{at(mid - 0.28)}M{at(mid + 0.28)}L{at(mid + 0.52)}")
+        else:
+            strokes.append(f"M{at(mid - 0.35)}L{at(mid + 0.35)}"
+                           f"M{at(mid + 0.15, -0.15)}L{at(mid + 0.35)}L{at(mid + 0.15, 0.15)}")
+    else:
+        # مقاومت و هر نوع ناشناخته: زیگزاگ
+        zigzag = ''.join(f"L{at(a + SVG_BODY * k / 6, 0.25 if k % 2 else -0.25)}" for k in range(1, 6))
+        strokes.append(f"M{at(a)}{zigzag}L{at(b)}")
+    strokes.append(f"M{at(0)}L{at(a)}M{at(b)}L{at(length)}")
+    
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    label = f"{placement.name} {placement.value}"
+    if abs(ux) >= abs(uy):
+        texts.append(((cx, cy + 0.75), label, 'middle', SVG_FONT_SIZE))
+    else:
+        texts.append(((cx + 0.85, cy), label, 'start', SVG_FONT_SIZE))
+
+def layout_to_svg(layout, ports=()):
+    """نوشتن SVG مینیمال مستقیم از خروجی compute_layout
+    
+    همه سیم‌ها و نمادها در یک path نوشته می‌شوند؛ هزینه خطی در تعداد قطعات است و
+    هیچ کتابخانه گرافیکی بارگذاری نمی‌شود.
+    """
+    from xml.sax.saxutils import escape
+    
+    strokes = [f"M{_svg_point(p1)}L{_svg_point(p2)}" for p1, p2 in layout.wires]
+    shapes = []
+    texts = []
+    small = SVG_FONT_SIZE - 3
+    
+    for placement in layout.placements:
+        if placement.kind != 'box':
+            _svg_two_terminal(placement, strokes, shapes, texts)
+            continue
+        x0, y0, x1, y1 = placement.box
+        strokes.append(f"M{_svg_point((x0, y0))}L{_svg_point((x1, y0))}"
+                       f"L{_svg_point((x1, y1))}L{_svg_point((x0, y1))}Z")
+        texts.append((((x0 + x1) / 2, y0 + 0.35), f"{placement.name} {placement.value}",
+                      'middle', SVG_FONT_SIZE))
+        for _, role, (x, y) in placement.pins:
+            if x == x0:
+                texts.append(((x + 0.1, y), role[:3], 'start', small))
+            elif x == x1:
+                texts.append(((x - 0.1, y), role[:3], 'end', small))
+            else:
+                texts.append(((x, y + 0.25), role[:3], 'middle', small))
+    
+    dots = [f'<circle cx="{cx}" cy="{cy}" r="3"/>'
+            for cx, cy in (_svg_point(p).split() for p in layout.junctions)]
+    if layout.ground:
+        gx, gy = layout.ground
+        strokes.append(f"M{_svg_point((gx, gy))}L{_svg_point((gx, gy - 0.3))}")
+        for k, half in enumerate((0.4, 0.26, 0.12)):
+            y = gy - 0.3 - 0.15 * k
+            strokes.append(f"M{_svg_point((gx - half, y))}L{_svg_point((gx + half, y))}")
+    
+    xmin, ymin, xmax, ymax = layout.bounds()
+    for port in ports:
+        if port in layout.columns:
+            x = layout.columns[port]
+            top = max((y for wire in layout.wires for wx, y in wire if wx == x), default=0.0)
+            strokes.append(f"M{_svg_point((x, top))}L{_svg_point((x, 1.0))}")
+            cx, cy = _svg_point((x, 1.0)).split()
+            shapes.append(f'<circle cx="{cx}" cy="{cy}" r="4" fill="white"/>')
+            texts.append(((x, 1.5), port, 'middle', SVG_FONT_SIZE))
+            ymax = max(ymax, 1.5)
+    
+    width = (xmax - xmin + 2 * SVG_MARGIN) * SVG_SCALE
+    height = (ymax - ymin + 2 * SVG_MARGIN) * SVG_SCALE
+    left, top = (xmin - SVG_MARGIN) * SVG_SCALE, -(ymax + SVG_MARGIN) * SVG_SCALE
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+        f'viewBox="{left:.1f} {top:.1f} {width:.1f} {height:.1f}">\n',
+        '<g fill="none" stroke="black" stroke-width="2" stroke-linecap="round" '
+        'stroke-linejoin="round">\n',
+        f'<path d="{"".join(strokes)}"/>\n',
+    ]
+    parts.extend(f"{shape}\n" for shape in shapes)
+    parts.append('</g>\n<g fill="black">\n')
+    parts.extend(f"{dot}\n" for dot in dots)
+    parts.append(f'</g>\n<g font-family="sans-serif" font-size="{SVG_FONT_SIZE}" '
+                 'dominant-baseline="middle" fill="black">\n')
+    for (x, y), text, anchor, size in texts:
+        size_attr = f' font-size="{size}"' if size != SVG_FONT_SIZE else ''
+        parts.append(f'<text x="{x * SVG_SCALE + 0.0:.1f}" y="{-y * SVG_SCALE + 0.0:.1f}" '
+                     f'text-anchor="{anchor}"{size_attr}>{escape(text)}</text>\n')
+    parts.append('</g>\n</svg>\n')
+    return ''.join(parts).encode('utf-8')
+
+# --- جلسه ویرایش افزایشی (پارس، اعتبارسنجی و چیدمان فقط برای بخش تغییرکرده) ---
+
+# دستوراتی که روی کل نت‌لیست اثر دارند؛ با وجود آنها هر ویرایش پارس کامل می‌شود
+# (.end فقط پایان ناحیه قطعات را تعیین می‌کند و جداگانه دنبال می‌شود)
+STRUCTURAL_DIRECTIVES = ('.include', '.inc', '.subckt', '.ends')
+
+def _is_structural_line(line):
+    parts = line.split(None, 1)
+    return bool(parts) and parts[0].lower() in STRUCTURAL_DIRECTIVES
 
-    for group_idx, group in enumerate(circuit_path):
-        if row_count >= MAX_PER_ROW and len(circuit_path) - group_idx > 1:
-            d.add(elm.Line().down().length(3))
-            row_count = 0
-            direction = 'left'
+def _is_end_line(line):
+    parts = line.split(None, 1)
+    return bool(parts) and parts[0].lower() == '.end'
+
+def _find_end_line(lines):
+    """اندیس اولین خط .end (خطوط بعد از آن قطعه حساب نمی‌شوند) یا None"""
+    return next((i for i, line in enumerate(lines) if _is_end_line(line)), None)
+
+def _is_attached_line(line):
+    """خط ادامه، خالی یا توضیح که به خط منطقی قبلی تعلق دارد"""
+    line = line.strip()
+    return not line or line.startswith('*') or line.startswith('+')
+
+def _parse_line_region(lines):
+    """پارس خطوط یک ناحیه؛ قطعه هر خط منطقی روی اندیس خط شروع آن قرار می‌گیرد
+    
+    مثل iter_components خطوط دستور (.tran، .model، ...) و ادامه آنها قطعه نیستند.
+    """
+    entries = [None] * len(lines)
+    pending, pending_at = None, None
+    for offset, raw in enumerate(lines):
+        line = raw.strip()
+        if not line or line.startswith('*'):
+            continue
+        if line.startswith('+'):
+            if pending is not None:
+                pending = f"{pending} {line[1:].strip()}"
+            continue
+        if pending is not None and not pending.startswith('.'):
+            entries[pending_at] = parse_component_line(pending)
+        pending, pending_at = line, offset
+    if pending is not None and not pending.startswith('.'):
+        entries[pending_at] = parse_component_line(pending)
+    return entries
+
+class EditSession:
+    """نگهداری نت‌لیست پارس‌شده، اتصالات، نتایج اعتبارسنجی و چیدمان بین ویرایش‌ها
+    
+    ویرایش‌ها در سطح خط اعمال می‌شوند و فقط خطوط منطقی تغییرکرده دوباره پارس و
+    با قواعد محلی بررسی می‌شوند. وقتی نودها یا نوع قطعات عوض شوند قواعد نود فقط
+    روی نودهای تحت تأثیر و قواعد همبندی با recheck فقط اطراف همان نودها اجرا
+    می‌شوند؛ قاعده همبندی بدون recheck (مثل حلقه منبع/سلف) فقط با تغییر قطعات
+    trigger_types و فقط روی همان نوع‌ها دوباره اجرا می‌شود. قواعد 'netlist' (مثل
+    OvercurrentRule که پیش‌فرض فعال نیست) کل نت‌لیست را لازم دارند و در هر ویرایش
+    کامل اجرا می‌شوند. ایندکس اتصالات و چیدمان پس از تغییر همبندی در اولین دسترسی
+    از نو ساخته می‌شوند؛ تغییر مقدار فقط برچسب همان قطعه را در چیدمان به‌روز می‌کند.
+    """
+    
+    def __init__(self, netlist_text='', rules=None):
+        self.rule_classes = list(VALIDATION_RULES if rules is None else rules)
+        self.lines = []
+        self._entries = []            # قطعه خط شروع هر خط منطقی (یا None)
+        self._full_components = None  # در حالت پارس کامل (.include/.subckt)
+        self._structural = 0
+        self._end = None              # اندیس خط .end؛ قطعات بعد از آن نادیده گرفته می‌شوند
+        self._local_messages = {}     # id قطعه → (خطاها، هشدارها) قواعد محلی
+        self._topology_messages = {}  # قاعده → (خطاها، هشدارها)
+        self._topology_state = {}     # قاعده → وضعیت recheck افزایشی
+        self._node_messages = {}      # نود → (خطاها، هشدارها) قواعد سطح نود
+        self._netlist_messages = ([], [])
+        self._net_members = defaultdict(dict)   # نود → {id قطعه: قطعه}
+        self._index = None
+        self._layout = None
+        self._placements = {}
+        self.timings = {}
+        self.replace_lines(0, 0, netlist_text.splitlines())
+    
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+    
+    @property
+    def components(self):
+        if self._full_components is not None:
+            return self._full_components
+        return [c for c in self._entries[:self._end] if c is not None]
+    
+    @property
+    def errors(self):
+        return self._messages(0)
+    
+    @property
+    def warnings(self):
+        return self._messages(1)
+    
+    def _messages(self, kind):
+        messages = []
+        for comp in self.components:
+            messages.extend(self._local_messages[id(comp)][kind])
+        messages.extend(self._netlist_messages[kind])
+        for found in self._topology_messages.values():
+            messages.extend(found[kind])
+        for found in self._node_messages.values():
+            messages.extend(found[kind])
+        return messages
+    
+    @property
+    def index(self):
+        """ایندکس اتصالات (فقط پس از تغییر همبندی دوباره ساخته می‌شود)"""
+        if self._index is None:
+            self._index = ConnectivityIndex(self.components)
+        return self._index
+    
+    @property
+    def layout(self):
+        """چیدمان شماتیک (فقط پس از تغییر همبندی دوباره محاسبه می‌شود)"""
+        if self._layout is None:
+            start = time.perf_counter()
+            self._layout = compute_layout(self.components)
+            self._placements = {p.name: p for p in self._layout.placements}
+            self.timings['layout'] = time.perf_counter() - start
+        return self._layout
+    
+    def net_components(self, node):
+        """قطعات متصل به یک نود"""
+        return list(self._net_members.get(node, {}).values())
+    
+    def nodes(self):
+        """نودهایی که دست‌کم یک قطعه به آنها وصل است"""
+        return self._net_members.keys()
+    
+    def schematic(self, canvas=None):
+        return build_schematic(self.components, canvas, layout=self.layout)
+    
+    # --- اعمال ویرایش ---
+    
+    def update(self, netlist_text):
+        """اعمال متن جدید؛ فقط خطوط بین پیشوند و پسوند مشترک مقایسه و اعمال می‌شوند"""
+        import difflib
+        
+        old_lines, new_lines = self.lines, netlist_text.splitlines()
+        limit = min(len(old_lines), len(new_lines))
+        head = 0
+        while head < limit and old_lines[head] == new_lines[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+            tail += 1
+        
+        old_mid = old_lines[head:len(old_lines) - tail]
+        new_mid = new_lines[head:len(new_lines) - tail]
+        matcher = difflib.SequenceMatcher(None, old_mid, new_mid, autojunk=False)
+        affected = set()
+        # از انتها به ابتدا تا اندیس خطوط قبلی جابه‌جا نشود
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag != 'equal':
+                affected |= self.replace_lines(head + i1, head + i2, new_mid[j1:j2])
+        return affected
+    
+    def set_line(self, number, text):
+        return self.replace_lines(number, number + 1, [text])
+    
+    def insert_line(self, number, text):
+        return self.replace_lines(number, number, [text])
+    
+    def delete_line(self, number):
+        return self.replace_lines(number, number + 1, [])
+    
+    def replace_lines(self, start, end, new_lines):
+        """جایگزینی خطوط [start, end) با new_lines؛ خروجی: نودهای تحت تأثیر"""
+        clock = time.perf_counter
+        t0 = clock()
+        new_lines = list(new_lines)
+        was_full = self._full_components is not None
+        self._structural += (sum(1 for line in new_lines if _is_structural_line(line))
+                             - sum(1 for line in self.lines[start:end] if _is_structural_line(line)))
+        
+        # افزودن، حذف یا جابه‌جایی .end مرز قطعات فعال را عوض می‌کند
+        end_moved = (any(_is_end_line(line) for line in new_lines)
+                     or (self._end is not None and start <= self._end < end))
+        
+        if self._structural or was_full or end_moved:
+            old = self.components
+            self.lines[start:end] = new_lines
+            self._end = _find_end_line(self.lines)
+            if self._structural:
+                self._entries = [None] * len(self.lines)
+                self._full_components = parse_netlist(self.text)
+            else:
+                self._entries = _parse_line_region(self.lines)
+                self._full_components = None
+            new = self.components
         else:
-            direction = 'right'
+            # ناحیه باید از خط منطقی قبلی شروع شود (ممکن است خط + به آن بچسبد)
+            # و خطوط ادامه بعدی را هم شامل شود
+            a = start
+            while a > 0 and _is_attached_line(self.lines[a - 1]):
+                a -= 1
+            a = max(a - 1, 0)
+            b = end
+            while b < len(self.lines) and _is_attached_line(self.lines[b]):
+                b += 1
+            
+            region = self.lines[a:start] + new_lines + self.lines[end:b]
+            limit = len(self.lines) if self._end is None else self._end
+            old = [c for c in self._entries[a:min(b, limit)] if c is not None]
+            entries = _parse_line_region(region)
+            self.lines[a:b] = region
+            self._entries[a:b] = entries
+            if self._end is not None and self._end >= end:
+                self._end += len(new_lines) - (end - start)
+            limit = len(self.lines) if self._end is None else self._end
+            new = [c for c in self._entries[a:min(a + len(region), limit)] if c is not None]
+        
+        self.timings = {'parse': clock() - t0}
+        affected = self._update_nets(old, new)
+        self._revalidate(old, new, affected)
+        return affected
+    
+    @staticmethod
+    def _signature(comp):
+        return comp['name'], comp['type'], tuple(component_nodes(comp))
+    
+    def _update_nets(self, old, new):
+        """به‌روزرسانی عضویت نودها؛ خروجی: نودهایی که قطعه‌ای از آنها کم یا به آنها اضافه شد"""
+        affected = set()
+        for comp in old:
+            for node in component_nodes(comp):
+                members = self._net_members[node]
+                members.pop(id(comp), None)
+                if not members:
+                    del self._net_members[node]
+                affected.add(node)
+            self._local_messages.pop(id(comp), None)
+        for comp in new:
+            for node in component_nodes(comp):
+                self._net_members[node][id(comp)] = comp
+                affected.add(node)
+        return affected
+    
+    def _revalidate(self, old, new, affected):
+        clock = time.perf_counter
+        t0 = clock()
+        local_rules = [cls() for cls in self.rule_classes if cls.scope == 'component']
+        for comp in new:
+            ctx = ValidationContext()
+            nodes = component_nodes(comp)
+            for rule in local_rules:
+                rule.check(comp, nodes, ctx)
+            self._local_messages[id(comp)] = (ctx.errors, ctx.warnings)
+        t1 = clock()
+        
+        topology_changed = Counter(map(self._signature, old)) != Counter(map(self._signature, new))
+        netlist_rules = [cls() for cls in self.rule_classes if cls.scope == 'netlist']
+        if netlist_rules:
+            report = run_validation(self.components, rules=netlist_rules)
+            self._netlist_messages = (report.errors, report.warnings)
+        if topology_changed:
+            # قواعد سطح نود فقط روی نودهای تحت تأثیر و قطعات متصل به آنها
+            # (زمین را این قواعد گزارش نمی‌کنند)
+            node_rules = [cls for cls in self.rule_classes if cls.scope == 'node']
+            for node in affected:
+                self._node_messages.pop(node, None)
+                members = self.net_components(node) if node != '0' else None
+                if node_rules and members:
+                    report = run_validation(members, rules=[cls() for cls in node_rules],
+                                            focus={node})
+                    if report.errors or report.warnings:
+                        self._node_messages[node] = (report.errors, report.warnings)
+            
+            changed_types = {c['type'] for c in old} | {c['type'] for c in new}
+            topology_rules = [cls for cls in self.rule_classes if cls.scope == 'topology' and (
+                cls.trigger_types is None or changed_types.intersection(cls.trigger_types))]
+            for cls in topology_rules:
+                if cls.recheck is not None:
+                    state, errors, warnings = cls.recheck(self, affected,
+                                                          self._topology_state.get(cls))
+                    self._topology_state[cls] = state
+                    self._topology_messages[cls] = (errors, warnings)
+                    continue
+                members = self.components
+                if cls.trigger_types is not None:
+                    members = [c for c in members if c['type'] in cls.trigger_types]
+                report = run_validation(members, rules=[cls()])
+                self._topology_messages[cls] = (report.errors, report.warnings)
+            self._index = None
+            self._layout = None
+        elif self._layout is not None:
+            # همبندی ثابت مانده: فقط برچسب قطعات ویرایش‌شده در چیدمان موجود عوض می‌شود
+            for comp in new:
+                placement = self._placements.get(comp['name'])
+                if placement is not None:
+                    placement.value = comp['value']
+        self.timings.update({'validate_local': t1 - t0, 'validate_nets': clock() - t1})
+
+# --- ۳. توابع Save و Load ---
+
+CIRCUIT_STORE_PATH = 'circuits.db'
 
-        if len(group) == 1:
-            draw_single_component(d, group[0], direction)
+def summarize_netlist(spice_code):
+    """(انواع قطعات مرتب‌شده، هش متعارف) یک نت‌لیست برای ستون‌های فهرست مدارها"""
+    components = list(iter_components(spice_code))
+    return sorted({comp['type'] for comp in components}), canonical_hash(components)
+
+class CircuitStore:
+    """فهرست SQLite مدارهای ذخیره‌شده با جستجوی متن کامل روی توضیحات
+    
+    فایل‌های circuit_*.json همچنان ذخیره می‌شوند؛ این فهرست فراداده و کد
+    SPICE را نگه می‌دارد تا لیست و جستجو نیاز به باز کردن تک‌تک فایل‌ها نداشته باشد.
+    """
+    
+    def __init__(self, path=CIRCUIT_STORE_PATH):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA foreign_keys = ON")
+        with self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS circuits (
+                    id INTEGER PRIMARY KEY,
+                    filename TEXT UNIQUE,
+                    description TEXT NOT NULL DEFAULT '',
+                    spice_code TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    version TEXT
+                );
+                CREATE INDEX IF NOT EXISTS circuits_date ON circuits(date);
+                CREATE TABLE IF NOT EXISTS circuit_types (
+                    circuit_id INTEGER NOT NULL REFERENCES circuits(id) ON DELETE CASCADE,
+                    type TEXT NOT NULL,
+                    PRIMARY KEY (type, circuit_id)
+                );
+            """)
+            # فهرست‌های قدیمی ستون هش متعارف را ندارند
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(circuits)")}
+            if 'canonical_hash' not in columns:
+                self._db.execute("ALTER TABLE circuits ADD COLUMN canonical_hash TEXT")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS circuits_canonical ON circuits(canonical_hash)")
+        self.has_fts = self._create_fts()
+    
+    def _create_fts(self):
+        """جدول FTS5 روی توضیحات (اگر SQLite از FTS5 پشتیبانی نکند از LIKE استفاده می‌شود)"""
+        try:
+            with self._db:
+                self._db.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS circuits_fts
+                        USING fts5(description, content='circuits', content_rowid='id');
+                    CREATE TRIGGER IF NOT EXISTS circuits_ai AFTER INSERT ON circuits BEGIN
+                        INSERT INTO circuits_fts(rowid, description) VALUES (new.id, new.description);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS circuits_ad AFTER DELETE ON circuits BEGIN
+                        INSERT INTO circuits_fts(circuits_fts, rowid, description)
+                            VALUES ('delete', old.id, old.description);
+                    END;
+                """)
+            return True
+        except sqlite3.OperationalError:
+            return False
+    
+    def _insert(self, filename, description, spice_code, date, version, summary=None):
+        if filename is not None:
+            # حذف صریح (نه REPLACE) تا تریگر FTS و جدول انواع هم به‌روز شوند
+            self._db.execute("DELETE FROM circuits WHERE filename = ?", (filename,))
+        types, digest = summary or summarize_netlist(spice_code)
+        cursor = self._db.execute(
+            "INSERT INTO circuits (filename, description, spice_code, date, version, canonical_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (filename, description, spice_code, date, version, digest)
+        )
+        circuit_id = cursor.lastrowid
+        self._db.executemany(
+            "INSERT OR IGNORE INTO circuit_types (circuit_id, type) VALUES (?, ?)",
+            [(circuit_id, t) for t in types]
+        )
+        return circuit_id
+    
+    def add(self, circuit_data, filename=None, summary=None):
+        """افزودن یک مدار (دیکشنری با قالب JSON نسخه 3.0) در یک تراکنش
+        
+        summary خروجی از پیش محاسبه‌شده summarize_netlist است (مثلاً در پروسه کارگر سرویس).
+        """
+        with self._db:
+            return self._insert(filename, circuit_data.get('description', ''),
+                                circuit_data['spice_code'], circuit_data.get('date', ''),
+                                circuit_data.get('version'), summary)
+    
+    def count(self):
+        return self._db.execute("SELECT COUNT(*) FROM circuits").fetchone()[0]
+    
+    def get(self, key):
+        """دریافت مدار با شناسه عددی یا نام فایل"""
+        if isinstance(key, int) or str(key).isdigit():
+            row = self._db.execute("SELECT * FROM circuits WHERE id = ?", (int(key),)).fetchone()
         else:
-            draw_parallel_group(d, group, direction)
+            row = self._db.execute("SELECT * FROM circuits WHERE filename = ?", (key,)).fetchone()
+        return dict(row) if row else None
+    
+    def search(self, text=None, date_from=None, date_to=None, component_type=None,
+               page=1, page_size=20):
+        """جستجو و صفحه‌بندی بر اساس توضیحات، بازه تاریخ و نوع قطعه"""
+        clauses, params = [], []
+        if text:
+            if self.has_fts:
+                # هر کلمه به‌صورت عبارت جداگانه (پیشوندی) جستجو می‌شود
+                terms = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in text.split())
+                clauses.append("c.id IN (SELECT rowid FROM circuits_fts WHERE circuits_fts MATCH ?)")
+                params.append(terms)
+            else:
+                clauses.append("c.description LIKE ?")
+                params.append(f"%{text}%")
+        if date_from:
+            clauses.append("c.date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("c.date < ?")
+            params.append(date_to)
+        if component_type:
+            clauses.append("c.id IN (SELECT circuit_id FROM circuit_types WHERE type = ?)")
+            params.append(component_type.upper())
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._db.execute(
+            f"SELECT c.id, c.filename, c.description, c.date FROM circuits c {where} "
+            "ORDER BY c.date DESC, c.id DESC LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size]
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def list(self, page=1, page_size=20):
+        return self.search(page=page, page_size=page_size)
+    
+    def find_by_hash(self, digest):
+        """مدارهای هم‌ریخت با یک هش متعارف (قدیمی‌ترین اول)"""
+        rows = self._db.execute(
+            "SELECT id, filename, description, date FROM circuits WHERE canonical_hash = ? "
+            "ORDER BY date, id", (digest,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def backfill_hashes(self):
+        """محاسبه هش متعارف برای مدارهایی که پیش از افزوده شدن این ستون ثبت شده‌اند"""
+        rows = self._db.execute(
+            "SELECT id, spice_code FROM circuits WHERE canonical_hash IS NULL").fetchall()
+        with self._db:
+            self._db.executemany("UPDATE circuits SET canonical_hash = ? WHERE id = ?",
+                                 [(canonical_hash(row['spice_code']), row['id']) for row in rows])
+        return len(rows)
+    
+    def duplicates(self):
+        """گروه‌های مدارهای تکراری (هم‌ریخت)؛ در هر گروه قدیمی‌ترین مدار اول است"""
+        self.backfill_hashes()
+        digests = [row[0] for row in self._db.execute(
+            "SELECT canonical_hash FROM circuits GROUP BY canonical_hash HAVING COUNT(*) > 1 "
+            "ORDER BY MIN(date)")]
+        return [self.find_by_hash(digest) for digest in digests]
+    
+    def delete(self, circuit_id):
+        with self._db:
+            self._db.execute("DELETE FROM circuits WHERE id = ?", (circuit_id,))
+    
+    def import_json_files(self, pattern="circuit_*.json"):
+        """ورود یک‌باره فایل‌های JSON موجود به فهرست (فایل‌های قبلاً واردشده رد می‌شوند)"""
+        import glob
+        
+        known = {row[0] for row in self._db.execute("SELECT filename FROM circuits")}
+        imported = failed = 0
+        with self._db:
+            for filename in glob.iglob(pattern):
+                if filename in known:
+                    continue
+                try:
+                    with open(filename, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    self._insert(filename, data.get('description', ''), data['spice_code'],
+                                 data.get('date', ''), data.get('version'))
+                    imported += 1
+                except Exception:
+                    failed += 1
+        return imported, failed
+
+_circuit_store = None
 
-        if group_idx < len(circuit_path) - 1:
-            d.add(elm.Line().right().length(0.3) if direction == 'right'
-                  else elm.Line().left().length(0.3))
+def get_circuit_store():
+    """فهرست مدارهای پوشه جاری؛ در اولین ساخت، فایل‌های JSON موجود وارد می‌شوند"""
+    global _circuit_store
+    if _circuit_store is None:
+        is_new = not os.path.exists(CIRCUIT_STORE_PATH)
+        _circuit_store = CircuitStore(CIRCUIT_STORE_PATH)
+        if is_new:
+            imported, _ = _circuit_store.import_json_files()
+            if imported:
+                print(f"📥 {imported} مدار قدیمی به فهرست اضافه شد.")
+    return _circuit_store
+
+def save_circuit(spice_code, description="", filename=None):
+    """ذخیره مدار (نوشتن اتمیک فایل JSON و ثبت در فهرست)"""
+    if not filename:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"circuit_{timestamp}.json"
+    
+    circuit_data = {
+        'description': description,
+        'spice_code': spice_code,
+        'date': datetime.now().isoformat(),
+        'version': '3.0'
+    }
+    
+    try:
+        existing = get_circuit_store().find_by_hash(canonical_hash(spice_code))
+        if existing:
+            first = existing[0]
+            print(f"ℹ️ این مدار (با شماره‌گذاری یا ترتیب دیگر) قبلاً ذخیره شده است: "
+                  f"{first['filename'] or first['id']}")
+        
+        # نوشتن در فایل موقت و جایگزینی اتمیک تا فایل نیمه‌کاره باقی نماند
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(circuit_data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_filename, filename)
+        get_circuit_store().add(circuit_data, filename)
+        print(f"✅ مدار در '{filename}' ذخیره شد.")
+        return filename
+    except Exception as e:
+        print(f"❌ خطا در ذخیره: {e}")
+        return None
 
-        row_count += 1
+def load_circuit(filename):
+    """بارگذاری مدار (از فایل JSON یا با شناسه از فهرست مدارها)"""
+    try:
+        if not os.path.exists(filename) and filename.isdigit():
+            circuit_data = get_circuit_store().get(int(filename))
+            if circuit_data is None:
+                raise FileNotFoundError(filename)
+        else:
+            with open(filename, 'r', encoding='utf-8') as f:
+                circuit_data = json.load(f)
+        
+        print(f"✅ مدار از '{filename}' بارگذاری شد.")
+        print(f"📝 توضیحات: {circuit_data.get('description', 'ندارد')}")
+        print(f"📅 تاریخ: {circuit_data.get('date', 'نامشخص')}")
+        
+        return circuit_data['spice_code']
+    except FileNotFoundError:
+        print(f"❌ فایل '{filename}' یافت نشد.")
+        return None
+    except Exception as e:
+        print(f"❌ خطا در بارگذاری: {e}")
+        return None
 
-    # بستن مدار
-    current_pos = d.here
-    if abs(current_pos[1] - v_bottom[1]) > 0.1:
-        d.add(elm.Line().up().toy(v_bottom[1])
-              if current_pos[1] < v_bottom[1]
-              else elm.Line().down().toy(v_bottom[1]))
+def list_saved_circuits(page=1, page_size=20, query=None, component_type=None):
+    """لیست صفحه‌بندی‌شده مدارهای ذخیره شده از روی فهرست"""
+    store = get_circuit_store()
+    rows = store.search(query, component_type=component_type, page=page, page_size=page_size)
+    
+    if not rows:
+        print("📁 هیچ مدار ذخیره‌شده‌ای یافت نشد.")
+        return []
+    
+    print(f"\n📁 مدارهای ذخیره شده (صفحه {page}):")
+    print("-" * 50)
+    for i, row in enumerate(rows, 1):
+        desc = (row['description'] or 'بدون توضیحات')[:30]
+        date = (row['date'] or 'نامشخص')[:10]
+        print(f"{i}. {row['filename'] or row['id']} - {desc} ({date})")
+    print("-" * 50)
+    
+    return [row['filename'] or str(row['id']) for row in rows]
 
-    if abs(current_pos[0] - v_bottom[0]) > 0.1:
-        d.add(elm.Line().tox(v_bottom[0]))
+# --- آرشیو باینری فشرده مدارها (append-only، با جدول قطعات پارس‌شده و ایندکس آفست) ---
 
-    d.draw()
-    print("✅ شماتیک مدار رسم شد!")
+CIRCUIT_ARCHIVE_PATH = 'circuits.prga'
+ARCHIVE_MAGIC = b'PRGA'
+ARCHIVE_VERSION = 1
+ARCHIVE_RECORD_MAGIC = b'CREC'
+# سرآیند فایل: جادو، نسخه | سرآیند رکورد: جادو، طول محتوا، CRC32 محتوا
+_ARCHIVE_HEADER = struct.Struct('<4sHH')
+_RECORD_HEADER = struct.Struct('<4sII')
+# شمارنده‌های جدول قطعات: قطعات، پایه‌ها، طول متادیتا، نت‌لیست و سه جدول رشته‌ها
+_RECORD_COUNTS = struct.Struct('<7I')
+_INDEX_ENTRY = struct.Struct('<Q')
+_ARCHIVE_COLUMNS = ('types', 'value_ids', 'pin_offsets', 'pin_nodes', 'names', 'node_names', 'values')
 
+class CircuitArchive:
+    """آرشیو باینری append-only؛ هر رکورد متادیتا، نت‌لیست خام و جدول ستونی قطعات را دارد
+    
+    رکوردها پشت سر هم در فایل اصلی و آفست هر رکورد در فایل ایندکس کنار آن
+    (path + '.idx'، هشت بایت برای هر رکورد) نوشته می‌شوند. هر دو فایل mmap می‌شوند،
+    پس بارگذاری رکورد i در هر اندازه آرشیو O(1) است و جدول قطعات بدون پارس دوباره
+    به CompactNetlist تبدیل می‌شود. اگر ایندکس ناقص باشد از روی رکوردها بازسازی می‌شود.
+    """
+    
+    def __init__(self, path=CIRCUIT_ARCHIVE_PATH):
+        self.path = path
+        self.index_path = path + '.idx'
+        self._data = None
+        self._data_map = None
+        self._index_map = None
+        self._count = 0
+        self._by_filename = None
+        self._open()
+    
+    def _open(self):
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._data = open(self.path, 'a+b')
+        if is_new:
+            self._data.write(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0))
+            self._data.flush()
+            with open(self.index_path, 'wb'):
+                pass
+        else:
+            self._data.seek(0)
+            magic, version, _ = _ARCHIVE_HEADER.unpack(self._data.read(_ARCHIVE_HEADER.size))
+            if magic != ARCHIVE_MAGIC or version > ARCHIVE_VERSION:
+                raise ValueError(f"{self.path} is not a circuit archive (version {ARCHIVE_VERSION})")
+        if not self._index_is_valid():
+            self.rebuild_index()
+        self._count = os.path.getsize(self.index_path) // _INDEX_ENTRY.size
+    
+    def _index_is_valid(self):
+        """ایندکس موجود است و آخرین ورودی آن به یک رکورد کامل اشاره می‌کند"""
+        if not os.path.exists(self.index_path):
+            return False
+        size = os.path.getsize(self.index_path)
+        if size % _INDEX_ENTRY.size:
+            return False
+        if size == 0:
+            return os.path.getsize(self.path) == _ARCHIVE_HEADER.size
+        with open(self.index_path, 'rb') as f:
+            f.seek(size - _INDEX_ENTRY.size)
+            offset, = _INDEX_ENTRY.unpack(f.read(_INDEX_ENTRY.size))
+        self._data.seek(offset)
+        header = self._data.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return False
+        magic, length, _ = _RECORD_HEADER.unpack(header)
+        return magic == ARCHIVE_RECORD_MAGIC and \
+            offset + _RECORD_HEADER.size + length == os.path.getsize(self.path)
+    
+    def rebuild_index(self):
+        """بازسازی ایندکس با پیمایش رکوردها؛ دنباله ناقص (نوشتن نیمه‌کاره) حذف می‌شود"""
+        self._release_maps()
+        offsets = array('Q')
+        end = os.path.getsize(self.path)
+        offset = _ARCHIVE_HEADER.size
+        self._data.seek(offset)
+        while offset + _RECORD_HEADER.size <= end:
+            magic, length, checksum = _RECORD_HEADER.unpack(self._data.read(_RECORD_HEADER.size))
+            payload = self._data.read(length)
+            if magic != ARCHIVE_RECORD_MAGIC or len(payload) < length or \
+                    zlib.crc32(payload) != checksum:
+                break
+            offsets.append(offset)
+            offset += _RECORD_HEADER.size + length
+        if offset < end:
+            self._data.truncate(offset)
+        with open(self.index_path, 'wb') as f:
+            f.write(offsets.tobytes())
+        self._count = len(offsets)
+        self._by_filename = None
+    
+    def _release_maps(self):
+        for mapped in (self._data_map, self._index_map):
+            if mapped is not None:
+                mapped.close()
+        self._data_map = self._index_map = None
+    
+    def _maps(self):
+        """mmap فایل‌ها؛ پس از append اگر رکورد جدید بیرون از نگاشت باشد دوباره نگاشت می‌شود"""
+        if self._index_map is None or len(self._index_map) < self._count * _INDEX_ENTRY.size:
+            self._release_maps()
+            self._data.flush()
+            with open(self.index_path, 'rb') as f:
+                self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data_map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data_map, self._index_map
+    
+    def __len__(self):
+        return self._count
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        return False
+    
+    def close(self):
+        self._release_maps()
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+    
+    # --- نوشتن ---
+    
+    def append(self, circuit_data, components=None):
+        """افزودن یک مدار (دیکشنری با قالب JSON نسخه 3.0)؛ خروجی شناسه رکورد"""
+        spice_code = circuit_data['spice_code']
+        if components is None:
+            components = CompactNetlist.from_source(spice_code)
+        elif not isinstance(components, CompactNetlist):
+            components = CompactNetlist.from_components(components)
+        
+        meta = {k: v for k, v in circuit_data.items() if k != 'spice_code'}
+        blobs = [json.dumps(meta, ensure_ascii=False).encode('utf-8'),
+                 spice_code.encode('utf-8'),
+                 '\0'.join(components.names).encode('utf-8'),
+                 '\0'.join(components.node_names).encode('utf-8'),
+                 '\0'.join(components.value_table).encode('utf-8')]
+        count = len(components)
+        columns = [array('i', components.value_ids), array('i', components.pin_offsets),
+                   array('i', components.pin_nodes)]
+        if sys.byteorder != 'little':
+            for column in columns:
+                column.byteswap()
+        payload = b''.join([_RECORD_COUNTS.pack(count, len(components.pin_nodes),
+                                                 *(len(b) for b in blobs)),
+                            components.types.tobytes()]
+                           + [column.tobytes() for column in columns] + blobs)
+        
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        self._data.write(_RECORD_HEADER.pack(ARCHIVE_RECORD_MAGIC, len(payload), zlib.crc32(payload)))
+        self._data.write(payload)
+        self._data.flush()
+        # ایندکس بعد از رکورد نوشته می‌شود تا هرگز به داده ناقص اشاره نکند
+        with open(self.index_path, 'ab') as f:
+            f.write(_INDEX_ENTRY.pack(offset))
+        
+        record_id = self._count
+        self._count += 1
+        if self._by_filename is not None and meta.get('filename'):
+            self._by_filename[meta['filename']] = record_id
+        return record_id
+    
+    # --- خواندن ---
+    
+    def _record(self, record_id):
+        if not 0 <= record_id < self._count:
+            raise IndexError(record_id)
+        data, index = self._maps()
+        offset, = _INDEX_ENTRY.unpack_from(index, record_id * _INDEX_ENTRY.size)
+        _, length, _ = _RECORD_HEADER.unpack_from(data, offset)
+        start = offset + _RECORD_HEADER.size
+        return memoryview(data)[start:start + length]
+    
+    @staticmethod
+    def _sections(payload):
+        counts = _RECORD_COUNTS.unpack_from(payload, 0)
+        count, pin_count, lengths = counts[0], counts[1], counts[2:]
+        pos = _RECORD_COUNTS.size
+        sections = {'types': payload[pos:pos + count]}
+        pos += count
+        for name, size in (('value_ids', count), ('pin_offsets', count + 1), ('pin_nodes', pin_count)):
+            sections[name] = payload[pos:pos + 4 * size]
+            pos += 4 * size
+        for name, size in zip(('meta', 'netlist', 'names', 'node_names', 'values'), lengths):
+            sections[name] = payload[pos:pos + size]
+            pos += size
+        return sections
+    
+    def _read(self, record_id, *names):
+        """بایت‌های بخش‌های خواسته‌شده یک رکورد (کپی از نگاشت، بدون نگه داشتن آن)"""
+        payload = self._record(record_id)
+        try:
+            sections = self._sections(payload)
+            return [bytes(sections[name]) for name in names]
+        finally:
+            sections = None
+            payload.release()
+    
+    def metadata(self, record_id):
+        meta, = self._read(record_id, 'meta')
+        return json.loads(meta.decode('utf-8'))
+    
+    def spice_code(self, record_id):
+        netlist, = self._read(record_id, 'netlist')
+        return netlist.decode('utf-8')
+    
+    @staticmethod
+    def _compact(types, value_ids, pin_offsets, pin_nodes, names, node_names, values):
+        def strings(data):
+            return data.decode('utf-8').split('\0') if data else []
+        
+        net = CompactNetlist()
+        net.types = array('B', types)
+        for name, data in (('value_ids', value_ids), ('pin_offsets', pin_offsets),
+                           ('pin_nodes', pin_nodes)):
+            column = array('i')
+            column.frombytes(data)
+            if sys.byteorder != 'little':
+                column.byteswap()
+            setattr(net, name, column)
+        net.names = strings(names)
+        # رکورد بدون قطعه هم ممکن است (جدول‌های رشته خالی)
+        net.node_names = strings(node_names) if net.pin_nodes else []
+        net.value_table = strings(values) if net.types else []
+        net._node_ids = {name: i for i, name in enumerate(net.node_names)}
+        net._value_ids = {value: i for i, value in enumerate(net.value_table)}
+        return net
+    
+    def components(self, record_id):
+        """جدول قطعات پارس‌شده به صورت CompactNetlist (بدون پارس متن)"""
+        return self._compact(*self._read(record_id, *_ARCHIVE_COLUMNS))
+    
+    def get(self, record_id):
+        """مدار کامل: متادیتا + spice_code (قالب JSON نسخه 3.0) + components"""
+        meta, netlist, *columns = self._read(record_id, 'meta', 'netlist', *_ARCHIVE_COLUMNS)
+        circuit = json.loads(meta.decode('utf-8'))
+        circuit['spice_code'] = netlist.decode('utf-8')
+        circuit['components'] = self._compact(*columns)
+        return circuit
+    
+    def find(self, filename):
+        """شناسه رکورد با نام فایل اصلی (ایندکس نام‌ها در اولین فراخوانی ساخته می‌شود)"""
+        if self._by_filename is None:
+            self._by_filename = {}
+            for record_id in range(self._count):
+                name = self.metadata(record_id).get('filename')
+                if name:
+                    self._by_filename[name] = record_id
+        return self._by_filename.get(filename)
+    
+    # --- تبدیل به/از JSON نسخه 3.0 ---
+    
+    def import_json_files(self, pattern="circuit_*.json"):
+        """افزودن فایل‌های circuit_*.json به آرشیو؛ خروجی (واردشده، ناموفق)
+        
+        مثل CircuitStore.import_json_files فایل‌هایی که نامشان در آرشیو هست رد می‌شوند.
+        """
+        import glob
+        
+        imported = failed = 0
+        for filename in sorted(glob.iglob(pattern)):
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                data.setdefault('filename', os.path.basename(filename))
+                if self.find(data['filename']) is not None:
+                    continue
+                self.append(data)
+                imported += 1
+            except Exception:
+                failed += 1
+        return imported, failed
+    
+    def export_json(self, out_dir, record_ids=None):
+        """نوشتن رکوردها به صورت فایل‌های JSON نسخه 3.0؛ خروجی لیست مسیرها"""
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for record_id in (range(self._count) if record_ids is None else record_ids):
+            meta = self.metadata(record_id)
+            circuit_data = {
+                'description': meta.get('description', ''),
+                'spice_code': self.spice_code(record_id),
+                'date': meta.get('date', ''),
+                'version': meta.get('version', '3.0'),
+            }
+            path = os.path.join(out_dir, meta.get('filename') or f"circuit_{record_id:06d}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(circuit_data, f, ensure_ascii=False, indent=2)
+            paths.append(path)
+        return paths
+
+# --- ۴. تابع تشخیص گفتار ---
+
+# آستانه انرژی کالیبره‌شده بین اجراها ذخیره می‌شود تا هر بار ~۱ ثانیه کالیبراسیون لازم نباشد
+VOICE_CALIBRATION_PATH = '.voice_calibration.json'
+VOICE_CALIBRATION_TTL = 3600        # پس از این مدت (ثانیه) دوباره کالیبره می‌شود
+VOICE_CALIBRATION_SECONDS = 0.5
+VOICE_PHRASE_TIME_LIMIT = 20
+
+class SpeechRecognizerBackend:
+    """بک‌اند تشخیص گفتار مبتنی بر موتورهای speech_recognition (google، whisper، vosk، ...)"""
+    
+    def __init__(self, engine='google', **options):
+        self.engine = engine
+        self.options = options
+        self._recognizer = None
+    
+    def recognize(self, audio):
+        import speech_recognition as sr
+        
+        if self._recognizer is None:
+            self._recognizer = sr.Recognizer()
+        try:
+            text = getattr(self._recognizer, f"recognize_{self.engine}")(audio, **self.options)
+        except sr.UnknownValueError:
+            return None
+        if self.engine == 'vosk' and text and text.lstrip().startswith('{'):
+            # vosk نتیجه را به صورت JSON خام ({"text": "..."}) برمی‌گرداند
+            text = json.loads(text).get('text', '')
+        # مثل بقیه موتورها، متن خالی یعنی گفتاری تشخیص داده نشد
+        return (text or '').strip() or None
+
+class StubSpeechBackend:
+    """بک‌اند محلی جایگزین (بدون شبکه) برای تست؛ responder رشته ثابت یا تابعی از صدا است"""
+    
+    def __init__(self, responder=None, delay=0.0):
+        self.responder = responder
+        self.delay = delay
+        self.calls = 0
+    
+    def recognize(self, audio):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if callable(self.responder):
+            return self.responder(audio)
+        if self.responder is not None:
+            return self.responder
+        if hasattr(audio, 'frame_data'):
+            seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+            return f"stub #{self.calls}: {seconds:.2f}s"
+        return str(audio)
+
+def make_speech_backend(kind='google'):
+    """ساخت بک‌اند تشخیص گفتار؛ whisper/vosk/sphinx بدون اینترنت کار می‌کنند"""
+    if kind == 'google':
+        return SpeechRecognizerBackend('google', language="fa-IR")
+    if kind == 'whisper':
+        return SpeechRecognizerBackend('whisper', language="persian")
+    if kind in ('vosk', 'sphinx'):
+        return SpeechRecognizerBackend(kind)
+    if kind == 'stub':
+        return StubSpeechBackend()
+    raise ValueError(f"unknown speech backend: {kind}")
+
+class MicrophoneCapture:
+    """ضبط از میکروفون با کالیبراسیون نویز محیط ذخیره‌شده روی دیسک"""
+    
+    def __init__(self, device_index=None, calibration_path=VOICE_CALIBRATION_PATH,
+                 calibration_ttl=VOICE_CALIBRATION_TTL, phrase_time_limit=VOICE_PHRASE_TIME_LIMIT):
+        self.device_index = device_index
+        self.calibration_path = calibration_path
+        self.calibration_ttl = calibration_ttl
+        self.phrase_time_limit = phrase_time_limit
+        self.recognizer = None
+        self._microphone = None
+        self._source = None
+    
+    def _load_threshold(self):
+        try:
+            with open(self.calibration_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data.get('time', 0) > self.calibration_ttl:
+            return None
+        if data.get('device_index') != self.device_index:
+            return None
+        return data.get('energy_threshold')
+    
+    def _save_threshold(self):
+        data = {'energy_threshold': self.recognizer.energy_threshold,
+                'device_index': self.device_index, 'time': time.time()}
+        tmp_path = f"{self.calibration_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.calibration_path)
+        except OSError:
+            pass
+    
+    def open(self):
+        import speech_recognition as sr
+        
+        self.recognizer = sr.Recognizer()
+        self._microphone = sr.Microphone(device_index=self.device_index)
+        self._source = self._microphone.__enter__()
+        threshold = self._load_threshold()
+        if threshold:
+            self.recognizer.energy_threshold = threshold
+        else:
+            with METRICS.span('voice_calibrate'):
+                self.recognizer.adjust_for_ambient_noise(self._source,
+                                                         duration=VOICE_CALIBRATION_SECONDS)
+            self._save_threshold()
+    
+    def listen(self, timeout=1.0):
+        """ضبط یک جمله؛ اگر در timeout صدایی شروع نشود None برمی‌گرداند"""
+        import speech_recognition as sr
+        
+        try:
+            return self.recognizer.listen(self._source, timeout=timeout,
+                                          phrase_time_limit=self.phrase_time_limit)
+        except sr.WaitTimeoutError:
+            return None
+    
+    def close(self):
+        if self._microphone is not None:
+            # آستانه پویا در طول جلسه با محیط تطبیق یافته؛ برای دفعه بعد ذخیره می‌شود
+            self._save_threshold()
+            self._microphone.__exit__(None, None, None)
+            self._microphone = self._source = None
+
+class AudioFileCapture:
+    """ورودی صوتی از فایل‌های WAV/AIFF/FLAC (هر فایل یک جمله)؛ برای تست و اجرای آفلاین"""
+    
+    def __init__(self, paths):
+        self.paths = deque(paths)
+    
+    def open(self):
+        pass
+    
+    def listen(self, timeout=1.0):
+        import speech_recognition as sr
+        
+        if not self.paths:
+            raise EOFError
+        with sr.AudioFile(self.paths.popleft()) as source:
+            return sr.Recognizer().record(source)
+    
+    def close(self):
+        pass
+
+class ScriptedCapture:
+    """ورودی ساختگی: هر فراخوانی listen قطعه بعدی را پس از delay ثانیه برمی‌گرداند"""
+    
+    def __init__(self, clips, delay=0.0):
+        self.clips = deque(clips)
+        self.delay = delay
+    
+    def open(self):
+        pass
+    
+    def listen(self, timeout=1.0):
+        if not self.clips:
+            raise EOFError
+        if self.delay:
+            time.sleep(self.delay)
+        return self.clips.popleft()
+    
+    def close(self):
+        pass
+
+class VoiceCapture:
+    """ضبط پیوسته در پس‌زمینه؛ تشخیص هر جمله هم‌زمان با ضبط جمله بعدی انجام می‌شود
+    
+    یک رشته ضبط، جمله‌ها را از capture می‌گیرد و برای تشخیص به thread pool می‌دهد؛
+    next_text نتایج را به ترتیب ضبط برمی‌گرداند. با pause/resume ضبط بین درخواست‌ها
+    متوقف می‌شود و جمله‌هایی که پیش از resume ضبط شده‌اند دور ریخته می‌شوند.
+    """
+    
+    def __init__(self, capture=None, backend=None, workers=2):
+        import queue
+        import threading
+        
+        self.capture = capture or MicrophoneCapture()
+        self.backend = backend or make_speech_backend(os.environ.get('PRG_SPEECH_BACKEND', 'google'))
+        self.workers = workers
+        self._results = queue.Queue()
+        self._thread = None
+        self._executor = None
+        self._running = False
+        self._finished = False
+        self._error = None
+        self._listening = threading.Event()
+        self._generation = 0   # با هر resume زیاد می‌شود؛ نتایج نسل‌های قبل کهنه‌اند
+    
+    @property
+    def running(self):
+        return self._running
+    
+    def start(self, paused=False):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        
+        if self._running:
+            return self
+        if not paused:
+            self._listening.set()
+        self.capture.open()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._running = True
+        self._finished = False
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+        return self
+    
+    def _recognize(self, audio):
+        with METRICS.span('voice_recognize'):
+            return self.backend.recognize(audio)
+    
+    def pause(self):
+        """توقف ضبط تا resume بعدی (جمله در حال ضبط کامل می‌شود ولی کهنه است)"""
+        self._listening.clear()
+    
+    def resume(self):
+        """ادامه ضبط؛ همه نتایجی که تا این لحظه ضبط شده‌اند دیگر برگردانده نمی‌شوند"""
+        self._generation += 1
+        self._listening.set()
+    
+    def _capture_loop(self):
+        try:
+            while self._running:
+                if not self._listening.wait(timeout=0.1):
+                    continue
+                generation = self._generation
+                with METRICS.span('voice_listen'):
+                    audio = self.capture.listen()
+                if audio is None:
+                    continue
+                self._results.put((generation, self._executor.submit(self._recognize, audio)))
+        except EOFError:
+            pass
+        except Exception as e:
+            self._error = e
+        finally:
+            self._running = False
+            self._results.put(None)
+    
+    def next_text(self, timeout=None):
+        """متن جمله بعدی (به ترتیب ضبط)؛ None در پایان ورودی یا اگر تشخیص ممکن نبود"""
+        import queue
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._results.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if item is None:
+                # نشانه پایان برای فراخوانی‌های بعدی نگه داشته می‌شود
+                self._finished = True
+                self._results.put(None)
+                if self._error is not None:
+                    raise self._error
+                return None
+            generation, future = item
+            if generation == self._generation:
+                return future.result()
+    
+    def __iter__(self):
+        while not self._finished:
+            text = self.next_text()
+            if text:
+                yield text
+    
+    def stop(self):
+        self._running = False
+        self._listening.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.capture.close()
+
+# جلسه صوتی مشترک بین درخواست‌های منو (میکروفون و کالیبراسیون یک بار آماده می‌شوند)
+_voice_capture = None
+
+def _stop_voice_capture():
+    if _voice_capture is not None:
+        _voice_capture.stop()
+
+def get_voice_capture():
+    """جلسه صوتی مشترک (متوقف‌شده)؛ جلسه‌ای که ضبطش تمام شده بسته و جایگزین می‌شود"""
+    global _voice_capture
+    if _voice_capture is None:
+        import atexit
+        
+        # یک قلاب برای کل برنامه که جلسه فعلی (هر کدام باشد) را می‌بندد
+        atexit.register(_stop_voice_capture)
+    elif not _voice_capture.running:
+        _voice_capture.stop()
+    else:
+        return _voice_capture
+    _voice_capture = VoiceCapture().start(paused=True)
+    return _voice_capture
+
+def get_description_from_voice(timeout=30):
+    print("🎙️ لطفاً توضیحات مدار را بیان کنید:")
+    try:
+        capture = get_voice_capture()
+        # ضبط فقط در طول همین درخواست فعال است؛ گفتار قبلی به این درخواست نمی‌رسد
+        capture.resume()
+        try:
+            text = capture.next_text(timeout=timeout)
+        finally:
+            capture.pause()
+        if text:
+            print(f"✅ تشخیص: {text}")
+        else:
+            print("❌ گفتاری تشخیص داده نشد.")
+        return text
+    except Exception as e:
+        print(f"❌ خطا در تشخیص گفتار: {e}")
+        return None
+
+# --- ۵. تولید کد SPICE ---
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# قوانین ثابت مشترک بین درخواست تکی و دسته‌ای
+SPICE_PROMPT_RULES = """
+شما متخصص تحلیل مدار هستید. فقط کد SPICE تولید کنید.
+
+قوانین:
+1. فقط کد SPICE خالص
+2. نام نودها فقط عدد (0, 1, 2, ...)
+3. فرمت‌ها:
+   - R<نام> <نود1> <نود2> <مقدار>
+   - C<نام> <نود1> <نود2> <مقدار>  
+   - L<نام> <نود1> <نود2> <مقدار>
+   - V<نام> <نود+> <نود-> <مقدار>
+   - D<نام> <آند> <کاتد> <مدل>
+   - Q<نام> <کلکتور> <بیس> <امیتر> <مدل>
+   - M<نام> <درین> <گیت> <سورس> <بادی> <مدل>
+"""
+
+SPICE_PROMPT_TEMPLATE = SPICE_PROMPT_RULES + """
+توضیحات: {description}
+"""
+
+class GeminiBackend:
+    """بک‌اند مدل زبانی Gemini (یک کلاینت مشترک برای همه درخواست‌ها)"""
+    
+    def __init__(self, model=GEMINI_MODEL):
+        self.model = model
+        self._client = None
+    
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client()
+        return self._client
+    
+    @staticmethod
+    def _config(schema):
+        # با schema پاسخ به صورت JSON ساخت‌یافته (structured output) خواسته می‌شود
+        if schema is None:
+            return None
+        return {'response_mime_type': 'application/json', 'response_schema': schema}
+    
+    def generate(self, prompt, schema=None):
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=prompt,
+            config=self._config(schema)
+        )
+        self._count_tokens(response)
+        return response.text
+    
+    async def agenerate(self, prompt, schema=None):
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=prompt,
+            config=self._config(schema)
+        )
+        self._count_tokens(response)
+        return response.text
+    
+    def stream(self, prompt):
+        """تولید جریانی: تکه‌های متن به محض رسیدن؛ بستن generator جریان را لغو می‌کند"""
+        chunks = self.client.models.generate_content_stream(
+            model=self.model,
+            contents=prompt
+        )
+        last = None
+        try:
+            for chunk in chunks:
+                last = chunk
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            # بستن اتصال HTTP در صورت لغو زودهنگام
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            if last is not None:
+                self._count_tokens(last)
+    
+    def _count_tokens(self, response):
+        """ثبت تعداد توکن‌های گزارش‌شده توسط API در شمارنده‌ها"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        for kind, field in (('prompt', 'prompt_token_count'), ('output', 'candidates_token_count')):
+            tokens = getattr(usage, field, None)
+            if tokens:
+                METRICS.count('llm_tokens', tokens, model=self.model, kind=kind)
+
+STUB_SPICE_CODE = "V1 1 0 5V\nR1 1 0 1k"
+
+def stub_spice_responder(prompt):
+    """پاسخ پیش‌فرض مدل جعلی؛ به درخواست دسته‌ای یک آرایه JSON با یک مدار برای هر مورد می‌دهد"""
+    items = _batch_prompt_items(prompt)
+    if items is None:
+        return STUB_SPICE_CODE
+    return json.dumps([{'id': item['id'], 'spice': STUB_SPICE_CODE} for item in items])
+
+class StubBackend:
+    """بک‌اند محلی جایگزین Gemini (برای تست و اجرای آفلاین)
+    
+    responder می‌تواند یک رشته ثابت یا تابعی از prompt باشد. delay تأخیر ثابت هر
+    درخواست (رفت و برگشت شبکه) و char_delay هزینه هر نویسه پاسخ (زمان تولید) است.
+    """
+    
+    def __init__(self, responder=stub_spice_responder, model='stub', delay=0.0, chunk_size=16,
+                 char_delay=0.0):
+        self.responder = responder
+        self.model = model
+        self.delay = delay
+        self.char_delay = char_delay
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.prompt_chars = 0
+        self.streamed_chars = 0
+    
+    def _respond(self, prompt):
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        text = self.responder(prompt) if callable(self.responder) else self.responder
+        return text, self.delay + self.char_delay * len(text)
+    
+    def generate(self, prompt, schema=None):
+        text, delay = self._respond(prompt)
+        if delay:
+            time.sleep(delay)
+        return text
+    
+    async def agenerate(self, prompt, schema=None):
+        import asyncio
+        
+        text, delay = self._respond(prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        return text
+    
+    def stream(self, prompt):
+        """پاسخ در تکه‌های chunk_size نویسه‌ای؛ delay بین تکه‌ها پخش می‌شود"""
+        text, delay = self._respond(prompt)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for piece in pieces:
+            if delay:
+                time.sleep(delay / len(pieces))
+            self.streamed_chars += len(piece)
+            yield piece
+
+class HttpModelBackend:
+    """بک‌اند HTTP ساده برای سرور مدل محلی/جعلی (POST {"prompt", "model"} → {"text"})"""
+    
+    def __init__(self, url, model='fake', timeout=60, max_workers=64):
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self._executor = None
+    
+    def generate(self, prompt, schema=None):
+        import urllib.request
+        payload = {'prompt': prompt, 'model': self.model}
+        if schema is not None:
+            payload['schema'] = schema
+        body = json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())['text']
+    
+    def stream(self, prompt):
+        # سرور مدل جعلی پاسخ جریانی ندارد؛ کل پاسخ یک تکه است
+        yield self.generate(prompt)
+    
+    async def agenerate(self, prompt, schema=None):
+        import asyncio
+        
+        # thread pool اختصاصی تا هم‌زمانی به اندازه پیش‌فرض asyncio محدود نشود
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.generate, prompt, schema)
+
+def make_llm_backend(kind='gemini', url=None, delay=0.0, char_delay=0.0):
+    """ساخت بک‌اند مدل از روی نام (برای گزینه‌های خط فرمان)"""
+    if kind == 'stub':
+        return StubBackend(delay=delay, char_delay=char_delay)
+    if kind == 'http':
+        return HttpModelBackend(url or 'http://127.0.0.1:8765/')
+    return GeminiBackend()
+
+_llm_backend = None
+
+def get_llm_backend():
+    global _llm_backend
+    if _llm_backend is None:
+        _llm_backend = GeminiBackend()
+    return _llm_backend
+
+def set_llm_backend(backend):
+    """جایگزینی بک‌اند پیش‌فرض (مثلاً StubBackend در تست‌ها)"""
+    global _llm_backend
+    _llm_backend = backend
+
+# --- کش پایدار پاسخ‌های مدل (توضیحات → کد SPICE) ---
+
+RESPONSE_CACHE_PATH = '.spice_cache.db'
+RESPONSE_CACHE_TTL = 30 * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+
+def normalize_description(description):
+    """نرمال‌سازی توضیحات برای کلید کش (یونیکد، فاصله‌ها و حروف)"""
+    text = unicodedata.normalize('NFKC', description)
+    # یکسان‌سازی ی/ک عربی و فارسی
+    text = text.replace('ي', 'ی').replace('ك', 'ک')
+    return ' '.join(text.split()).casefold()
+
+class ResponseCache:
+    """کش SQLite برای پاسخ‌های مدل با انقضای زمانی (TTL) و حذف بر اساس تعداد"""
+    
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._db.commit()
+    
+    @staticmethod
+    def make_key(description, template=SPICE_PROMPT_TEMPLATE, model=GEMINI_MODEL):
+        payload = json.dumps([normalize_description(description), template, model])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        now = time.time()
+        row = self._db.execute(
+            "SELECT response, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            if row is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+            self.misses += 1
+            METRICS.count('response_cache', result='miss')
+            return None
+        
+        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        self.hits += 1
+        METRICS.count('response_cache', result='hit')
+        return row[0]
+    
+    def put(self, key, response):
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) "
+                "VALUES (?, ?, ?, ?)", (key, response, now, now)
+            )
+            if self.ttl:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            # حذف قدیمی‌ترین دسترسی‌ها در صورت عبور از سقف تعداد
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+    
+    def clear(self):
+        with self._db:
+            self._db.execute("DELETE FROM responses")
+    
+    def stats(self):
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count}
+
+_response_cache = None
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+def clean_spice_response(text):
+    """حذف خطوط ``` (نشانه‌های بلوک کد) از پاسخ مدل"""
+    return re.sub(r'^\s*```.*$', '', text.strip(), flags=re.MULTILINE).strip()
+
+# --- تولید جریانی با پارس و اعتبارسنجی هم‌زمان ---
+
+STREAM_COMPONENT_TYPES = ('R', 'C', 'L', 'V', 'I', 'D', 'Q', 'M', 'U', 'X')
+_STREAM_NODE_RE = re.compile(r'[A-Za-z0-9_.:+\-]+')
+_STREAM_NAME_RE = re.compile(r'[A-Za-z][A-Za-z0-9_]*')
+
+class StreamAborted(Exception):
+    """خروجی مدل در میانه جریان نامعتبر تشخیص داده شد و تولید لغو شد"""
+    
+    def __init__(self, errors, partial_text):
+        super().__init__(errors[0] if errors else "stream aborted")
+        self.errors = errors
+        self.partial_text = partial_text
+
+class SpiceStreamParser:
+    """پارس افزایشی پاسخ جریانی مدل؛ هر قطعه به محض کامل شدن اعتبارسنجی می‌شود
+    
+    یک خط منطقی وقتی کامل است که خط بعدی (غیر «+») شروع شود یا جریان تمام شود.
+    قواعد با scope='component' روی هر قطعه بلافاصله اجرا می‌شوند؛ قواعد سطح نود
+    و توپولوژی به اعتبارسنجی کامل پس از پایان جریان واگذار می‌شوند.
+    """
+    
+    def __init__(self, abort_on_error=True, rules=None):
+        if rules is None:
+            rules = [rule_class() for rule_class in VALIDATION_RULES
+                     if rule_class.scope == 'component']
+        self.abort_on_error = abort_on_error
+        self.rules = rules
+        self.ctx = ValidationContext()
+        self.components = []
+        self.lines = []
+        self._buffer = ''
+        self._pending = None
+        self.finished = False    # پس از .end بقیه پاسخ لازم نیست و جریان بسته می‌شود
+    
+    @property
+    def errors(self):
+        return self.ctx.errors
+    
+    @property
+    def warnings(self):
+        return self.ctx.warnings
+    
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+    
+    def feed(self, chunk):
+        """افزودن یک تکه متن؛ خروجی قطعاتی که با این تکه کامل شدند"""
+        self._buffer += chunk
+        *complete, self._buffer = self._buffer.split('\n')
+        completed = []
+        for raw in complete:
+            self._raw_line(raw, completed)
+        return completed
+    
+    def close(self):
+        """پایان جریان: خط باقی‌مانده و خط منطقی در انتظار پردازش می‌شوند"""
+        completed = []
+        if self._buffer:
+            self._raw_line(self._buffer, completed)
+            self._buffer = ''
+        self._flush(completed)
+        return completed
+    
+    def _raw_line(self, raw, completed):
+        line = raw.strip()
+        if self.finished or not line or line.startswith('*') or line.startswith('```'):
+            return
+        if line.lower() == '.end':
+            self._flush(completed)
+            self.lines.append(line)
+            self.finished = True
+            return
+        if line.startswith('+'):
+            if self._pending is not None:
+                self._pending = f"{self._pending} {line[1:].strip()}"
+            self.lines.append(line)
+            return
+        self._flush(completed)
+        self._pending = line
+        self.lines.append(line)
+    
+    def _flush(self, completed):
+        line, self._pending = self._pending, None
+        if line is None or line.startswith('.'):
+            return
+        comp = self._check_line(line)
+        if comp is not None:
+            self.components.append(comp)
+            completed.append(comp)
+        if self.errors and self.abort_on_error:
+            raise StreamAborted(list(self.errors), self.text)
+    
+    def _check_line(self, line):
+        comp = parse_component_line(line)
+        # عنوان مدار یا جمله توضیحی مدل (مثل مسیر غیرجریانی) نادیده گرفته می‌شود؛
+        # فقط خطی که واقعاً قطعه است و نامعتبر است تولید را متوقف می‌کند
+        if comp is None or comp['type'] not in STREAM_COMPONENT_TYPES or \
+                not _STREAM_NAME_RE.fullmatch(comp['name']):
+            return None
+        nodes = component_nodes(comp)
+        bad = [node for node in nodes if not _STREAM_NODE_RE.fullmatch(node)]
+        if bad:
+            self.ctx.errors.append(f"❌ نام نود نامعتبر در {comp['name']}: {bad[0]}")
+            return None
+        self.ctx.component_count += 1
+        for rule in self.rules:
+            rule.check(comp, nodes, self.ctx)
+        return comp
+
+def _warm_up_drawing():
+    """بارگذاری پیش‌دستانه کتابخانه‌های رسم در پس‌زمینه هم‌زمان با تولید"""
+    try:
+        import matplotlib
+        import schemdraw
+        import schemdraw.elements
+    except ImportError:
+        pass
+
+def stream_spice_code(description, backend=None, on_component=None, abort_on_error=True):
+    """تولید جریانی کد SPICE؛ قطعات هنگام رسیدن پارس و اعتبارسنجی می‌شوند
+    
+    on_component برای هر قطعه کامل‌شده فراخوانی می‌شود. اگر خروجی نامعتبر باشد
+    جریان بلافاصله بسته می‌شود (توکن‌های باقی‌مانده تولید نمی‌شوند) و StreamAborted
+    بالا می‌رود. خروجی دیکشنری شامل کد، قطعات، هشدارها و زمان اولین قطعه است.
+    """
+    import threading
+    
+    backend = backend or get_llm_backend()
+    prompt = SPICE_PROMPT_TEMPLATE.format(description=description)
+    parser = SpiceStreamParser(abort_on_error)
+    warm_up = None
+    first_component = None
+    start = time.perf_counter()
+    
+    METRICS.count('llm_requests', model=backend.model)
+    with METRICS.span('llm', model=backend.model, stream=True) as span:
+        chunks = backend.stream(prompt)
+        try:
+            for chunk in chunks:
+                completed = parser.feed(chunk)
+                if completed and first_component is None:
+                    first_component = time.perf_counter() - start
+                    # رسم پس از پایان جریان لازم می‌شود؛ import سنگین از همین حالا شروع می‌شود
+                    warm_up = threading.Thread(target=_warm_up_drawing, daemon=True)
+                    warm_up.start()
+                if on_component:
+                    for comp in completed:
+                        on_component(comp)
+                if parser.finished:
+                    break
+            completed = parser.close()
+            if on_component:
+                for comp in completed:
+                    on_component(comp)
+        except StreamAborted:
+            METRICS.count('llm_stream_aborted', model=backend.model)
+            span.set(aborted=True, components=len(parser.components))
+            raise
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        span.set(components=len(parser.components), first_component=first_component)
+    
+    return {'spice_code': parser.text, 'components': parser.components,
+            'errors': parser.errors, 'warnings': parser.warnings,
+            'first_component_seconds': first_component,
+            'seconds': time.perf_counter() - start}
+
+def generate_spice_code(description, use_cache=True, backend=None, cache=None, stream=True):
+    """تولید کد SPICE با Gemini (با کش پایدار پاسخ‌ها؛ use_cache=False برای دور زدن کش)
+    
+    با stream=True پاسخ جریانی دریافت می‌شود و خروجی نامعتبر تولید را زودتر متوقف می‌کند.
+    """
+    try:
+        backend = backend or get_llm_backend()
+        prompt = SPICE_PROMPT_TEMPLATE.format(description=description)
+        
+        cache_key = None
+        spice_code = None
+        if use_cache:
+            cache = cache or get_response_cache()
+            cache_key = ResponseCache.make_key(description, SPICE_PROMPT_TEMPLATE, backend.model)
+            spice_code = cache.get(cache_key)
+        
+        cached = spice_code is not None
+        if cached:
+            print("⚡ پاسخ از کش بارگذاری شد.")
+        elif stream and hasattr(backend, 'stream'):
+            print("... درخواست به Gemini (جریانی) ...")
+            try:
+                result = stream_spice_code(
+                    description, backend,
+                    on_component=lambda comp: print(f"   ✔ {comp['name']}"))
+            except StreamAborted as e:
+                print("⛔ خروجی مدل نامعتبر بود؛ تولید متوقف شد:")
+                for error in e.errors:
+                    print(error)
+                return None
+            spice_code = result['spice_code']
+        else:
+            print("... درخواست به Gemini ...")
+            METRICS.count('llm_requests', model=backend.model)
+            with METRICS.span('llm', model=backend.model):
+                spice_code = clean_spice_response(backend.generate(prompt))
+        
+        if cache_key and spice_code and not cached:
+            # پاسخ نامعتبر کش نمی‌شود تا دفعه بعد دوباره تولید شود
+            check = {}
+            _check_generated(check, spice_code)
+            if check['status'] == 'ok':
+                cache.put(cache_key, spice_code)
+        
+        print("\n" + "="*40)
+        print("💡 کد SPICE:")
+        print("="*40)
+        print(spice_code)
+        print("="*40)
+
+        return spice_code
+    except Exception as e:
+        print(f"❌ خطا در تولید: {e}")
+        return None
+
+# --- تولید دسته‌ای ناهمگام (asyncio) با هم‌زمانی محدود ---
+
+class AsyncRateLimiter:
+    """محدودکننده نرخ سطل توکن: حداکثر rate درخواست در ثانیه با انفجار burst"""
+    
+    def __init__(self, rate, burst=None):
+        import asyncio
+        
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        import asyncio
+        
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+# --- دسته‌بندی چند توضیح در یک درخواست (پاسخ JSON ساخت‌یافته) ---
+
+SPICE_BATCH_SIZE = 10            # تعداد توضیح در هر درخواست دسته‌ای
+SPICE_BATCH_RETRIES = 2          # دفعات درخواست دوباره فقط برای موارد ناموفق
+SPICE_BATCH_MARKER = "ورودی‌ها (JSON):"
+SPICE_BATCH_INSTRUCTIONS = """
+برای هر مورد ورودی یک مدار مستقل تولید کنید. پاسخ فقط یک آرایه JSON باشد:
+[{"id": <شناسه مورد>, "spice": "<کد SPICE؛ خطوط با \\n جدا شوند>"}, ...]
+"""
+# طرح پاسخ برای مدل‌هایی که خروجی ساخت‌یافته پشتیبانی می‌کنند
+SPICE_BATCH_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {'id': {'type': 'integer'}, 'spice': {'type': 'string'}},
+        'required': ['id', 'spice'],
+    },
+}
+
+def build_batch_prompt(items):
+    """یک prompt برای چند توضیح؛ قوانین ثابت فقط یک بار فرستاده می‌شوند
+    
+    items لیست (شناسه، توضیح) است و پاسخ مورد انتظار مطابق SPICE_BATCH_SCHEMA.
+    """
+    payload = json.dumps([{'id': index, 'description': description} for index, description in items],
+                         ensure_ascii=False)
+    return f"{SPICE_PROMPT_RULES}{SPICE_BATCH_INSTRUCTIONS}\n{SPICE_BATCH_MARKER}\n{payload}\n"
+
+def _batch_prompt_items(prompt):
+    """موارد ورودی یک prompt دسته‌ای (None برای prompt تکی)"""
+    at = prompt.rfind(SPICE_BATCH_MARKER)
+    if at < 0:
+        return None
+    try:
+        return json.loads(prompt[at + len(SPICE_BATCH_MARKER):])
+    except ValueError:
+        return None
+
+def parse_batch_response(text):
+    """پاسخ دسته‌ای مدل → {شناسه: کد SPICE}؛ موارد بدشکل یا جاافتاده در خروجی نیستند"""
+    text = clean_spice_response(text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # متن اضافه قبل یا بعد از آرایه
+        start, end = text.find('['), text.rfind(']')
+        try:
+            data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+        except ValueError:
+            data = None
+    
+    codes = {}
+    for item in data if isinstance(data, list) else ():
+        if not isinstance(item, dict) or not isinstance(item.get('spice'), str):
+            continue
+        try:
+            codes[int(item.get('id'))] = clean_spice_response(item['spice'])
+        except (TypeError, ValueError):
+            continue
+    return codes
+
+def _check_generated(result, spice_code):
+    """پارس و اعتبارسنجی کد تولیدشده و ثبت وضعیت در دیکشنری نتیجه"""
+    result['spice_code'] = spice_code
+    components = parse_netlist(spice_code)
+    result['errors'], result['warnings'] = validate_components(components)
+    if not components:
+        result['status'] = 'empty'
+    elif result['errors']:
+        result['status'] = 'invalid'
+    else:
+        result['status'] = 'ok'
+
+def _chunked(iterable, size):
+    import itertools
+    
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+async def generate_spice_batch(descriptions, concurrency=8, rate=None, backend=None,
+                               use_cache=True, cache=None, batch_size=1, retries=SPICE_BATCH_RETRIES):
+    """تولید هم‌زمان کد SPICE برای چندین توضیح؛ نتایج به ترتیب اتمام yield می‌شوند
+    
+    هر نتیجه شامل کد SPICE و خروجی اعتبارسنجی است. descriptions می‌تواند یک
+    iterable طولانی باشد؛ فقط تعداد محدودی کار در هر لحظه در جریان است.
+    با batch_size > 1 هر batch_size توضیح در یک درخواست با پاسخ JSON فرستاده
+    می‌شوند و فقط موارد ناموفق (نامعتبر یا جاافتاده) تا retries بار دوباره
+    درخواست می‌شوند.
+    """
+    import asyncio
+    
+    backend = backend or get_llm_backend()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = AsyncRateLimiter(rate) if rate else None
+    if use_cache:
+        cache = cache or get_response_cache()
+    
+    async def run_one(index, description):
+        start = time.perf_counter()
+        result = {'index': index, 'description': description, 'spice_code': None,
+                  'status': 'ok', 'errors': [], 'warnings': [], 'cached': False}
+        async with semaphore:
+            try:
+                spice_code = None
+                if use_cache:
+                    cache_key = ResponseCache.make_key(description, SPICE_PROMPT_TEMPLATE, backend.model)
+                    spice_code = cache.get(cache_key)
+                    result['cached'] = spice_code is not None
+                
+                if spice_code is None:
+                    if limiter:
+                        await limiter.acquire()
+                    prompt = SPICE_PROMPT_TEMPLATE.format(description=description)
+                    METRICS.count('llm_requests', model=backend.model)
+                    with METRICS.span('llm', model=backend.model):
+                        spice_code = clean_spice_response(await backend.agenerate(prompt))
+                
+                _check_generated(result, spice_code)
+                # مثل مسیر دسته‌ای فقط مدارهای معتبر کش می‌شوند
+                if use_cache and not result['cached'] and result['status'] == 'ok':
+                    cache.put(cache_key, spice_code)
+            except Exception as e:
+                result['status'] = 'error'
+                result['errors'] = [f"{type(e).__name__}: {e}"]
+        
+        result['seconds'] = round(time.perf_counter() - start, 4)
+        return [result]
+    
+    async def run_chunk(chunk):
+        start = time.perf_counter()
+        results = {}
+        keys = {}
+        pending = []
+        for index, description in chunk:
+            result = results[index] = {
+                'index': index, 'description': description, 'spice_code': None, 'status': 'ok',
+                'errors': [], 'warnings': [], 'cached': False, 'attempts': 0}
+            if use_cache:
+                keys[index] = ResponseCache.make_key(description, SPICE_PROMPT_TEMPLATE, backend.model)
+                spice_code = cache.get(keys[index])
+                if spice_code is not None:
+                    result['cached'] = True
+                    _check_generated(result, spice_code)
+                    continue
+            pending.append(index)
+        
+        async with semaphore:
+            for attempt in range(retries + 1):
+                if not pending:
+                    break
+                if limiter:
+                    await limiter.acquire()
+                if attempt:
+                    METRICS.count('llm_batch_retries', len(pending), model=backend.model)
+                prompt = build_batch_prompt([(i, results[i]['description']) for i in pending])
+                METRICS.count('llm_requests', model=backend.model)
+                error = None
+                try:
+                    with METRICS.span('llm', model=backend.model, batch=len(pending)):
+                        codes = parse_batch_response(
+                            await backend.agenerate(prompt, SPICE_BATCH_SCHEMA))
+                except Exception as e:
+                    codes, error = {}, f"{type(e).__name__}: {e}"
+                
+                failed = []
+                for i in pending:
+                    result = results[i]
+                    result['attempts'] += 1
+                    if i in codes:
+                        _check_generated(result, codes[i])
+                    else:
+                        result['status'] = 'error' if error else 'missing'
+                        result['errors'] = [error or "❌ مدار این مورد در پاسخ دسته‌ای مدل نبود"]
+                    if result['status'] != 'ok':
+                        failed.append(i)
+                    elif use_cache:
+                        # فقط مدارهای معتبر کش می‌شوند؛ بقیه دوباره درخواست می‌شوند
+                        cache.put(keys[i], result['spice_code'])
+                pending = failed
+        
+        seconds = round(time.perf_counter() - start, 4)
+        for result in results.values():
+            result['seconds'] = seconds
+        return list(results.values())
+    
+    if batch_size > 1:
+        jobs = (run_chunk(chunk) for chunk in _chunked(enumerate(descriptions), batch_size))
+    else:
+        jobs = (run_one(index, description) for index, description in enumerate(descriptions))
+    
+    # پنجره لغزان از کارها تا ورودی‌های بسیار بزرگ یکجا در حافظه زمان‌بندی نشوند
+    window = max(1, concurrency * 2)
+    pending = set()
+    for job in jobs:
+        pending.add(asyncio.ensure_future(job))
+        if len(pending) >= window:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for result in task.result():
+                    yield result
+    
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            for result in task.result():
+                yield result
+
+def generate_spice_codes(descriptions, batch_size=SPICE_BATCH_SIZE, concurrency=4, backend=None,
+                         use_cache=True, retries=SPICE_BATCH_RETRIES):
+    """نسخه همگام تولید دسته‌ای برای کارهای انبوه؛ لیست نتایج به ترتیب ورودی"""
+    import asyncio
+    
+    async def collect():
+        return [result async for result in generate_spice_batch(
+            descriptions, concurrency, backend=backend, use_cache=use_cache,
+            batch_size=batch_size, retries=retries)]
+    
+    return sorted(asyncio.run(collect()), key=lambda result: result['index'])
+
+def run_generate_batch(input_path, output_path=None, concurrency=8, rate=None,
+                       backend=None, use_cache=True, batch_size=1, retries=SPICE_BATCH_RETRIES):
+    """اجرای تولید دسته‌ای از فایل توضیحات (یک توضیح در هر خط) و نوشتن JSON Lines"""
+    import asyncio
+    
+    def read_descriptions():
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+    
+    async def run():
+        counts = defaultdict(int)
+        out = open(output_path, 'w', encoding='utf-8') if output_path else sys.stdout
+        try:
+            async for result in generate_spice_batch(read_descriptions(), concurrency, rate,
+                                                     backend, use_cache, batch_size=batch_size,
+                                                     retries=retries):
+                counts[result['status']] += 1
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                out.flush()
+                if output_path:
+                    icon = '✅' if result['status'] == 'ok' else '❌'
+                    print(f"{icon} #{result['index']} ({result['seconds']}s) {result['description'][:30]}")
+        finally:
+            if output_path:
+                out.close()
+        return counts
+    
+    start = time.perf_counter()
+    counts = asyncio.run(run())
+    total = sum(counts.values())
+    print(f"\n📊 {counts['ok']}/{total} مدار معتبر در {time.perf_counter() - start:.2f} ثانیه",
+          file=sys.stderr)
+    return counts
+
+BATCH_BENCH_SIZES = (1, 5, 10, 20)
+
+def benchmark_prompt_batching(count=100, batch_sizes=BATCH_BENCH_SIZES, delay=0.3, char_delay=0.0002,
+                              concurrency=4, failure_rate=0.1, seed=0):
+    """مقایسه توان عملیاتی درخواست تکی (batch_size=1) و دسته‌ای روی مدل جعلی محلی
+    
+    مدل جعلی برای هر درخواست delay ثانیه (رفت و برگشت) و برای هر نویسه پاسخ
+    char_delay ثانیه صرف می‌کند؛ هر مدار با احتمال failure_rate نامعتبر است تا
+    مسیر درخواست دوباره هم اندازه‌گیری شود.
+    """
+    import random
+    
+    descriptions = [f"تقسیم‌کننده ولتاژ شماره {i} با مقاومت {100 + i} اهم" for i in range(count)]
+    rows = []
+    for batch_size in batch_sizes:
+        rng = random.Random(seed)
+        
+        def circuit():
+            return "R1 1 2" if rng.random() < failure_rate else STUB_SPICE_CODE
+        
+        def responder(prompt):
+            items = _batch_prompt_items(prompt)
+            if items is None:
+                return circuit()
+            return json.dumps([{'id': item['id'], 'spice': circuit()} for item in items])
+        
+        backend = StubBackend(responder, delay=delay, char_delay=char_delay)
+        print(f"⏳ batch_size={batch_size}", flush=True)
+        start = time.perf_counter()
+        results = generate_spice_codes(descriptions, batch_size, concurrency, backend, use_cache=False)
+        seconds = time.perf_counter() - start
+        rows.append({
+            'batch_size': batch_size,
+            'seconds': round(seconds, 4),
+            'per_second': round(count / seconds, 2),
+            'requests': backend.calls,
+            'prompt_chars': backend.prompt_chars,
+            'ok': sum(1 for r in results if r['status'] == 'ok'),
+            'retried': sum(1 for r in results if r.get('attempts', 1) > 1),
+            'count': count,
+        })
+    return rows
+
+def format_batching_benchmark(rows):
+    lines = [f"{'batch':>6}{'time [s]':>10}{'items/s':>10}{'requests':>10}"
+             f"{'prompt KiB':>12}{'ok':>7}{'retried':>9}"]
+    for r in rows:
+        lines.append(f"{r['batch_size']:>6}{r['seconds']:>10.2f}{r['per_second']:>10.1f}"
+                     f"{r['requests']:>10}{r['prompt_chars'] / 1024:>12.1f}"
+                     f"{r['ok']:>4}/{r['count']:<3}{r['retried']:>8}")
+    return '\n'.join(lines)
+
+# --- سرور محلی مدل جعلی (برای تست بدون شبکه و بدون هزینه) ---
+
+def serve_fake_model(host='127.0.0.1', port=8765, responder=None, delay=0.0):
+    """سرور HTTP ساده که به درخواست {"prompt", "model"} پاسخ {"text"} می‌دهد"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    
+    if responder is None:
+        responder = stub_spice_responder
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if delay:
+                time.sleep(delay)
+            text = responder(payload.get('prompt', '')) if callable(responder) else responder
+            body = json.dumps({'text': text}, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"🧪 مدل جعلی روی http://{host}:{server.server_address[1]} اجرا شد.")
+    return server
+
+# --- ۶. مثال‌های تستی ---
+def get_test_examples():
+    return {
+        '1': {
+            'name': 'مدار سادهی',
+            'code': """V1 1 0 12V
+R1 1 2 -100
+C1 2 0 100u
+"""
+        },
+        '2': {
+            'name': 'مدار با ترانزیستور',
+            'code': """V1 1 0 5V
+R1 1 2 10
+Q1 2 3 0 2N2222"""
+        },
+        '3': {
+            'name': 'مدار موازی',
+            'code': """V1 1 0 10V
+R1 1 2 100
+R2 1 2 200
+R3 2 0 300"""
+        },
+        '4': {
+            'name': 'مدار با دیود',
+            'code': """V1 1 0 12V
+R1 1 2 1k
+D1 2 3 1N4148
+R2 3 0 1k"""
+        },
+        '5': {
+            'name': 'مدار با آپ‌امپ',
+            'code': """V1 1 0 12V
+R1 1 2 10k
+U1 3 2 4 1 0 LM741
+R2 3 0 1k"""
+        },
+        '6': {
+            'name': 'مدار با IC 555 (تایمر)',
+            'code': """
+V1 1 0 9V
+R1 1 2 1k
+R2 2 3 1k
+U1 4 3 2 1 0 555
+C1 4 0 10u
+R3 4 0 10k"""
+        },
+        '7': {
+            'name': 'مدار با MOSFET',
+            'code': """V1 1 0 12V
+R1 1 2 100
+M1 2 3 0 0 IRF530
+R2 3 0 1k"""
+        },
+        '8': {
+            'name': 'مدار پیچیده',
+            'code': """V1 1 0 15V
+R1 1 2 1k
+D1 2 3 1N4007
+C1 3 4 100u
+U1 5 4 6 1 0 LM741
+R2 5 0 2k"""
+        }
+    }
+
+# --- کش رندر (کلید: هش آنچه روی شماتیک رسم می‌شود + تنظیمات رندر) ---
+
+# با تغییر منطق رسم، این نسخه را بالا ببرید تا ورودی‌های قدیمی کش نامعتبر شوند
+RENDER_CACHE_VERSION = 4
+RENDER_CACHE_DIR = '.render_cache'
+RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+class RenderCache:
+    """کش روی دیسک برای شماتیک‌های رندرشده با کلید محتوا و حذف LRU بر اساس حجم"""
+    
+    def __init__(self, directory=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # نام فایل → حجم، به ترتیب آخرین دسترسی
+        self._total = 0
+        
+        os.makedirs(directory, exist_ok=True)
+        existing = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                existing.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(existing):
+            self._entries[name] = size
+            self._total += size
+    
+    @staticmethod
+    def make_key(netlist, fmt='svg', **settings):
+        """کلید محتوا از قطعات نت‌لیست (متن یا قطعات پارس‌شده) و تنظیمات رندر
+        
+        نام، مقدار/مدل و نام نودها همان‌طور که نوشته شده‌اند در کلید می‌آیند، چون
+        روی شماتیک چاپ می‌شوند (1k و 1000 دو تصویر متفاوت‌اند). شکل متعارف
+        (canonical_hash) فقط برای تشخیص مدارهای تکراری است، نه کلید رندر.
+        """
+        if isinstance(netlist, str):
+            netlist = parse_netlist(netlist)
+        settings.update(fmt=fmt, version=RENDER_CACHE_VERSION)
+        payload = json.dumps([list(netlist), settings], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key, fmt='svg'):
+        """بایت‌های ذخیره‌شده یا None؛ در صورت hit ورودی تازه‌ترین می‌شود"""
+        name = f"{key}.{fmt}"
+        if name in self._entries:
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+                self._entries.move_to_end(name)
+                self.hits += 1
+                METRICS.count('render_cache', result='hit')
+                return data
+            except FileNotFoundError:
+                # توسط پروسه دیگری حذف شده است
+                self._total -= self._entries.pop(name)
+        self.misses += 1
+        METRICS.count('render_cache', result='miss')
+        return None
+    
+    def put(self, key, data, fmt='svg'):
+        name = f"{key}.{fmt}"
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        
+        self._add(name, len(data))
+    
+    def note(self, name):
+        """ثبت فایلی که پروسه کارگر در پوشه کش نوشته یا خوانده است
+        
+        کارگرهای batch_render بدون سقف حجم (max_bytes=None) می‌نویسند و ترتیب LRU و
+        حذف فقط در پروسه اصلی انجام می‌شود؛ وگرنه هر پروسه سقف را جداگانه حساب می‌کرد.
+        """
+        try:
+            size = os.path.getsize(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return
+        self._add(name, size)
+    
+    def _add(self, name, size):
+        if name in self._entries:
+            self._total -= self._entries.pop(name)
+        self._entries[name] = size
+        self._total += size
+        self._evict()
+    
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+    
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._total,
+        }
+
+_render_caches = {}
+
+def get_render_cache(directory=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+    """کش رندر مشترک برای هر پوشه و سقف حجم (یک نمونه در هر پروسه)"""
+    # سقف هم در کلید است تا کارگر fork‌شده نمونه سقف‌دار والد را به ارث نبرد
+    cache = _render_caches.get((directory, max_bytes))
+    if cache is None:
+        cache = _render_caches[directory, max_bytes] = RenderCache(directory, max_bytes)
+    return cache
+
+def show_image(data):
+    """نمایش تصویر PNG ذخیره‌شده در پنجره matplotlib"""
+    import matplotlib.pyplot as plt
+    import matplotlib.image as mpimg
+    
+    fig, ax = plt.subplots()
+    ax.imshow(mpimg.imread(io.BytesIO(data), format='png'))
+    ax.axis('off')
+    plt.show()
+
+# --- ۷. رندر بدون پنجره و پردازش دسته‌ای ---
+
+# پسوند فایل‌هایی که در حالت دسته‌ای به‌عنوان ورودی پذیرفته می‌شوند
+NETLIST_EXTENSIONS = ('.cir', '.net', '.sp', '.spice', '.ckt', '.txt', '.json')
+
+def read_netlist_file(path):
+    """متن نت‌لیست از یک فایل نت‌لیست یا فایل ذخیره‌شده circuit_*.json"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            return json.load(f)['spice_code']
+        return f.read()
+
+def render_schematic(components, fmt='svg', backend=None, stream=None, **options):
+    """رندر بدون پنجره شماتیک و برگرداندن بایت‌های SVG/PNG (None اگر قابل رسم نباشد)
+    
+    backend یکی از RENDER_BACKENDS است: matplotlib (پیش‌فرض schemdraw)، schemdraw-svg
+    (موتور SVG خود schemdraw، بدون matplotlib) یا svg (نویسنده داخلی از روی چیدمان).
+    اگر stream داده شود بایت‌ها در آن هم نوشته می‌شوند.
+    """
+    backend = backend or DEFAULT_RENDER_BACKEND
+    if backend not in RENDER_BACKEND_FORMATS:
+        raise ValueError(f"unknown render backend: {backend}")
+    if fmt not in RENDER_BACKEND_FORMATS[backend]:
+        raise ValueError(f"render backend {backend} cannot produce {fmt}")
+    
+    if backend == 'svg':
+        if options.get('require_source', True) and not any(c['type'] == 'V' for c in components):
+            return None
+        layout = options.get('layout')
+        if layout is None:
+            with METRICS.span('layout', components=len(components)):
+                layout = compute_layout(components)
+        with METRICS.span('render', format=fmt, backend=backend):
+            data = layout_to_svg(layout, options.get('ports', ()))
+    else:
+        if backend == 'schemdraw-svg':
+            options['canvas'] = 'svg'
+        d = build_schematic(components, **options)
+        if d is None:
+            return None
+        with METRICS.span('render', format=fmt, backend=backend):
+            data = d.get_imagedata(fmt)
+        # شکل matplotlib بسته می‌شود تا رندرهای پشت سر هم در یک پردازه حافظه جمع نکنند
+        figure = getattr(getattr(d, 'fig', None), 'fig', None)
+        if figure is not None:
+            import matplotlib.pyplot as plt
+            plt.close(figure)
+    
+    if stream is not None:
+        stream.write(data)
+    return data
+
+def render_hierarchy(netlist, fmt='svg', backend=None):
+    """رندر سلسله‌مراتبی: یک برگه برای سطح بالا و یک برگه برای هر تعریف .subckt
+    
+    نمونه‌ها به صورت قاب با نام پایه‌های تعریف رسم می‌شوند و هیچ بسطی انجام نمی‌شود،
+    پس اندازه خروجی به اندازه تعریف‌ها بستگی دارد نه تعداد قطعات تخت.
+    """
+    sheets = OrderedDict()
+    for name, components, pins in netlist.sheets():
+        if components:
+            sheets[name] = render_schematic(components, fmt, backend, require_source=False,
+                                            ports=pins)
+    return sheets
+
+def render_netlist_file(in_path, out_path, fmt='svg', cache_dir=None,
+                        cache_max_bytes=RENDER_CACHE_MAX_BYTES, backend=None):
+    """پارس، اعتبارسنجی و رندر یک فایل؛ خروجی دیکشنری وضعیت قابل pickle برای پردازش موازی"""
+    start = time.perf_counter()
+    result = {'input': in_path, 'output': None, 'status': 'ok', 'message': '', 'cached': False}
+    try:
+        if in_path.lower().endswith('.json'):
+            components = parse_netlist(read_netlist_file(in_path))
+        else:
+            components = list(iter_netlist_file(in_path))
+        
+        # کلید کش از خود قطعات: هر چه روی شماتیک نوشته می‌شود در کلید هست
+        cache = cache_key = None
+        if cache_dir:
+            cache = get_render_cache(cache_dir, cache_max_bytes)
+            cache_key = RenderCache.make_key(components, fmt=fmt,
+                                             backend=backend or DEFAULT_RENDER_BACKEND)
+            result['cache_entry'] = f"{cache_key}.{fmt}"
+            data = cache.get(cache_key, fmt)
+            if data is not None:
+                with open(out_path, 'wb') as f:
+                    f.write(data)
+                result['output'], result['cached'] = out_path, True
+                result['seconds'] = round(time.perf_counter() - start, 4)
+                return result
+        
+        errors, warnings = validate_components(components)
+        if not components:
+            result['status'], result['message'] = 'empty', "هیچ قطعه‌ای یافت نشد"
+        elif errors:
+            result['status'], result['message'] = 'invalid', ' | '.join(errors)
+        else:
+            data = render_schematic(components, fmt, backend)
+            if data is None:
+                result['status'], result['message'] = 'skipped', "منبع ولتاژ یافت نشد"
+            else:
+                with open(out_path, 'wb') as f:
+                    f.write(data)
+                if cache is not None:
+                    cache.put(cache_key, data, fmt)
+                result['output'] = out_path
+                result['message'] = f"{len(warnings)} هشدار" if warnings else ''
+    except Exception as e:
+        result['status'], result['message'] = 'error', f"{type(e).__name__}: {e}"
+    
+    result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+def _init_headless_worker():
+    """اطمینان از اینکه هیچ پروسه کارگری پنجره گرافیکی باز نمی‌کند"""
+    os.environ['MPLBACKEND'] = 'Agg'
+
+def _render_in_worker(*task):
+    """رندر در پروسه کارگر و برگرداندن رویدادهای ابزار دقیق همراه نتیجه"""
+    METRICS.reset()
+    result = render_netlist_file(*task)
+    result['metrics'] = METRICS.drain()
+    return result
+
+def collect_netlist_files(inputs):
+    """گسترش ورودی‌ها (فایل یا پوشه) به لیست مرتب فایل‌های نت‌لیست"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                path = os.path.join(item, name)
+                if os.path.isfile(path) and name.lower().endswith(NETLIST_EXTENSIONS):
+                    files.append(path)
+        else:
+            files.append(item)
+    return files
+
+def batch_render(inputs, out_dir, jobs=None, fmt='svg', cache_dir=None,
+                 cache_max_bytes=RENDER_CACHE_MAX_BYTES, backend=None):
+    """رندر موازی تعداد زیادی نت‌لیست با Process Pool و گزارش وضعیت هر فایل"""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    _init_headless_worker()
+    os.makedirs(out_dir, exist_ok=True)
+    files = collect_netlist_files(inputs)
+    if not files:
+        print("📁 هیچ فایل نت‌لیستی یافت نشد.")
+        return []
+    
+    # با چند پروسه، کارگرها بدون سقف در کش می‌نویسند و حساب حجم فقط در همین پروسه است
+    parallel = jobs != 1
+    tasks = []
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        tasks.append((path, os.path.join(out_dir, f"{stem}.{fmt}"), fmt, cache_dir,
+                      None if parallel else cache_max_bytes, backend))
+    
+    results = []
+    total = len(tasks)
+    icons = {'ok': '✅', 'invalid': '🚨', 'error': '❌'}
+    
+    def report(result):
+        results.append(result)
+        icon = icons.get(result['status'], '⚠️')
+        line = f"[{len(results)}/{total}] {icon} {result['input']} ({result['seconds']}s)"
+        if result['cached']:
+            line += " ⚡"
+        if result['message']:
+            line += f" - {result['message']}"
+        print(line)
+    
+    if not parallel:
+        for task in tasks:
+            report(render_netlist_file(*task))
+    else:
+        cache = get_render_cache(cache_dir, cache_max_bytes) if cache_dir else None
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_headless_worker) as pool:
+            futures = [pool.submit(_render_in_worker, *task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                METRICS.absorb(result.pop('metrics'))
+                if cache is not None and 'cache_entry' in result:
+                    cache.note(result['cache_entry'])
+                report(result)
+    
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    print(f"\n📊 {ok}/{total} شماتیک با موفقیت رندر شد.")
+    if cache_dir:
+        hits = sum(1 for r in results if r['cached'])
+        print(f"⚡ کش رندر: {hits} hit / {total - hits} miss")
+    return results
+
+# --- سرویس HTTP محلی (جلوی asyncio، صف کار محدود و Process Pool برای رندر) ---
+
+SERVICE_QUEUE_SIZE = 64          # بیشترین کار در انتظار؛ بیشتر از این پاسخ 429 می‌گیرد
+SERVICE_WORKERS = 8              # تعداد کارهای هم‌زمان (تولید، اعتبارسنجی، رندر)
+SERVICE_MAX_BODY = 4 * 2**20
+SERVICE_RETRY_AFTER = 1
+SERVICE_LATENCY_WINDOW = 10000   # تعداد آخرین تأخیرهای نگه‌داشته‌شده برای صدک‌ها
+SERVICE_MAX_PAGE_SIZE = 200
+# نام فایل مداری که کلاینت می‌فرستد: فقط نام ساده (بدون مسیر) با پسوند .json
+SERVICE_FILENAME_PATTERN = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.-]{0,127}\.json')
+SERVICE_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+                   405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+                   422: 'Unprocessable Entity', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+RENDER_CONTENT_TYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+class ServiceError(Exception):
+    """خطای قابل گزارش به کلاینت با کد وضعیت HTTP"""
+    
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+def _validate_text_in_worker(netlist_text):
+    """پارس (بدون include) و اعتبارسنجی متن نت‌لیست در پروسه کارگر سرویس"""
+    METRICS.reset()
+    components = parse_netlist(netlist_text)
+    report = run_validation(components)
+    return {'components': len(components), 'errors': report.errors, 'warnings': report.warnings,
+            'valid': bool(components) and not report.errors, 'metrics': METRICS.drain()}
+
+def _render_key_in_worker(netlist_text, fmt, backend):
+    """کلید کش رندر متن نت‌لیست در پروسه کارگر سرویس"""
+    components = parse_netlist(netlist_text)
+    return RenderCache.make_key(components, fmt=fmt, backend=backend)
+
+def _render_text_in_worker(netlist_text, fmt, backend=None):
+    """پارس (بدون include)، اعتبارسنجی و رندر متن نت‌لیست در پروسه کارگر سرویس"""
+    METRICS.reset()
+    result = {'status': 'ok', 'data': None, 'errors': [], 'warnings': []}
+    components = parse_netlist(netlist_text)
+    result['errors'], result['warnings'] = validate_components(components)
+    if not components:
+        result['status'] = 'empty'
+    elif result['errors']:
+        result['status'] = 'invalid'
+    else:
+        result['data'] = render_schematic(components, fmt, backend)
+        if result['data'] is None:
+            result['status'] = 'skipped'
+    result['metrics'] = METRICS.drain()
+    return result
+
+def _percentiles(values, points=(50, 95, 99)):
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {f"p{p}": ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+
+class CircuitService:
+    """سرویس HTTP/1.1 (keep-alive) برای تولید، اعتبارسنجی، رندر و فهرست مدارها
+    
+    درخواست‌های پرهزینه به صف محدودی می‌روند که تعداد ثابتی کارگر آن را خالی
+    می‌کنند؛ وقتی صف پر است درخواست بلافاصله با 429 و Retry-After رد می‌شود.
+    """
+    
+    def __init__(self, backend=None, queue_size=SERVICE_QUEUE_SIZE, workers=SERVICE_WORKERS,
+                 render_jobs=None, use_cache=True, render_cache_dir=RENDER_CACHE_DIR, store=None):
+        self.backend = backend or get_llm_backend()
+        self.queue_size = queue_size
+        self.workers = workers
+        self.render_jobs = render_jobs
+        self.use_cache = use_cache
+        self.render_cache_dir = render_cache_dir
+        self._store = store
+        self.latencies = defaultdict(lambda: deque(maxlen=SERVICE_LATENCY_WINDOW))
+        self.status_counts = Counter()
+        self.rejected = 0
+        self._queue = None
+        self._tasks = []
+        self._pool = None
+        self._server = None
+        self._routes = {
+            ('GET', '/health'): self.handle_health,
+            ('GET', '/stats'): self.handle_stats,
+            ('GET', '/metrics'): self.handle_metrics,
+            ('POST', '/generate'): self.handle_generate,
+            ('POST', '/validate'): self.handle_validate,
+            ('POST', '/render'): self.handle_render,
+            ('GET', '/circuits'): self.handle_list_circuits,
+            ('POST', '/circuits'): self.handle_add_circuit,
+        }
+    
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_circuit_store()
+        return self._store
+    
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()[:2] if self._server else None
+    
+    async def start(self, host='127.0.0.1', port=8080):
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+        
+        _init_headless_worker()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._pool = ProcessPoolExecutor(max_workers=self.render_jobs,
+                                         initializer=_init_headless_worker)
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self
+    
+    async def close(self):
+        import asyncio
+        
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+    
+    # --- صف کار و کارگرها ---
+    
+    async def submit(self, func, *args):
+        """قرار دادن یک کار در صف و انتظار برای نتیجه؛ صف پر = ServiceError(429)"""
+        import asyncio
+        
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((func, args, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            METRICS.count('service_rejected')
+            raise ServiceError(429, "server is busy, retry later",
+                               {'Retry-After': str(SERVICE_RETRY_AFTER)})
+        return await future
+    
+    async def _worker(self):
+        while True:
+            func, args, future, queued_at = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                self.latencies['queue_wait'].append(time.perf_counter() - queued_at)
+                try:
+                    result = await func(*args)
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
+    
+    # --- HTTP ---
+    
+    async def _read_request(self, reader):
+        """خواندن یک درخواست HTTP؛ None اگر اتصال بسته شده باشد"""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise ServiceError(400, "malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise ServiceError(400, "invalid Content-Length")
+        if length < 0:
+            raise ServiceError(400, "invalid Content-Length")
+        if length > SERVICE_MAX_BODY:
+            raise ServiceError(413, f"body larger than {SERVICE_MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+    
+    @staticmethod
+    def _response(status, body, content_type='application/json; charset=utf-8', headers=None,
+                  keep_alive=True):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        lines = [f"HTTP/1.1 {status} {SERVICE_REASONS.get(status, '')}",
+                 f"Content-Type: {content_type}",
+                 f"Content-Length: {len(body)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+    
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        from urllib.parse import urlsplit, parse_qs
+        
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ServiceError as e:
+                    writer.write(self._response(e.status, {'error': str(e)}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                url = urlsplit(target)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                
+                start = time.perf_counter()
+                route = url.path.rstrip('/') or '/'
+                # شناسه مدار و مسیرهای ناشناخته در برچسب نمی‌آیند تا تعداد سری‌های متریک محدود بماند
+                if route.startswith('/circuits/'):
+                    label = '/circuits/{id}'
+                elif any(path == route for _, path in self._routes):
+                    label = route
+                else:
+                    label = 'unmatched'
+                response_headers = {}
+                with METRICS.span('http_request', method=method, route=label) as span:
+                    try:
+                        status, payload, content_type = await self._dispatch(method, route, query, body)
+                    except ServiceError as e:
+                        status, payload = e.status, {'error': str(e)}
+                        content_type = 'application/json; charset=utf-8'
+                        response_headers = e.headers
+                    except Exception as e:
+                        status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+                        content_type = 'application/json; charset=utf-8'
+                    span.set(status=status)
+                
+                self.latencies[label].append(time.perf_counter() - start)
+                self.status_counts[status] += 1
+                METRICS.count('http_requests', route=label, status=status)
+                writer.write(self._response(status, payload, content_type, response_headers,
+                                            keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+    
+    async def _dispatch(self, method, route, query, body):
+        handler = self._routes.get((method, route))
+        if handler is None and route.startswith('/circuits/') and method == 'GET':
+            return await self.handle_get_circuit(route[len('/circuits/'):])
+        if handler is None:
+            if any(path == route for _, path in self._routes):
+                raise ServiceError(405, f"{method} not allowed on {route}")
+            raise ServiceError(404, f"no route for {route}")
+        if method == 'POST':
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError as e:
+                raise ServiceError(400, f"invalid JSON: {e}")
+            if not isinstance(data, dict):
+                raise ServiceError(400, "request body must be a JSON object")
+            result = await handler(data)
+        else:
+            result = await handler(query)
+        if isinstance(result, tuple):
+            return result
+        return 200, result, 'application/json; charset=utf-8'
+    
+    @staticmethod
+    def _require(data, key):
+        value = data.get(key)
+        if not isinstance(value, str) or not value.strip():
+            raise ServiceError(400, f"'{key}' (non-empty string) is required")
+        return value
+    
+    # --- مسیرها ---
+    
+    async def handle_health(self, query):
+        return {'status': 'ok', 'queued': self._queue.qsize(), 'capacity': self.queue_size}
+    
+    async def handle_stats(self, query):
+        """صدک‌های تأخیر هر مسیر (میلی‌ثانیه)، وضعیت صف و تعداد پاسخ‌ها به تفکیک کد"""
+        routes = {}
+        for route, values in self.latencies.items():
+            stats = {k: round(v * 1000, 3) for k, v in _percentiles(values).items()}
+            stats['count'] = len(values)
+            routes[route] = stats
+        return {'latency_ms': routes, 'queued': self._queue.qsize(), 'capacity': self.queue_size,
+                'workers': self.workers, 'rejected': self.rejected,
+                'responses': {str(k): v for k, v in sorted(self.status_counts.items())}}
+    
+    async def handle_metrics(self, query):
+        return 200, METRICS.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4'
+    
+    async def handle_generate(self, data):
+        description = self._require(data, 'description')
+        use_cache = self.use_cache and data.get('use_cache', True)
+        
+        async def generate():
+            results = [result async for result in generate_spice_batch(
+                [description], 1, None, self.backend, use_cache=use_cache)]
+            return results[0]
+        
+        result = await self.submit(generate)
+        result.pop('index', None)
+        return result
+    
+    async def handle_validate(self, data):
+        import asyncio
+        
+        netlist = self._require(data, 'netlist')
+        
+        # پارس و اعتبارسنجی در پروسه کارگر تا حلقه رویداد برای درخواست‌های دیگر آزاد بماند
+        async def validate():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, _validate_text_in_worker, netlist)
+        
+        result = await self.submit(validate)
+        METRICS.absorb(result.pop('metrics'))
+        return result
+    
+    async def handle_render(self, data):
+        import asyncio
+        
+        netlist = self._require(data, 'netlist')
+        fmt = data.get('format', 'svg')
+        if fmt not in RENDER_CONTENT_TYPES:
+            raise ServiceError(400, f"format must be one of {sorted(RENDER_CONTENT_TYPES)}")
+        backend = data.get('backend', DEFAULT_RENDER_BACKEND)
+        if fmt not in RENDER_BACKEND_FORMATS.get(backend, ()):
+            raise ServiceError(400, f"backend must be one of {list(RENDER_BACKENDS)} "
+                                    f"and support format {fmt}")
+        
+        cache = get_render_cache(self.render_cache_dir) if self.render_cache_dir else None
+        
+        # پارس برای کلید کش هم مثل رندر در پروسه کارگر انجام می‌شود، نه روی حلقه رویداد
+        async def render():
+            loop = asyncio.get_running_loop()
+            cache_key = None
+            if cache is not None:
+                cache_key = await loop.run_in_executor(self._pool, _render_key_in_worker, netlist,
+                                                       fmt, backend)
+                cached = cache.get(cache_key, fmt)
+                if cached is not None:
+                    return {'status': 'ok', 'data': cached, 'key': None,
+                            'metrics': {'events': [], 'counters': []}}
+            result = await loop.run_in_executor(self._pool, _render_text_in_worker, netlist, fmt,
+                                                backend)
+            result['key'] = cache_key
+            return result
+        
+        result = await self.submit(render)
+        cache_key = result.pop('key')
+        METRICS.absorb(result.pop('metrics'))
+        if result['status'] != 'ok':
+            return 422, {k: v for k, v in result.items() if k != 'data'}, \
+                'application/json; charset=utf-8'
+        if cache_key is not None:
+            cache.put(cache_key, result['data'], fmt)
+        return 200, result['data'], RENDER_CONTENT_TYPES[fmt]
+    
+    async def handle_list_circuits(self, query):
+        try:
+            page = int(query.get('page', 1))
+            page_size = int(query.get('page_size', 20))
+        except ValueError:
+            raise ServiceError(400, "page and page_size must be integers")
+        if page < 1:
+            raise ServiceError(400, "page must be at least 1")
+        page_size = max(1, min(page_size, SERVICE_MAX_PAGE_SIZE))
+        return {'circuits': self.store.search(query.get('q'), query.get('from'), query.get('to'),
+                                              query.get('type'), page, page_size)}
+    
+    async def handle_get_circuit(self, key):
+        circuit = self.store.get(key)
+        if circuit is None:
+            raise ServiceError(404, f"circuit {key} not found")
+        return 200, circuit, 'application/json; charset=utf-8'
+    
+    async def handle_add_circuit(self, data):
+        import asyncio
+        
+        description = data.get('description', '')
+        if not isinstance(description, str):
+            raise ServiceError(400, "'description' must be a string")
+        circuit_data = {'description': description,
+                        'spice_code': self._require(data, 'spice_code'),
+                        'date': datetime.now().isoformat(), 'version': '3.0'}
+        filename = data.get('filename')
+        if filename is not None and (not isinstance(filename, str)
+                                     or not SERVICE_FILENAME_PATTERN.fullmatch(filename)):
+            raise ServiceError(400, "'filename' must be a plain name like circuit_1.json")
+        
+        # پارس و هش متعارف در پروسه کارگر؛ فقط درج SQLite روی حلقه رویداد می‌ماند
+        async def add():
+            loop = asyncio.get_running_loop()
+            summary = await loop.run_in_executor(self._pool, summarize_netlist,
+                                                 circuit_data['spice_code'])
+            # بین بررسی و درج await نیست، پس از دو درخواست هم‌نام فقط یکی درج می‌شود
+            if filename is not None and self.store.get(filename) is not None:
+                raise ServiceError(409, f"circuit {filename} already exists")
+            return self.store.add(circuit_data, filename, summary)
+        
+        circuit_id = await self.submit(add)
+        return 201, {'id': circuit_id}, 'application/json; charset=utf-8'
+
+def run_service(host='127.0.0.1', port=8080, **options):
+    """اجرای سرویس HTTP تا Ctrl+C"""
+    import asyncio
+    
+    async def serve():
+        service = await CircuitService(**options).start(host, port)
+        bound_host, bound_port = service.address
+        print(f"🌐 سرویس روی http://{bound_host}:{bound_port} اجرا شد "
+              f"(صف {service.queue_size}، {service.workers} کارگر).")
+        try:
+            await service._server.serve_forever()
+        finally:
+            await service.close()
+    
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n👋 سرویس متوقف شد.")
+
+# --- آزمون بار محلی سرویس ---
+
+LOAD_TEST_PAYLOADS = {
+    'generate': lambda i: {'description': f"RC low-pass filter #{i}", 'use_cache': False},
+    'validate': lambda i: {'netlist': f"V1 1 0 5V\nR1 1 2 {i + 1}k\nC1 2 0 1u"},
+    'render': lambda i: {'netlist': f"V1 1 0 5V\nR1 1 2 {i + 1}k\nC1 2 0 1u"},
+}
+
+def run_load_test(url, endpoint='generate', requests=200, concurrency=32, payload=None,
+                  timeout=60):
+    """ارسال هم‌زمان درخواست‌ها با اتصال‌های keep-alive و گزارش توان عملیاتی و تأخیر"""
+    import http.client
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import urlsplit
+    
+    target = urlsplit(url)
+    make_payload = payload or LOAD_TEST_PAYLOADS[endpoint]
+    local = threading.local()
+    
+    def send(index):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection(
+                target.hostname, target.port or 80, timeout=timeout)
+        body = json.dumps(make_payload(index)).encode('utf-8')
+        start = time.perf_counter()
+        try:
+            connection.request('POST', f"/{endpoint}", body,
+                               {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            local.connection = None
+            status = 0
+        return status, time.perf_counter() - start
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(requests)))
+    elapsed = time.perf_counter() - start
+    
+    statuses = Counter(status for status, _ in results)
+    ok_latencies = [seconds for status, seconds in results if status == 200]
+    report = {'endpoint': endpoint, 'requests': requests, 'concurrency': concurrency,
+              'seconds': round(elapsed, 3), 'throughput_rps': round(requests / elapsed, 1),
+              'statuses': {str(k): v for k, v in sorted(statuses.items())}}
+    report['latency_ms'] = {k: round(v * 1000, 2) for k, v in _percentiles(ok_latencies).items()}
+    return report
+
+# --- ۸. تحلیل الکتریکی مدار (MNA) ---
+
+def is_ground(node):
+    return node == '0' or node.lower() == 'gnd'
+
+# پارامترهای مدل ساده دیود و ترانزیستور دوقطبی
+THERMAL_VOLTAGE = 0.025852
+DIODE_IS = 1e-14
+DIODE_N = 1.0
+BJT_IS = 1e-14
+BJT_BETA_F = 100.0
+BJT_BETA_R = 1.0
+PNP_MODELS = ('2N3906', '2N2907', 'BC557', 'BC558', 'BC327')
+GMIN = 1e-12
+
+def _pnjlim(v_new, v_old, vt, v_crit):
+    """محدودسازی تغییر ولتاژ پیوند بین دو تکرار نیوتن (مثل SPICE)"""
+    if v_new > v_crit and abs(v_new - v_old) > 2 * vt:
+        if v_old > 0:
+            arg = 1 + (v_new - v_old) / vt
+            return v_old + vt * math.log(arg) if arg > 0 else v_crit
+        return vt * math.log(v_new / vt)
+    return v_new
+
+class DCSolution:
+    """نقطه کار DC: ولتاژ نودها و جریان شاخه‌ها"""
+    
+    def __init__(self, node_voltages, branch_currents, iterations, converged, unsupported):
+        self.node_voltages = node_voltages
+        self.branch_currents = branch_currents
+        self.iterations = iterations
+        self.converged = converged
+        self.unsupported = unsupported
+    
+    def __repr__(self):
+        return (f"DCSolution(nodes={len(self.node_voltages)}, iterations={self.iterations}, "
+                f"converged={self.converged})")
+
+class MNASystem:
+    """ماتریس‌های تنک MNA یک نت‌لیست (بخش خطی یک بار ساخته می‌شود)
+    
+    مجهولات: ولتاژ نودهای غیر زمین و سپس جریان شاخه منابع ولتاژ و سلف‌ها.
+    سلف در DC اتصال کوتاه (منبع صفر ولت) و خازن مدار باز است.
+    """
+    
+    def __init__(self, components):
+        import numpy as np
+        
+        self.node_index = {}
+        self.components = list(components)
+        self.branch_index = {}
+        self.unsupported = []
+        self.resistors = []   # (name, a, b, R)
+        self.diodes = []      # (name, anode, cathode)
+        self.bjts = []        # (name, c, b, e, polarity)
+        
+        rows, cols, vals = [], [], []
+        sources = []  # (row, value)
+        currents = []  # (a, b, I)
+        branches = []  # (name, a, b, V)
+        
+        def node(name):
+            if is_ground(name):
+                return -1
+            idx = self.node_index.get(name)
+            if idx is None:
+                idx = self.node_index[name] = len(self.node_index)
+            return idx
+        
+        for comp in self.components:
+            ctype = comp['type']
+            nodes = [node(n) for n in component_nodes(comp)]
+            if ctype == 'R':
+                r = parse_spice_value(comp['value'])
+                self.resistors.append((comp['name'], nodes[0], nodes[1], r))
+            elif ctype in ['V', 'L']:
+                v = parse_spice_value(comp['value']) if ctype == 'V' else 0.0
+                branches.append((comp['name'], nodes[0], nodes[1], v))
+            elif ctype == 'I':
+                currents.append((nodes[0], nodes[1], parse_spice_value(comp['value'])))
+            elif ctype == 'C':
+                continue
+            elif ctype == 'D':
+                self.diodes.append((comp['name'], nodes[0], nodes[1]))
+            elif ctype == 'Q':
+                model = comp.get('value', '').upper()
+                polarity = -1.0 if 'PNP' in model or model in PNP_MODELS else 1.0
+                self.bjts.append((comp['name'], nodes[0], nodes[1], nodes[2], polarity))
+            else:
+                self.unsupported.append(comp['name'])
+        
+        n = len(self.node_index)
+        self.size = n + len(branches)
+        
+        # مقاومت‌ها (برداری)
+        if self.resistors:
+            a = np.array([r[1] for r in self.resistors])
+            b = np.array([r[2] for r in self.resistors])
+            g = 1.0 / np.array([r[3] for r in self.resistors])
+            self._append_conductances(rows, cols, vals, a, b, g)
+        
+        # gmin از هر نود به زمین تا ماتریس با نودهای شناور منفرد نشود
+        rows.append(np.arange(n))
+        cols.append(np.arange(n))
+        vals.append(np.full(n, GMIN))
+        
+        rhs = np.zeros(self.size)
+        for k, (name, a, b, v) in enumerate(branches):
+            row = n + k
+            self.branch_index[name] = row
+            for node_idx, sign in ((a, 1.0), (b, -1.0)):
+                if node_idx >= 0:
+                    rows.append(np.array([node_idx, row]))
+                    cols.append(np.array([row, node_idx]))
+                    vals.append(np.array([sign, sign]))
+            rhs[row] = v
+        
+        # جریان منبع I از n+ درون منبع به n- جاری است
+        for a, b, i in currents:
+            if a >= 0:
+                rhs[a] -= i
+            if b >= 0:
+                rhs[b] += i
+        
+        self.rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+        self.cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+        self.vals = np.concatenate(vals) if vals else np.zeros(0)
+        self.rhs = rhs
+    
+    @staticmethod
+    def _append_conductances(rows, cols, vals, a, b, g):
+        """افزودن برداری رسانایی‌های بین نودهای a و b (اندیس -1 یعنی زمین)"""
+        import numpy as np
+        
+        for p, q, sign in ((a, a, 1.0), (b, b, 1.0), (a, b, -1.0), (b, a, -1.0)):
+            mask = (p >= 0) & (q >= 0)
+            rows.append(p[mask])
+            cols.append(q[mask])
+            vals.append(sign * g[mask])
+    
+    def solve_linear(self, rows, cols, vals, rhs):
+        import numpy as np
+        try:
+            from scipy.sparse import csc_matrix
+            from scipy.sparse.linalg import spsolve
+        except ImportError:
+            # بدون SciPy: حل متراکم با NumPy (برای مدارهای کوچک کافی است)
+            matrix = np.zeros((self.size, self.size))
+            np.add.at(matrix, (rows, cols), vals)
+            return np.linalg.solve(matrix, rhs)
+        matrix = csc_matrix((vals, (rows, cols)), shape=(self.size, self.size))
+        return spsolve(matrix, rhs)
+
+def solve_dc(components, max_iterations=100, tolerance=1e-9):
+    """حل نقطه کار DC با MNA تنک؛ مدل‌های غیرخطی دیود/BJT با تکرار نیوتن"""
+    import numpy as np
+    
+    system = MNASystem(components)
+    vt = THERMAL_VOLTAGE
+    x = np.zeros(system.size)
+    
+    def voltage(vec, idx):
+        return vec[idx] if idx >= 0 else 0.0
+    
+    nonlinear = bool(system.diodes or system.bjts)
+    junctions = {}  # ولتاژ پیوندهای تکرار قبل برای محدودسازی
+    iterations, converged = 0, not nonlinear
+    diode_currents, bjt_currents = {}, {}
+    
+    for iterations in range(1, max_iterations + 1):
+        rows, cols, vals = [system.rows], [system.cols], [system.vals]
+        rhs = system.rhs.copy()
+        limited = False  # تا وقتی ولتاژ پیوندی محدود شده، همگرایی اعلام نمی‌شود
+        
+        def stamp(a, b, g, i_eq):
+            """رسانایی g بین a و b به همراه منبع جریان معادل i_eq از a به b"""
+            system._append_conductances(rows, cols, vals, np.array([a]), np.array([b]), np.array([g]))
+            if a >= 0:
+                rhs[a] -= i_eq
+            if b >= 0:
+                rhs[b] += i_eq
+        
+        def stamp_transconductance(out_a, out_b, ctrl_a, ctrl_b, gm):
+            """جریان gm·(V_ctrl_a - V_ctrl_b) از out_a به out_b"""
+            for r, sign_r in ((out_a, 1.0), (out_b, -1.0)):
+                for c, sign_c in ((ctrl_a, 1.0), (ctrl_b, -1.0)):
+                    if r >= 0 and c >= 0:
+                        rows.append(np.array([r]))
+                        cols.append(np.array([c]))
+                        vals.append(np.array([sign_r * sign_c * gm]))
+        
+        for name, a, c in system.diodes:
+            n_vt = DIODE_N * vt
+            v_crit = n_vt * math.log(n_vt / (math.sqrt(2) * DIODE_IS))
+            vd_raw = voltage(x, a) - voltage(x, c)
+            vd = _pnjlim(vd_raw, junctions.get(name, 0.0), n_vt, v_crit)
+            limited = limited or abs(vd - vd_raw) > 1e-9
+            junctions[name] = vd
+            exp_vd = math.exp(min(vd / n_vt, 80.0))
+            i_d = DIODE_IS * (exp_vd - 1)
+            g_d = DIODE_IS * exp_vd / n_vt + GMIN
+            diode_currents[name] = i_d
+            stamp(a, c, g_d, i_d - g_d * vd)
+        
+        for name, c, b, e, pol in system.bjts:
+            v_crit = vt * math.log(vt / (math.sqrt(2) * BJT_IS))
+            vbe_raw = pol * (voltage(x, b) - voltage(x, e))
+            vbc_raw = pol * (voltage(x, b) - voltage(x, c))
+            vbe = _pnjlim(vbe_raw, junctions.get(name + ':be', 0.0), vt, v_crit)
+            vbc = _pnjlim(vbc_raw, junctions.get(name + ':bc', 0.0), vt, v_crit)
+            limited = limited or abs(vbe - vbe_raw) > 1e-9 or abs(vbc - vbc_raw) > 1e-9
+            junctions[name + ':be'], junctions[name + ':bc'] = vbe, vbc
+            
+            # مدل Ebers-Moll (انتقالی)
+            ebe = math.exp(min(vbe / vt, 80.0))
+            ebc = math.exp(min(vbc / vt, 80.0))
+            i_t = BJT_IS * (ebe - ebc)
+            i_be = BJT_IS / BJT_BETA_F * (ebe - 1)
+            i_bc = BJT_IS / BJT_BETA_R * (ebc - 1)
+            g_be = BJT_IS / BJT_BETA_F * ebe / vt + GMIN
+            g_bc = BJT_IS / BJT_BETA_R * ebc / vt + GMIN
+            g_f = BJT_IS * ebe / vt
+            g_r = BJT_IS * ebc / vt
+            
+            ic = i_t - i_bc
+            ib = i_be + i_bc
+            bjt_currents[name] = (pol * ic, pol * ib)
+            
+            # دیودهای بیس-امیتر و بیس-کلکتور (در مختصات قطبیت)
+            if pol > 0:
+                stamp(b, e, g_be, i_be - g_be * vbe)
+                stamp(b, c, g_bc, i_bc - g_bc * vbc)
+                # منبع جریان انتقالی کلکتور → امیتر
+                stamp_transconductance(c, e, b, e, g_f)
+                stamp_transconductance(c, e, b, c, -g_r)
+                i_eq = i_t - g_f * vbe + g_r * vbc
+                if c >= 0:
+                    rhs[c] -= i_eq
+                if e >= 0:
+                    rhs[e] += i_eq
+            else:
+                stamp(e, b, g_be, i_be - g_be * vbe)
+                stamp(c, b, g_bc, i_bc - g_bc * vbc)
+                stamp_transconductance(e, c, e, b, g_f)
+                stamp_transconductance(e, c, c, b, -g_r)
+                i_eq = i_t - g_f * vbe + g_r * vbc
+                if e >= 0:
+                    rhs[e] -= i_eq
+                if c >= 0:
+                    rhs[c] += i_eq
+        
+        x_new = system.solve_linear(np.concatenate(rows), np.concatenate(cols),
+                                    np.concatenate(vals), rhs)
+        delta = np.max(np.abs(x_new - x)) if system.size else 0.0
+        x = x_new
+        if not nonlinear:
+            break
+        if not limited and delta < tolerance + 1e-6 * (np.max(np.abs(x)) if system.size else 0.0):
+            converged = True
+            break
+    
+    node_voltages = {'0': 0.0}
+    for name, idx in system.node_index.items():
+        node_voltages[name] = float(x[idx])
+    
+    branch_currents = {}
+    for name, a, b, r in system.resistors:
+        branch_currents[name] = float(voltage(x, a) - voltage(x, b)) / r
+    for name, row in system.branch_index.items():
+        # جریان ورودی به پایه + منبع (قرارداد SPICE)
+        branch_currents[name] = float(x[row])
+    for name, i_d in diode_currents.items():
+        branch_currents[name] = i_d
+    for name, (ic, ib) in bjt_currents.items():
+        branch_currents[f"{name}:c"] = ic
+        branch_currents[f"{name}:b"] = ib
+        branch_currents[f"{name}:e"] = -(ic + ib)
+    
+    return DCSolution(node_voltages, branch_currents, iterations, converged, system.unsupported)
+
+class OvercurrentRule(ValidationRule):
+    """حل DC در پایان گذر و هشدار برای جریان‌های بیش از حد (پیش‌فرض فعال نیست)"""
+    name = 'overcurrent'
+    
+    def __init__(self, max_current=1.0):
+        self.max_current = max_current
+        self.components = []
+    
+    def check(self, comp, nodes, ctx):
+        self.components.append(comp)
+    
+    def finish(self, ctx):
+        try:
+            solution = solve_dc(self.components)
+        except Exception as e:
+            ctx.warnings.append(f"⚠️ تحلیل DC ممکن نشد: {e}")
+            return
+        for name, current in solution.branch_currents.items():
+            if abs(current) > self.max_current:
+                ctx.warnings.append(
+                    f"⚠️ جریان {name} برابر {current:.3g}A از حد {self.max_current:g}A بیشتر است"
+                )
+
+class ACResult:
+    """نتیجه تحلیل AC: دامنه و فاز یک نود در طول جاروب فرکانسی"""
+    
+    def __init__(self, node, source, frequencies, response, unsupported):
+        import numpy as np
+        
+        self.node = node
+        self.source = source
+        self.frequencies = frequencies
+        self.response = response
+        self.magnitude = np.abs(response)
+        self.magnitude_db = 20 * np.log10(np.maximum(self.magnitude, 1e-300))
+        self.phase_deg = np.degrees(np.angle(response))
+        self.unsupported = unsupported
+    
+    def rows(self):
+        return zip(self.frequencies.tolist(), self.magnitude.tolist(),
+                   self.magnitude_db.tolist(), self.phase_deg.tolist())
+    
+    def to_csv(self, path):
+        import csv
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frequency_hz', 'magnitude', 'magnitude_db', 'phase_deg'])
+            writer.writerows(self.rows())
+        return path
+    
+    def to_json(self, path):
+        data = {
+            'node': self.node,
+            'source': self.source,
+            'frequency_hz': self.frequencies.tolist(),
+            'magnitude': self.magnitude.tolist(),
+            'magnitude_db': self.magnitude_db.tolist(),
+            'phase_deg': self.phase_deg.tolist(),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        return path
+
+def ac_matrices(components, source=None):
+    """ماتریس‌های G و C سیستم MNA سیگنال کوچک (A(ω) = G + jωC) و بردار تحریک
+    
+    منبع ولتاژ انتخاب‌شده (پیش‌فرض: اولین منبع ولتاژ) دامنه ۱ دارد، بقیه منابع
+    ولتاژ اتصال کوتاه و منابع جریان مدار باز هستند.
+    """
+    import numpy as np
+    
+    node_index = {}
+    for comp in components:
+        for name in component_nodes(comp):
+            if not is_ground(name) and name not in node_index:
+                node_index[name] = len(node_index)
+    
+    branch_comps = [c for c in components if c['type'] in ['V', 'L']]
+    if source is None:
+        source = next((c['name'] for c in branch_comps if c['type'] == 'V'), None)
+    if source is None:
+        raise ValueError("no voltage source to drive the AC sweep")
+    
+    n = len(node_index)
+    size = n + len(branch_comps)
+    G = np.zeros((size, size))
+    C = np.zeros((size, size))
+    b = np.zeros(size, dtype=complex)
+    unsupported = []
+    
+    def stamp(matrix, a, c, value):
+        ia = node_index.get(a)
+        ic = node_index.get(c)
+        if ia is not None:
+            matrix[ia, ia] += value
+        if ic is not None:
+            matrix[ic, ic] += value
+        if ia is not None and ic is not None:
+            matrix[ia, ic] -= value
+            matrix[ic, ia] -= value
+    
+    G[np.arange(n), np.arange(n)] += GMIN
+    row = n
+    for comp in components:
+        ctype = comp['type']
+        nodes = component_nodes(comp)
+        if ctype == 'R':
+            stamp(G, nodes[0], nodes[1], 1.0 / parse_spice_value(comp['value']))
+        elif ctype == 'C':
+            stamp(C, nodes[0], nodes[1], parse_spice_value(comp['value']))
+        elif ctype in ['V', 'L']:
+            for name, sign in ((nodes[0], 1.0), (nodes[1], -1.0)):
+                idx = node_index.get(name)
+                if idx is not None:
+                    G[idx, row] += sign
+                    G[row, idx] += sign
+            if ctype == 'L':
+                # V_a - V_b - jωL·I = 0
+                C[row, row] -= parse_spice_value(comp['value'])
+            elif comp['name'] == source:
+                b[row] = 1.0
+            row += 1
+        elif ctype == 'I':
+            continue
+        else:
+            unsupported.append(comp['name'])
+    
+    return node_index, G, C, b, source, unsupported
+
+def ac_sweep(components, node, f_start=1.0, f_stop=1e6, points=1000, source=None,
+             max_batch_elements=4_000_000):
+    """جاروب فرکانسی لگاریتمی؛ همه فرکانس‌ها با یک حل دسته‌ای NumPy (بدون حلقه پایتون)"""
+    import numpy as np
+    
+    components = list(components)
+    node_index, G, C, b, source, unsupported = ac_matrices(components, source)
+    if node not in node_index:
+        raise ValueError(f"unknown node: {node}")
+    
+    frequencies = np.logspace(np.log10(f_start), np.log10(f_stop), points)
+    omega = 2 * np.pi * frequencies
+    size = G.shape[0]
+    response = np.empty(points, dtype=complex)
+    target = node_index[node]
+    
+    # تقسیم فرکانس‌ها به دسته‌هایی که حافظه ماتریس‌های (F, n, n) محدود بماند
+    chunk = max(1, max_batch_elements // max(1, size * size))
+    rhs = b[:, None]
+    for start in range(0, points, chunk):
+        w = omega[start:start + chunk]
+        A = G[None, :, :] + 1j * w[:, None, None] * C[None, :, :]
+        x = np.linalg.solve(A, np.broadcast_to(rhs, (len(w), size, 1)))
+        response[start:start + chunk] = x[:, target, 0]
+    
+    return ACResult(node, source, frequencies, response, unsupported)
+
+def export_ac_result(result, base_path, fmt='csv'):
+    """ذخیره نتیجه AC کنار شماتیک: <نام>_ac.csv یا <نام>_ac.json"""
+    path = f"{os.path.splitext(base_path)[0]}_ac.{fmt}"
+    return result.to_json(path) if fmt == 'json' else result.to_csv(path)
+
+# --- جاروب پارامتری و مونت‌کارلو روی مقادیر قطعات ---
+
+# قطعاتی که مقدار عددی قابل جاروب دارند
+SWEEPABLE_TYPES = ('R', 'C', 'L', 'V', 'I')
+LINEAR_DC_TYPES = ('R', 'C', 'L', 'V', 'I')
+
+def parse_sweep_spec(text):
+    """تبدیل مشخصات جاروب متنی به آرایه مقادیر
+    
+    فرمت‌ها: lin:<شروع>:<پایان>:<تعداد>، log:<شروع>:<پایان>:<تعداد> یا
+    فهرست مقادیر جداشده با کاما (مثلاً 1k,2.2k,4.7k).
+    """
+    import numpy as np
+    
+    kind, _, rest = text.partition(':')
+    if kind in ('lin', 'log') and rest:
+        start, stop, count = rest.split(':')
+        start, stop = parse_spice_value(start), parse_spice_value(stop)
+        if kind == 'lin':
+            return np.linspace(start, stop, int(count))
+        return np.logspace(np.log10(start), np.log10(stop), int(count))
+    return np.array([parse_spice_value(v) for v in text.split(',')])
+
+def parse_tolerance(text):
+    """تلورانس نسبی از متن ('5%' یا '0.05')"""
+    text = text.strip()
+    if text.endswith('%'):
+        return float(text[:-1]) / 100
+    return float(text)
+
+class SweepResult:
+    """نتیجه جاروب: مقادیر هر نسخه، اعتبار آنها و ولتاژ نودها به شکل آرایه‌های انباشته"""
+    
+    def __init__(self, parameters, values, valid, node_names, voltages, elapsed):
+        self.parameters = parameters  # نام قطعات جاروب‌شده
+        self.values = values          # (تعداد نسخه‌ها، تعداد پارامترها)
+        self.valid = valid            # ماسک نسخه‌های معتبر
+        self.node_names = node_names
+        self.voltages = voltages      # (تعداد نسخه‌ها، تعداد نودها)؛ NaN برای نسخه‌های نامعتبر
+        self.elapsed = elapsed
+    
+    def summary(self, percentiles=(1, 50, 99)):
+        """آمار خلاصه ولتاژ هر نود روی نسخه‌های معتبر"""
+        import numpy as np
+        
+        good = self.voltages[self.valid]
+        stats = {
+            'variants': int(len(self.valid)),
+            'valid': int(self.valid.sum()),
+            'seconds': round(self.elapsed, 4),
+            'nodes': {},
+        }
+        if not len(good):
+            return stats
+        pct = np.percentile(good, percentiles, axis=0)
+        for j, name in enumerate(self.node_names):
+            column = good[:, j]
+            entry = {
+                'mean': float(column.mean()),
+                'std': float(column.std()),
+                'min': float(column.min()),
+                'max': float(column.max()),
+            }
+            for p, row in zip(percentiles, pct):
+                entry[f"p{p}"] = float(row[j])
+            stats['nodes'][name] = entry
+        return stats
 
-def draw_single_component(d, comp, direction='right'):
-    """رسم یک قطعه منفرد"""
-    comp_type = comp['type']
-    comp_name = comp['name']
-    comp_value = comp['value']
-    label = f"{comp_name}\\n{comp_value}"
+def build_variant_values(components, sweeps=None, tolerances=None, samples=1000,
+                         distribution='uniform', seed=None):
+    """ساخت ماتریس مقادیر همه نسخه‌ها یک‌جا (شبکه جاروب × نمونه‌های مونت‌کارلو)"""
+    import numpy as np
     
-    if comp_type == 'R':
-        elm_obj = elm.Resistor()
-    elif comp_type == 'C':
-        elm_obj = elm.Capacitor()
-    elif comp_type == 'L':
-        elm_obj = elm.Inductor2()
-    elif comp_type == 'D':
-        value_lower = comp_value.lower()
-        if 'zener' in value_lower:
-            elm_obj = elm.Zener()
-        else:
-            elm_obj = elm.Diode()
-    elif comp_type == 'Q':
-        elm_obj = elm.BjtNpn()
-    elif comp_type == 'M':
-        elm_obj = elm.NFet()
-    elif comp_type in ['U', 'X']:
-        value_lower = comp_value.lower()
-        if 'opamp' in value_lower or '741' in value_lower or 'lm' in value_lower or 'tl' in value_lower:
-            # آپ‌امپ
-            elm_obj = elm.Opamp()
+    sweeps = sweeps or {}
+    tolerances = tolerances or {}
+    by_name = {c['name']: c for c in components}
+    for name in list(sweeps) + list(tolerances):
+        if name not in by_name or by_name[name]['type'] not in SWEEPABLE_TYPES:
+            raise ValueError(f"cannot sweep component: {name}")
+    
+    parameters = list(dict.fromkeys(list(sweeps) + list(tolerances)))
+    nominal = np.array([parse_spice_value(by_name[name]['value']) for name in parameters])
+    
+    # شبکه دکارتی مقادیر جاروب
+    grids = [np.asarray(sweeps[name], dtype=float) for name in sweeps]
+    grid_size = int(np.prod([len(g) for g in grids])) if grids else 1
+    repeats = samples if tolerances else 1
+    count = grid_size * repeats
+    values = np.tile(nominal, (count, 1))
+    if grids:
+        mesh = np.meshgrid(*grids, indexing='ij')
+        for j, column in enumerate(mesh):
+            values[:, j] = np.repeat(column.ravel(), repeats)
+    
+    rng = np.random.default_rng(seed)
+    for name, tol in tolerances.items():
+        j = parameters.index(name)
+        if distribution == 'gauss':
+            # تلورانس به‌عنوان ۳σ
+            factor = 1 + rng.normal(0.0, tol / 3, count)
         else:
-            # IC - خط ساده با باکس در وسط
-            if direction == 'right':
-                # خط شروع
-                d.add(elm.Line().right().length(0.5))
-                box_start_x = d.here[0]
-                box_start_y = d.here[1]
-                
-                # رسم مستطیل با push/pop
-                d.push()
-                d.add(elm.Line().up().length(0.8))
-                d.add(elm.Line().right().length(2))
-                d.add(elm.Line().down().length(1.6))
-                d.add(elm.Line().left().length(2))
-                d.add(elm.Line().up().length(0.8))
-                d.pop()
-                
-                # لیبل در وسط
-                d.add(elm.Label().at((box_start_x + 1, box_start_y)).label(label))
-                
-                # ادامه خط - حرکت دستی
-                d.here = (box_start_x + 2, box_start_y)
-                d.add(elm.Line().right().length(0.5))
-            else:
-                # خط شروع
-                d.add(elm.Line().left().length(0.5))
-                box_start_x = d.here[0]
-                box_start_y = d.here[1]
-                
-                # رسم مستطیل
-                d.push()
-                d.add(elm.Line().up().length(0.8))
-                d.add(elm.Line().left().length(2))
-                d.add(elm.Line().down().length(1.6))
-                d.add(elm.Line().right().length(2))
-                d.add(elm.Line().up().length(0.8))
-                d.pop()
-                
-                # لیبل در وسط
-                d.add(elm.Label().at((box_start_x - 1, box_start_y)).label(label))
-                
-                # ادامه خط
-                d.here = (box_start_x - 2, box_start_y)
-                d.add(elm.Line().left().length(0.5))
-            
-            return
-    else:
-        elm_obj = elm.Resistor()
+            factor = 1 + rng.uniform(-tol, tol, count)
+        values[:, j] *= factor
     
-    if direction == 'right':
-        d.add(elm_obj.right().label(label))
-    else:
-        d.add(elm_obj.left().label(label))
+    return parameters, values
 
-def draw_parallel_group(d, group, direction='right'):
-    """رسم گروه موازی"""
-    start_pos = d.here
-    spacing = 2.0
-    length = 3.0
+def _stacked_linear_dc(components, parameters, values, max_batch_elements=4_000_000):
+    """حل DC همه نسخه‌های یک مدار خطی به صورت آرایه‌های انباشته (K, n, n)
+    
+    بخش ثابت ماتریس یک بار ساخته می‌شود و رسانایی مقاومت‌ها با scatter-add در
+    چهار درایه هر مقاومت اضافه می‌شود (O(K·r))؛ نسخه‌ها مثل ac_sweep دسته‌دسته
+    حل می‌شوند تا حافظه (K, n, n) محدود بماند.
+    """
+    import numpy as np
+    
+    node_index = {}
+    for comp in components:
+        for name in component_nodes(comp):
+            if not is_ground(name) and name not in node_index:
+                node_index[name] = len(node_index)
+    
+    count = len(values)
+    column = {name: j for j, name in enumerate(parameters)}
     
-    # رسم اولین شاخه
-    draw_single_component(d, group[0], direction)
-    end_pos = d.here
+    def per_variant(comp):
+        """مقدار قطعه برای همه نسخه‌ها (ثابت اگر جاروب نشده باشد)"""
+        j = column.get(comp['name'])
+        if j is None:
+            return np.full(count, parse_spice_value(comp['value']))
+        return values[:, j]
     
-    # رسم بقیه شاخه‌ها
-    for idx, comp in enumerate(group[1:], start=1):
-        d.push()
-        d.move_from(start_pos)
-        d.add(elm.Line().down().length(spacing * idx))
-        draw_single_component(d, comp, direction)
-        d.add(elm.Line().up().toy(end_pos[1]))
-        d.pop()
+    resistors = [c for c in components if c['type'] == 'R']
+    branches = [c for c in components if c['type'] in ['V', 'L']]
+    n = len(node_index)
+    size = n + len(branches)
     
-    d.move_from(end_pos)
+    # درایه‌های مهر هر مقاومت: (a,a)، (b,b) با علامت + و (a,b)، (b,a) با علامت −
+    positions, signs, owners = [], [], []
+    conductance = np.empty((count, len(resistors)))
+    for r, comp in enumerate(resistors):
+        a, b = (node_index.get(name) for name in component_nodes(comp))
+        for i, j, sign in ((a, a, 1.0), (b, b, 1.0), (a, b, -1.0), (b, a, -1.0)):
+            if i is not None and j is not None:
+                positions.append(i * size + j)
+                signs.append(sign)
+                owners.append(r)
+        conductance[:, r] = 1.0 / per_variant(comp)
+    positions = np.array(positions, dtype=np.intp)
+    signs = np.array(signs)
+    owners = np.array(owners, dtype=np.intp)
+    
+    # بخش مشترک همه نسخه‌ها: GMIN و ستون/سطر شاخه‌های منبع ولتاژ و سلف
+    base = np.zeros((size, size))
+    base[np.arange(n), np.arange(n)] = GMIN
+    rhs = np.zeros((count, size))
+    for k, comp in enumerate(branches):
+        row = n + k
+        a, b = component_nodes(comp)
+        for name, sign in ((a, 1.0), (b, -1.0)):
+            if name in node_index:
+                base[node_index[name], row] += sign
+                base[row, node_index[name]] += sign
+        if comp['type'] == 'V':
+            rhs[:, row] = per_variant(comp)
+    
+    for comp in components:
+        if comp['type'] == 'I':
+            a, b = component_nodes(comp)
+            current = per_variant(comp)
+            if a in node_index:
+                rhs[:, node_index[a]] -= current
+            if b in node_index:
+                rhs[:, node_index[b]] += current
+    
+    solution = np.empty((count, n))
+    chunk = max(1, max_batch_elements // max(1, size * size))
+    for start in range(0, count, chunk):
+        stop = min(count, start + chunk)
+        matrices = np.repeat(base[None, :, :], stop - start, axis=0)
+        np.add.at(matrices.reshape(stop - start, size * size), (slice(None), positions),
+                  conductance[start:stop, owners] * signs)
+        solution[start:stop] = np.linalg.solve(matrices, rhs[start:stop, :, None])[:, :n, 0]
+    return list(node_index), solution
 
-# --- ۳. توابع Save و Load ---
+def _solve_variant(components, overrides):
+    """حل DC یک نسخه (برای مدارهای غیرخطی در Process Pool)"""
+    patched = [dict(c, value=repr(overrides[c['name']])) if c['name'] in overrides else c
+               for c in components]
+    solution = solve_dc(patched)
+    return solution.node_voltages if solution.converged else None
 
-def save_circuit(spice_code, description="", filename=None):
-    """ذخیره مدار"""
-    if not filename:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"circuit_{timestamp}.json"
+def run_sweep(components, sweeps=None, tolerances=None, samples=1000, distribution='uniform',
+              seed=None, jobs=None):
+    """جاروب پارامتری / مونت‌کارلو: اعتبارسنجی و حل DC همه نسخه‌ها و آمار خلاصه
     
-    circuit_data = {
-        'description': description,
-        'spice_code': spice_code,
-        'date': datetime.now().isoformat(),
-        'version': '3.0'
-    }
+    مدارهای خطی با یک حل دسته‌ای NumPy و مدارهای دارای دیود/ترانزیستور
+    با Process Pool (هر نسخه یک حل نیوتن) ارزیابی می‌شوند.
+    """
+    import numpy as np
     
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(circuit_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ مدار در '{filename}' ذخیره شد.")
-        return filename
-    except Exception as e:
-        print(f"❌ خطا در ذخیره: {e}")
-        return None
-
-def load_circuit(filename):
-    """بارگذاری مدار"""
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            circuit_data = json.load(f)
-        
-        print(f"✅ مدار از '{filename}' بارگذاری شد.")
-        print(f"📝 توضیحات: {circuit_data.get('description', 'ندارد')}")
-        print(f"📅 تاریخ: {circuit_data.get('date', 'نامشخص')}")
+    start = time.perf_counter()
+    components = [c.to_dict() if isinstance(c, ComponentView) else c for c in components]
+    parameters, values = build_variant_values(components, sweeps, tolerances, samples,
+                                              distribution, seed)
+    
+    # اعتبارسنجی ساختاری یک بار؛ قواعد مقداری به شکل برداری روی همه نسخه‌ها
+    errors, _ = validate_components(components)
+    valid = np.full(len(values), not errors)
+    types = [next(c['type'] for c in components if c['name'] == name) for name in parameters]
+    for j, ctype in enumerate(types):
+        if ctype in ['R', 'C', 'L']:
+            valid &= values[:, j] > 0
+    
+    if all(c['type'] in LINEAR_DC_TYPES for c in components):
+        node_names, voltages = _stacked_linear_dc(components, parameters, values)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
         
-        return circuit_data['spice_code']
-    except FileNotFoundError:
-        print(f"❌ فایل '{filename}' یافت نشد.")
-        return None
-    except Exception as e:
-        print(f"❌ خطا در بارگذاری: {e}")
-        return None
+        overrides = [dict(zip(parameters, row.tolist())) for row in values]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            solutions = list(pool.map(_solve_variant, [components] * len(overrides), overrides,
+                                      chunksize=max(1, len(overrides) // 64)))
+        node_names = sorted({name for s in solutions if s for name in s if not is_ground(name)})
+        voltages = np.full((len(values), len(node_names)), np.nan)
+        for k, solution in enumerate(solutions):
+            if solution is None:
+                valid[k] = False
+                continue
+            voltages[k] = [solution.get(name, np.nan) for name in node_names]
+    
+    voltages = np.where(valid[:, None], voltages, np.nan)
+    return SweepResult(parameters, values, valid, node_names, voltages,
+                       time.perf_counter() - start)
+
+# --- بنچمارک زمان شروع برنامه ---
+
+# ماژول‌های سنگینی که دستورات غیر LLM و غیر صوتی نباید بارگذاری کنند
+HEAVY_MODULES = ('google.genai', 'speech_recognition', 'schemdraw', 'matplotlib', 'numpy', 'scipy')
+STARTUP_BUDGET_SECONDS = 1.0
 
-def list_saved_circuits():
-    """لیست مدارهای ذخیره شده"""
-    import glob
-    circuits = glob.glob("circuit_*.json")
+def startup_report(command=('list',), runs=5, top=20):
+    """اندازه‌گیری زمان شروع یک دستور خط فرمان با python -X importtime"""
+    import subprocess
+    import tempfile
     
-    if not circuits:
-        print("📁 هیچ مدار ذخیره‌شده‌ای یافت نشد.")
-        return []
+    script = os.path.abspath(__file__)
+    walls = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(runs):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, '-X', 'importtime', script, *command],
+                                  capture_output=True, text=True, cwd=workdir)
+            walls.append(time.perf_counter() - start)
     
-    print("\n📁 مدارهای ذخیره شده:")
-    print("-" * 50)
-    for i, circuit in enumerate(circuits, 1):
-        try:
-            with open(circuit, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            desc = data.get('description', 'بدون توضیحات')[:30]
-            date = data.get('date', 'نامشخص')[:10]
-            print(f"{i}. {circuit} - {desc} ({date})")
-        except:
-            print(f"{i}. {circuit} - خطا در خواندن")
-    print("-" * 50)
+    # فرمت هر خط: import time: <self us> | <cumulative us> | <name>
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = [f.strip() for f in line[len('import time:'):].split('|')]
+        if len(fields) != 3 or not fields[0].isdigit():
+            continue
+        modules.append((fields[2].strip(), int(fields[0]), int(fields[1])))
     
-    return circuits
+    names = {name for name, _, _ in modules}
+    heavy = sorted(name for name in names
+                   if any(name == h or name.startswith(h + '.') for h in HEAVY_MODULES))
+    walls.sort()
+    return {
+        'command': ' '.join(command),
+        'python': sys.version.split()[0],
+        'runs': runs,
+        'wall_min_s': round(walls[0], 4),
+        'wall_median_s': round(walls[len(walls) // 2], 4),
+        'imports_total_us': sum(self_us for _, self_us, _ in modules),
+        'module_count': len(modules),
+        'heavy_modules': heavy,
+        'top_cumulative': sorted(((name, cum) for name, _, cum in modules),
+                                 key=lambda item: -item[1])[:top],
+        'exit_code': proc.returncode,
+    }
 
-# --- ۴. تابع تشخیص گفتار ---
-def get_description_from_voice():
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("🎙️ لطفاً توضیحات مدار را بیان کنید:")
-        r.adjust_for_ambient_noise(source)
-        try:
-            audio = r.listen(source, timeout=10)
-            print("... در حال تشخیص گفتار ...")
-            text = r.recognize_google(audio, language="fa-IR")
-            print(f"✅ تشخیص: {text}")
-            return text
-        except Exception as e:
-            print(f"❌ خطا در تشخیص گفتار: {e}")
-            return None
+def format_startup_report(report):
+    lines = [
+        f"# startup report: prg {report['command']}",
+        f"python {report['python']}, {report['runs']} runs",
+        f"wall time: min {report['wall_min_s']:.3f}s, median {report['wall_median_s']:.3f}s",
+        f"imports: {report['module_count']} modules, {report['imports_total_us'] / 1000:.1f} ms self time",
+        f"heavy modules loaded: {', '.join(report['heavy_modules']) or 'none'}",
+        "",
+        f"{'cumulative [us]':>16} | module",
+    ]
+    for name, cumulative in report['top_cumulative']:
+        lines.append(f"{cumulative:>16} | {name}")
+    return '\n'.join(lines) + '\n'
 
-# --- ۵. تولید کد SPICE ---
-def generate_spice_code(description):
-    """تولید کد SPICE با Gemini"""
-    try:
-        client = genai.Client()
-        prompt = f"""
-شما متخصص تحلیل مدار هستید. فقط کد SPICE تولید کنید.
+# --- مجموعه بنچمارک مراحل پردازش با نت‌لیست‌های مصنوعی ---
 
-قوانین:
-1. فقط کد SPICE خالص
-2. نام نودها فقط عدد (0, 1, 2, ...)
-3. فرمت‌ها:
-   - R<نام> <نود1> <نود2> <مقدار>
-   - C<نام> <نود1> <نود2> <مقدار>  
-   - L<نام> <نود1> <نود2> <مقدار>
-   - V<نام> <نود+> <نود-> <مقدار>
-   - D<نام> <آند> <کاتد> <مدل>
-   - Q<نام> <کلکتور> <بیس> <امیتر> <مدل>
-   - M<نام> <درین> <گیت> <سورس> <بادی> <مدل>
+BENCHMARK_KINDS = ('ladder', 'mesh', 'random', 'transistor_chain')
+BENCHMARK_SIZES = (10, 1000, 10000)
+BENCHMARK_BASELINE_PATH = os.path.join('benchmarks', 'baseline.json')
+BENCHMARK_THRESHOLD = 0.5           # کندتر شدن بیش از ۵۰٪ نسبت به خط پایه = پسرفت
+BENCHMARK_MIN_DELTA_SECONDS = 0.005  # اختلاف‌های کوچک‌تر از این نویز حساب می‌شوند
+BENCHMARK_RENDER_LIMIT = 200         # رندر برای نت‌لیست‌های بزرگ‌تر از این اجرا نمی‌شود
 
-توضیحات: {description}
-"""
-        print("... درخواست به Gemini ...")
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
+def generate_netlist(kind, size, seed=0):
+    """تولید نت‌لیست مصنوعی با حدود size قطعه (ladder، mesh، random، transistor_chain)"""
+    import random
+    
+    rng = random.Random(seed)
+    lines = [f"* synthetic {kind} netlist, {size} components", "V1 1 0 DC 12"]
+    
+    if kind == 'ladder':
+        # نردبان R سری و R موازی با زمین
+        for k in range(1, max(1, (size - 1) // 2) + 1):
+            lines.append(f"RS{k} {k} {k + 1} {rng.choice(['1k', '2.2k', '4.7k'])}")
+            lines.append(f"RP{k} {k + 1} 0 {rng.choice(['10k', '22k', '47k'])}")
+    
+    elif kind == 'mesh':
+        # شبکه مربعی مقاومت‌ها؛ گوشه مقابل به زمین
+        side = max(2, math.isqrt(max(1, (size - 1) // 2)) + 1)
         
-        spice_code = response.text.strip()
-        spice_code = re.sub(r'```[\s\S]*?```', '', spice_code).strip()
+        def node(r, c):
+            return str(1 + r * side + c)
         
-        print("\n" + "="*40)
-        print("💡 کد SPICE:")
-        print("="*40)
-        print(spice_code)
-        print("="*40)
+        for r in range(side):
+            for c in range(side):
+                if c + 1 < side:
+                    lines.append(f"RH{r}_{c} {node(r, c)} {node(r, c + 1)} 1k")
+                if r + 1 < side:
+                    lines.append(f"RV{r}_{c} {node(r, c)} {node(r + 1, c)} 1k")
+        lines.append(f"RG {node(side - 1, side - 1)} 0 1k")
+    
+    elif kind == 'random':
+        # گراف تصادفی همبند: هر نود جدید به یک نود قبلی وصل می‌شود، بقیه یال‌ها تصادفی
+        nodes = max(2, size // 3)
+        for k in range(2, nodes + 1):
+            lines.append(f"RT{k} {rng.randint(1, k - 1)} {k} 1k")
+        for k in range(max(0, size - 1 - (nodes - 1))):
+            a, b = rng.sample(range(0, nodes + 1), 2)
+            ctype = rng.choice('RRRCL')
+            value = {'R': '4.7k', 'C': '100n', 'L': '1m'}[ctype]
+            lines.append(f"{ctype}X{k} {a} {b} {value}")
+    
+    elif kind == 'transistor_chain':
+        # زنجیره عمیق طبقات امیتر مشترک: هر طبقه ۴ قطعه
+        for k in range(1, max(1, (size - 1) // 4) + 1):
+            base, collector, emitter = f"b{k}", f"c{k}", f"e{k}"
+            prev = '1' if k == 1 else f"c{k - 1}"
+            lines.append(f"RB{k} {prev} {base} 100k")
+            lines.append(f"Q{k} {collector} {base} {emitter} 2N2222")
+            lines.append(f"RC{k} 1 {collector} 4.7k")
+            lines.append(f"RE{k} {emitter} 0 1k")
+    
+    else:
+        raise ValueError(f"unknown netlist kind: {kind}")
+    
+    return '\n'.join(lines) + '\n'
 
-        return spice_code
-    except Exception as e:
-        print(f"❌ خطا در تولید: {e}")
-        return None
+def _benchmark_stages(size, render=True):
+    """مراحل قابل اندازه‌گیری: (نام، تابع دریافت‌کننده متن و قطعات)"""
+    stages = [
+        ('parse_netlist', lambda text, comps: parse_netlist(text)),
+        ('validate_components', lambda text, comps: validate_components(comps)),
+        ('build_node_graph', lambda text, comps: build_node_graph(comps)),
+        ('find_circuit_path', lambda text, comps: find_circuit_path(comps, start_node='1')),
+        ('compute_layout', lambda text, comps: compute_layout(comps)),
+    ]
+    if render and size <= BENCHMARK_RENDER_LIMIT:
+        stages.append(('render_svg', lambda text, comps: render_schematic(comps, 'svg')))
+    return stages
 
-# --- ۶. مثال‌های تستی ---
-def get_test_examples():
+def run_benchmarks(kinds=BENCHMARK_KINDS, sizes=BENCHMARK_SIZES, repeat=3, memory=True,
+                   render=True, seed=0):
+    """اندازه‌گیری زمان (کمینه چند تکرار) و اوج حافظه (tracemalloc) هر مرحله به تفکیک"""
+    import gc
+    import tracemalloc
+    
+    if render:
+        os.environ.setdefault('MPLBACKEND', 'Agg')
+    
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            print(f"⏳ {kind} / {size}", flush=True)
+            text = generate_netlist(kind, size, seed)
+            components = parse_netlist(text)
+            for stage, func in _benchmark_stages(size, render):
+                func(text, components)  # گرم کردن (import تنبل، کش‌ها)
+                times = []
+                for _ in range(repeat):
+                    gc.collect()
+                    start = time.perf_counter()
+                    func(text, components)
+                    times.append(time.perf_counter() - start)
+                
+                peak = None
+                if memory:
+                    # جدا از زمان‌سنجی، چون tracemalloc اجرا را کند می‌کند
+                    gc.collect()
+                    tracemalloc.start()
+                    func(text, components)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                
+                results.append({
+                    'kind': kind,
+                    'size': size,
+                    'components': len(components),
+                    'stage': stage,
+                    'seconds': round(min(times), 6),
+                    'peak_bytes': peak,
+                })
+    return results
+
+def benchmark_edit_session(kind='ladder', size=5000, repeat=20, seed=0):
+    """زمان ویرایش تکی در EditSession (تغییر مقدار، افزودن و حذف قطعه) در برابر
+    پارس و اعتبارسنجی کامل؛ پس از ویرایش‌ها برابری قطعات و پیام‌ها بررسی می‌شود
+    """
+    text = generate_netlist(kind, size, seed) + ".end\n"
+    session = EditSession(text)
+    line = next(i for i, row in enumerate(session.lines) if row[:1] in 'RC')
+    name, a, b, _ = session.lines[line].split()
+    end = _find_end_line(session.lines)
+    
+    timings = defaultdict(list)
+    clock = time.perf_counter
+    for k in range(repeat):
+        start = clock()
+        session.set_line(line, f"{name} {a} {b} {k + 1}k")
+        timings['value'].append(clock() - start)
+        start = clock()
+        session.insert_line(end, f"CBENCH {a} 0 {k + 1}n")
+        timings['insert'].append(clock() - start)
+        start = clock()
+        session.delete_line(end)
+        timings['delete'].append(clock() - start)
+    
+    start = clock()
+    components = parse_netlist(session.text)
+    errors, warnings = validate_components(components)
+    full = clock() - start
+    seconds = {edit: min(values) for edit, values in timings.items()}
     return {
-        '1': {
-            'name': 'مدار سادهی',
-            'code': """V1 1 0 12V
-R1 1 2 -100
-C1 2 0 100u
-"""
-        },
-        '2': {
-            'name': 'مدار با ترانزیستور',
-            'code': """V1 1 0 5V
-R1 1 2 10
-Q1 2 3 0 2N2222"""
-        },
-        '3': {
-            'name': 'مدار موازی',
-            'code': """V1 1 0 10V
-R1 1 2 100
-R2 1 2 200
-R3 2 0 300"""
-        },
-        '4': {
-            'name': 'مدار با دیود',
-            'code': """V1 1 0 12V
-R1 1 2 1k
-D1 2 3 1N4148
-R2 3 0 1k"""
-        },
-        '5': {
-            'name': 'مدار با آپ‌امپ',
-            'code': """V1 1 0 12V
-R1 1 2 10k
-U1 3 2 4 1 0 LM741
-R2 3 0 1k"""
-        },
-        '6': {
-            'name': 'مدار با IC 555 (تایمر)',
-            'code': """
-V1 1 0 9V
-R1 1 2 1k
-R2 2 3 1k
-U1 4 3 2 1 0 555
-C1 4 0 10u
-R3 4 0 10k"""
-        },
-        '7': {
-            'name': 'مدار با MOSFET',
-            'code': """V1 1 0 12V
-R1 1 2 100
-M1 2 3 0 0 IRF530
-R2 3 0 1k"""
-        },
-        '8': {
-            'name': 'مدار پیچیده',
-            'code': """V1 1 0 15V
-R1 1 2 1k
-D1 2 3 1N4007
-C1 3 4 100u
-U1 5 4 6 1 0 LM741
-R2 5 0 2k"""
-        }
+        'kind': kind,
+        'size': size,
+        'components': len(components),
+        'seconds': {edit: round(value, 6) for edit, value in seconds.items()},
+        'full_seconds': round(full, 6),
+        # کندترین نوع ویرایش چند برابر سریع‌تر از پارس و اعتبارسنجی کامل است
+        'speedup': round(full / max(max(seconds.values()), 1e-9), 1),
+        'parity': (session.components == components and sorted(session.errors) == sorted(errors)
+                   and sorted(session.warnings) == sorted(warnings)),
     }
 
-# --- ۷. تابع اصلی ---
+def _benchmark_key(result):
+    return f"{result['kind']}/{result['size']}/{result['stage']}"
+
+def compare_benchmarks(results, baseline, threshold=BENCHMARK_THRESHOLD):
+    """مقایسه با خط پایه؛ خروجی: لیست پسرفت‌ها (کندتر یا پرمصرف‌تر از آستانه)"""
+    reference = {_benchmark_key(r): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = reference.get(_benchmark_key(result))
+        if base is None:
+            continue
+        slower = result['seconds'] - base['seconds']
+        if (result['seconds'] > base['seconds'] * (1 + threshold)
+                and slower > BENCHMARK_MIN_DELTA_SECONDS):
+            regressions.append({'key': _benchmark_key(result), 'metric': 'seconds',
+                                'baseline': base['seconds'], 'current': result['seconds']})
+        if (result.get('peak_bytes') and base.get('peak_bytes')
+                and result['peak_bytes'] > base['peak_bytes'] * (1 + threshold)
+                and result['peak_bytes'] - base['peak_bytes'] > 64 * 1024):
+            regressions.append({'key': _benchmark_key(result), 'metric': 'peak_bytes',
+                                'baseline': base['peak_bytes'], 'current': result['peak_bytes']})
+    return regressions
+
+def format_benchmark_results(results):
+    lines = [f"{'kind':<17}{'size':>8}  {'stage':<20}{'time [ms]':>11}{'peak [KiB]':>12}"]
+    for r in results:
+        peak = f"{r['peak_bytes'] / 1024:.0f}" if r.get('peak_bytes') is not None else '-'
+        lines.append(f"{r['kind']:<17}{r['size']:>8}  {r['stage']:<20}"
+                     f"{r['seconds'] * 1000:>11.2f}{peak:>12}")
+    return '\n'.join(lines)
+
+# بزرگ‌ترین اندازه‌ای که هر موتور رندر در بنچمارک اجرا می‌شود (بقیه رد می‌شوند)
+RENDER_BENCH_LIMITS = {'matplotlib': 1000, 'schemdraw-svg': 1000, 'svg': 100000}
+
+def check_render_output(data, fmt):
+    """بررسی درستی خروجی رندر: PNG با امضای معتبر یا SVG خوش‌ساخت با ریشه svg"""
+    if not data:
+        return False
+    if fmt == 'png':
+        return data.startswith(b'\x89PNG\r\n\x1a\n')
+    import xml.etree.ElementTree as ET
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        return False
+    return root.tag.rsplit('}', 1)[-1] == 'svg' and len(root) > 0
+
+def benchmark_render_backends(backends=RENDER_BACKENDS, kinds=BENCHMARK_KINDS,
+                              sizes=BENCHMARK_SIZES, repeat=3, fmt='svg', seed=0):
+    """مقایسه موتورهای رندر روی مثال‌های تستی و نت‌لیست‌های مصنوعی
+    
+    برای هر مورد کمینه زمان چند تکرار، حجم خروجی و درستی آن (check_render_output)
+    ثبت می‌شود؛ اولین اجرای هر موتور (import و گرم شدن) جدا گزارش می‌شود.
+    """
+    import gc
+    
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    cases = [('example', int(key), parse_netlist(example['code']))
+             for key, example in get_test_examples().items()]
+    for kind in kinds:
+        for size in sizes:
+            cases.append((kind, size, parse_netlist(generate_netlist(kind, size, seed))))
+    
+    results = []
+    for backend in backends:
+        if fmt not in RENDER_BACKEND_FORMATS[backend]:
+            continue
+        warm_up = time.perf_counter()
+        render_schematic(cases[0][2], fmt, backend)
+        warm_up = time.perf_counter() - warm_up
+        for kind, size, components in cases:
+            if size > RENDER_BENCH_LIMITS.get(backend, size):
+                continue
+            print(f"⏳ {backend} / {kind} / {size}", flush=True)
+            times = []
+            data = None
+            for _ in range(repeat):
+                gc.collect()
+                start = time.perf_counter()
+                data = render_schematic(components, fmt, backend)
+                times.append(time.perf_counter() - start)
+            results.append({
+                'backend': backend,
+                'kind': kind,
+                'size': size,
+                'components': len(components),
+                'seconds': round(min(times), 6),
+                'first_seconds': round(warm_up, 6),
+                'bytes': len(data) if data else 0,
+                'status': 'skipped' if data is None else
+                          'ok' if check_render_output(data, fmt) else 'invalid',
+            })
+    return results
+
+def fastest_render_backends(results):
+    """سریع‌ترین موتور با خروجی درست برای هر مورد: (نوع، اندازه) → موتور"""
+    best = {}
+    for r in results:
+        key = (r['kind'], r['size'])
+        if r['status'] == 'ok' and (key not in best or r['seconds'] < best[key]['seconds']):
+            best[key] = r
+    return {key: r['backend'] for key, r in best.items()}
+
+def format_render_benchmark(results):
+    lines = [f"{'backend':<15}{'kind':<17}{'size':>7}{'time [ms]':>12}{'KiB':>9}  status"]
+    for r in results:
+        lines.append(f"{r['backend']:<15}{r['kind']:<17}{r['size']:>7}"
+                     f"{r['seconds'] * 1000:>12.2f}{r['bytes'] / 1024:>9.1f}  {r['status']}")
+    first = {r['backend']: r['first_seconds'] for r in results}
+    lines.append('')
+    lines.extend(f"🔥 {backend}: اولین رندر (import و گرم شدن) {seconds * 1000:.0f} ms"
+                 for backend, seconds in first.items())
+    counts = Counter(fastest_render_backends(results).values())
+    lines.extend(f"🏆 {backend}: سریع‌ترین در {count} مورد" for backend, count in counts.most_common())
+    return '\n'.join(lines)
+
+# --- ۹. تابع اصلی ---
 def main():
     print("=" * 60)
     print("🔌 برنامه تولید کد SPICE و شماتیک")
@@ -711,16 +6231,479 @@ def main():
                 draw_schematic(spice_code)
         
         elif choice == '5':
-            circuits = list_saved_circuits()
-            if circuits:
-                idx = input("\n📂 شماره مدار: ").strip()
+            page, query = 1, None
+            while True:
+                circuits = list_saved_circuits(page, query=query)
+                if not circuits and page == 1:
+                    break
+                idx = input("\n📂 شماره مدار (n: صفحه بعد، p: صفحه قبل، /متن: جستجو): ").strip()
+                if idx == 'n':
+                    page += 1
+                    continue
+                if idx == 'p':
+                    page = max(1, page - 1)
+                    continue
+                if idx.startswith('/'):
+                    page, query = 1, idx[1:].strip() or None
+                    continue
                 try:
                     spice_code = load_circuit(circuits[int(idx)-1])
                     if spice_code:
                         draw_schematic(spice_code)
                 except:
                     pass
+                break
+
+def run_cli(argv):
+    """حالت خط فرمان غیرتعاملی (برای اجرای دسته‌ای و اسکریپت‌ها)"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog='prg', description="تولید و رسم شماتیک مدارهای SPICE")
+    parser.add_argument('--metrics-jsonl', help="ذخیره رویدادهای ابزار دقیق (JSON lines) در پایان اجرا")
+    parser.add_argument('--metrics-prom', help="ذخیره آمار مراحل و شمارنده‌ها به فرمت Prometheus")
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    render = sub.add_parser('render', help="رندر دسته‌ای نت‌لیست‌ها بدون باز کردن پنجره")
+    render.add_argument('--jobs', '-j', type=int, default=None,
+                        help="تعداد پروسه‌های موازی (پیش‌فرض: تعداد هسته‌ها)")
+    render.add_argument('--format', '-f', choices=['svg', 'png'], default='svg')
+    render.add_argument('--backend', '-b', choices=RENDER_BACKENDS, default=DEFAULT_RENDER_BACKEND,
+                        help="موتور رندر (svg: نویسنده داخلی سریع، فقط SVG)")
+    render.add_argument('--cache-dir', default=RENDER_CACHE_DIR,
+                        help="پوشه کش رندر (رشته خالی = بدون کش)")
+    render.add_argument('--cache-size-mb', type=float, default=RENDER_CACHE_MAX_BYTES / 2**20,
+                        help="حداکثر حجم کش رندر (مگابایت)")
+    render.add_argument('inputs', nargs='+', help="فایل‌ها یا پوشه‌های نت‌لیست / circuit_*.json")
+    render.add_argument('out_dir', help="پوشه خروجی")
+    
+    gen = sub.add_parser('generate-batch', help="تولید هم‌زمان کد SPICE برای فایل توضیحات")
+    gen.add_argument('input', help="فایل متنی؛ هر خط یک توضیح مدار")
+    gen.add_argument('--output', '-o', help="فایل خروجی JSON Lines (پیش‌فرض: stdout)")
+    gen.add_argument('--concurrency', '-c', type=int, default=8)
+    gen.add_argument('--rate', type=float, default=None, help="حداکثر درخواست در ثانیه")
+    gen.add_argument('--backend', choices=['gemini', 'stub', 'http'], default='gemini')
+    gen.add_argument('--url', help="آدرس سرور مدل برای --backend http")
+    gen.add_argument('--no-cache', action='store_true', help="دور زدن کش پاسخ‌ها")
+    gen.add_argument('--batch-size', '-b', type=int, default=1,
+                     help="تعداد توضیح در هر درخواست (پاسخ JSON؛ 1 = درخواست تکی)")
+    gen.add_argument('--retries', type=int, default=SPICE_BATCH_RETRIES,
+                     help="دفعات درخواست دوباره موارد ناموفق در حالت دسته‌ای")
+    
+    bench_batch = sub.add_parser('bench-batch', help="مقایسه توان عملیاتی درخواست تکی و دسته‌ای با مدل جعلی")
+    bench_batch.add_argument('--count', '-n', type=int, default=100, help="تعداد توضیحات")
+    bench_batch.add_argument('--batch-sizes', nargs='+', type=int, default=list(BATCH_BENCH_SIZES))
+    bench_batch.add_argument('--delay', type=float, default=0.3, help="تأخیر هر درخواست (ثانیه)")
+    bench_batch.add_argument('--char-delay', type=float, default=0.0002,
+                             help="زمان تولید هر نویسه پاسخ (ثانیه)")
+    bench_batch.add_argument('--concurrency', '-c', type=int, default=4)
+    bench_batch.add_argument('--failure-rate', type=float, default=0.1,
+                             help="احتمال نامعتبر بودن هر مدار تولیدی")
+    
+    serve = sub.add_parser('serve', help="اجرای سرویس HTTP محلی (تولید، اعتبارسنجی، رندر، فهرست)")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--backend', choices=['gemini', 'stub', 'http'], default='gemini')
+    serve.add_argument('--url', help="آدرس سرور مدل برای --backend http")
+    serve.add_argument('--stub-delay', type=float, default=0.0,
+                       help="تأخیر مصنوعی هر پاسخ مدل جعلی (ثانیه)")
+    serve.add_argument('--queue-size', type=int, default=SERVICE_QUEUE_SIZE)
+    serve.add_argument('--workers', type=int, default=SERVICE_WORKERS)
+    serve.add_argument('--render-jobs', type=int, default=None, help="تعداد پروسه‌های رندر")
+    serve.add_argument('--no-cache', action='store_true', help="بدون کش پاسخ‌ها و رندر")
+    
+    load = sub.add_parser('load-test', help="آزمون بار سرویس HTTP")
+    load.add_argument('--url', default='http://127.0.0.1:8080')
+    load.add_argument('--endpoint', choices=sorted(LOAD_TEST_PAYLOADS), default='generate')
+    load.add_argument('--requests', '-n', type=int, default=200)
+    load.add_argument('--concurrency', '-c', type=int, default=32)
+    
+    fake = sub.add_parser('fake-model', help="اجرای سرور مدل جعلی محلی برای تست")
+    fake.add_argument('--host', default='127.0.0.1')
+    fake.add_argument('--port', type=int, default=8765)
+    fake.add_argument('--delay', type=float, default=0.0, help="تأخیر مصنوعی هر پاسخ (ثانیه)")
+    
+    val = sub.add_parser('validate', help="اعتبارسنجی نت‌لیست با گزارش زمان هر قاعده")
+    val.add_argument('netlist', help="فایل نت‌لیست یا circuit_*.json")
+    val.add_argument('--timings', action='store_true', help="نمایش زمان صرف‌شده هر قاعده")
+    
+    dc = sub.add_parser('dc', help="تحلیل نقطه کار DC (MNA)")
+    dc.add_argument('netlist', help="فایل نت‌لیست یا circuit_*.json")
+    dc.add_argument('--max-current', type=float, default=None,
+                    help="هشدار برای جریان‌های بزرگ‌تر از این مقدار (آمپر)")
+    
+    ac = sub.add_parser('ac', help="جاروب فرکانسی AC سیگنال کوچک (مدارهای RLC)")
+    ac.add_argument('netlist', help="فایل نت‌لیست یا circuit_*.json")
+    ac.add_argument('--node', required=True, help="نود خروجی")
+    ac.add_argument('--source', help="منبع ولتاژ تحریک (پیش‌فرض: اولین منبع ولتاژ)")
+    ac.add_argument('--start', type=float, default=1.0, help="فرکانس شروع (Hz)")
+    ac.add_argument('--stop', type=float, default=1e6, help="فرکانس پایان (Hz)")
+    ac.add_argument('--points', type=int, default=1000)
+    ac.add_argument('--export', choices=['csv', 'json'], default='csv')
+    ac.add_argument('--output-dir', help="پوشه خروجی (پیش‌فرض: کنار فایل ورودی، مثل شماتیک)")
+    
+    sweep = sub.add_parser('sweep', help="جاروب پارامتری و مونت‌کارلو روی مقادیر قطعات")
+    sweep.add_argument('netlist', help="فایل نت‌لیست یا circuit_*.json")
+    sweep.add_argument('--sweep', action='append', default=[], metavar='NAME=SPEC',
+                       help="مثلاً V1=lin:0:10:11 یا R2=1k,2.2k,4.7k")
+    sweep.add_argument('--tol', action='append', default=[], metavar='NAME=TOL',
+                       help="تلورانس نسبی، مثلاً R1=5%%")
+    sweep.add_argument('--samples', type=int, default=1000, help="تعداد نمونه‌های مونت‌کارلو")
+    sweep.add_argument('--distribution', choices=['uniform', 'gauss'], default='uniform')
+    sweep.add_argument('--seed', type=int, default=None)
+    sweep.add_argument('--jobs', '-j', type=int, default=None)
+    sweep.add_argument('--output', '-o', help="ذخیره آمار خلاصه در فایل JSON")
+    
+    sheets = sub.add_parser('sheets', help="رندر سلسله‌مراتبی: یک برگه برای هر تعریف .subckt")
+    sheets.add_argument('netlist', help="فایل نت‌لیست یا circuit_*.json")
+    sheets.add_argument('out_dir', help="پوشه خروجی")
+    sheets.add_argument('--format', '-f', choices=['svg', 'png'], default='svg')
+    sheets.add_argument('--backend', '-b', choices=RENDER_BACKENDS, default=DEFAULT_RENDER_BACKEND)
+    
+    arch = sub.add_parser('archive', help="آرشیو باینری مدارها (ورود/خروج JSON، نمایش)")
+    arch.add_argument('action', choices=['import', 'export', 'show', 'info'])
+    arch.add_argument('target', nargs='?',
+                      help="import: الگوی فایل‌ها، export: پوشه خروجی، show: شناسه یا نام فایل")
+    arch.add_argument('--archive', '-a', default=CIRCUIT_ARCHIVE_PATH, help="مسیر فایل آرشیو")
+    
+    lst = sub.add_parser('list', help="لیست و جستجوی مدارهای ذخیره‌شده")
+    lst.add_argument('--page', type=int, default=1)
+    lst.add_argument('--page-size', type=int, default=20)
+    lst.add_argument('--search', '-s', help="جستجو در توضیحات")
+    lst.add_argument('--type', '-t', help="فقط مدارهای دارای این نوع قطعه (مثلاً Q)")
+    
+    dup = sub.add_parser('dedup', help="یافتن مدارهای تکراری (هم‌ریخت با شماره‌گذاری نود متفاوت)")
+    dup.add_argument('--delete', action='store_true',
+                     help="حذف نسخه‌های تکراری (قدیمی‌ترین نسخه هر گروه نگه داشته می‌شود)")
+    
+    imp = sub.add_parser('import-circuits', help="ورود یک‌باره فایل‌های circuit_*.json به فهرست")
+    imp.add_argument('pattern', nargs='?', default="circuit_*.json")
+    
+    startup = sub.add_parser('bench-startup', help="گزارش زمان شروع (python -X importtime)")
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS,
+                         help="سقف مجاز زمان شروع (ثانیه)")
+    startup.add_argument('--output', help="ذخیره گزارش در فایل")
+    startup.add_argument('target', nargs='*', default=['list'], help="دستور مورد اندازه‌گیری")
+    
+    voice = sub.add_parser('voice', help="ضبط پیوسته گفتار و تبدیل به متن")
+    voice.add_argument('--backend', choices=['google', 'whisper', 'vosk', 'sphinx', 'stub'],
+                       default=os.environ.get('PRG_SPEECH_BACKEND', 'google'))
+    voice.add_argument('--files', nargs='+', help="به جای میکروفون از این فایل‌های صوتی بخوان")
+    voice.add_argument('--count', type=int, default=0, help="توقف پس از این تعداد جمله (0: بی‌پایان)")
+    voice.add_argument('--workers', type=int, default=2, help="تعداد تشخیص‌های هم‌زمان")
+    
+    bench = sub.add_parser('bench', help="بنچمارک مراحل پردازش روی نت‌لیست‌های مصنوعی")
+    bench.add_argument('--kinds', nargs='+', choices=BENCHMARK_KINDS, default=list(BENCHMARK_KINDS))
+    bench.add_argument('--sizes', nargs='+', type=int, default=list(BENCHMARK_SIZES),
+                       help="تعداد تقریبی قطعات (مثلاً 10 1000 1000000)")
+    bench.add_argument('--repeat', type=int, default=3)
+    bench.add_argument('--no-memory', action='store_true', help="بدون پروفایل حافظه")
+    bench.add_argument('--no-render', action='store_true', help="بدون مرحله رندر")
+    bench.add_argument('--baseline', default=BENCHMARK_BASELINE_PATH, help="فایل JSON خط پایه")
+    bench.add_argument('--save-baseline', action='store_true', help="ذخیره نتایج به‌عنوان خط پایه")
+    bench.add_argument('--threshold', type=float, default=BENCHMARK_THRESHOLD,
+                       help="آستانه نسبی پسرفت (0.5 یعنی ۵۰٪)")
+    
+    bench_render = sub.add_parser('bench-render', help="مقایسه سرعت و درستی موتورهای رندر")
+    bench_render.add_argument('--backends', nargs='+', choices=RENDER_BACKENDS,
+                              default=list(RENDER_BACKENDS))
+    bench_render.add_argument('--kinds', nargs='+', choices=BENCHMARK_KINDS,
+                              default=list(BENCHMARK_KINDS))
+    bench_render.add_argument('--sizes', nargs='+', type=int, default=list(BENCHMARK_SIZES))
+    bench_render.add_argument('--repeat', type=int, default=3)
+    bench_render.add_argument('--format', '-f', choices=['svg', 'png'], default='svg')
+    bench_render.add_argument('--output', help="ذخیره نتایج به صورت JSON")
+    
+    bench_edit = sub.add_parser('bench-edit', help="زمان ویرایش افزایشی در برابر پارس و اعتبارسنجی کامل")
+    bench_edit.add_argument('--kind', choices=BENCHMARK_KINDS, default='ladder')
+    bench_edit.add_argument('--size', type=int, default=5000)
+    bench_edit.add_argument('--repeat', type=int, default=20)
+    bench_edit.add_argument('--min-speedup', type=float, default=10.0,
+                            help="کمترین نسبت زمان کامل به کندترین ویرایش (وگرنه کد خروج 1)")
+    
+    args = parser.parse_args(argv)
+    try:
+        return run_command(args)
+    finally:
+        export_metrics(args.metrics_jsonl, args.metrics_prom)
+
+def run_command(args):
+    """اجرای یک دستور خط فرمان پارس‌شده"""
+    backend = getattr(args, 'backend', None)
+    if args.command in ('render', 'sheets') and args.format not in RENDER_BACKEND_FORMATS[backend]:
+        print(f"❌ موتور رندر {backend} فرمت {args.format} را پشتیبانی نمی‌کند.")
+        return 2
+    
+    if args.command == 'render':
+        results = batch_render(args.inputs, args.out_dir, jobs=args.jobs, fmt=args.format,
+                               cache_dir=args.cache_dir or None,
+                               cache_max_bytes=int(args.cache_size_mb * 2**20),
+                               backend=args.backend)
+        return 0 if results and all(r['status'] == 'ok' for r in results) else 1
+    
+    if args.command == 'generate-batch':
+        backend = make_llm_backend(args.backend, args.url)
+        counts = run_generate_batch(args.input, args.output, args.concurrency, args.rate,
+                                    backend, use_cache=not args.no_cache,
+                                    batch_size=args.batch_size, retries=args.retries)
+        return 0 if counts['ok'] == sum(counts.values()) else 1
+    
+    if args.command == 'bench-batch':
+        rows = benchmark_prompt_batching(args.count, args.batch_sizes, args.delay, args.char_delay,
+                                         args.concurrency, args.failure_rate)
+        print(format_batching_benchmark(rows))
+        return 0
+    
+    if args.command == 'validate':
+        if args.netlist.lower().endswith('.json'):
+            report = run_validation(iter_components(read_netlist_file(args.netlist)))
+        else:
+            report = run_validation(iter_netlist_file(args.netlist))
+        for e in report.errors:
+            print(e)
+        for w in report.warnings:
+            print(w)
+        if not report.errors and not report.warnings:
+            print("✅ مشکلی یافت نشد.")
+        if args.timings:
+            print(report.format_timings())
+        return 1 if report.errors else 0
+    
+    if args.command == 'dc':
+        # نمونه‌های .subckt فقط برای تحلیل بسط داده می‌شوند
+        components = list(HierarchicalNetlist.from_file(args.netlist).flat())
+        start = time.perf_counter()
+        solution = solve_dc(components)
+        elapsed = time.perf_counter() - start
+        print(f"📈 نقطه کار DC ({solution.iterations} تکرار، {elapsed * 1000:.1f} ms):")
+        for name, v in sorted(solution.node_voltages.items()):
+            print(f"   V({name}) = {v:.6g} V")
+        for name, i in sorted(solution.branch_currents.items()):
+            flag = ' ⚠️' if args.max_current and abs(i) > args.max_current else ''
+            print(f"   I({name}) = {i:.6g} A{flag}")
+        if solution.unsupported:
+            print(f"⚠️ قطعات بدون مدل DC (نادیده گرفته شدند): {', '.join(solution.unsupported)}")
+        if not solution.converged:
+            print("❌ تکرار نیوتن همگرا نشد.")
+            return 1
+        return 0
+    
+    if args.command == 'ac':
+        # نمونه‌های .subckt فقط برای تحلیل بسط داده می‌شوند
+        components = list(HierarchicalNetlist.from_file(args.netlist).flat())
+        start = time.perf_counter()
+        result = ac_sweep(components, args.node, args.start, args.stop, args.points, args.source)
+        elapsed = time.perf_counter() - start
+        base = args.netlist
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            base = os.path.join(args.output_dir, os.path.basename(args.netlist))
+        path = export_ac_result(result, base, args.export)
+        peak = int(result.magnitude_db.argmax())
+        print(f"📉 جاروب AC نود {args.node} ({args.points} نقطه، {elapsed * 1000:.1f} ms) → {path}")
+        print(f"   بیشینه {result.magnitude_db[peak]:.2f} dB در {result.frequencies[peak]:.4g} Hz")
+        if result.unsupported:
+            print(f"⚠️ قطعات بدون مدل AC (نادیده گرفته شدند): {', '.join(result.unsupported)}")
+        return 0
+    
+    if args.command == 'sweep':
+        # نمونه‌های .subckt فقط برای تحلیل بسط داده می‌شوند
+        components = list(HierarchicalNetlist.from_file(args.netlist).flat())
+        sweeps = dict((name, parse_sweep_spec(spec)) for name, spec in
+                      (item.split('=', 1) for item in args.sweep))
+        tolerances = dict((name, parse_tolerance(tol)) for name, tol in
+                          (item.split('=', 1) for item in args.tol))
+        result = run_sweep(components, sweeps, tolerances, args.samples, args.distribution,
+                           args.seed, args.jobs)
+        stats = result.summary()
+        print(f"🎲 {stats['valid']}/{stats['variants']} نسخه معتبر در {stats['seconds']} ثانیه")
+        for name, entry in stats['nodes'].items():
+            print(f"   V({name}): mean {entry['mean']:.4g}  std {entry['std']:.3g}  "
+                  f"[{entry['min']:.4g}, {entry['max']:.4g}]")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, ensure_ascii=False, indent=2)
+        return 0
+    
+    if args.command == 'sheets':
+        _init_headless_worker()
+        netlist = HierarchicalNetlist.from_file(args.netlist)
+        print(f"🧩 {len(netlist.components)} قطعه سطح بالا، {len(netlist.library)} زیرمدار، "
+              f"{netlist.flat_count()} قطعه پس از بسط کامل")
+        os.makedirs(args.out_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(args.netlist))[0]
+        for name, data in render_hierarchy(netlist, args.format, args.backend).items():
+            if data is None:
+                print(f"⚠️ برگه {name} قابل رسم نبود.")
+                continue
+            path = os.path.join(args.out_dir, f"{stem}_{name}.{args.format}")
+            with open(path, 'wb') as f:
+                f.write(data)
+            print(f"✅ {name} → {path}")
+        return 0
+    
+    if args.command == 'archive':
+        with CircuitArchive(args.archive) as archive:
+            if args.action == 'import':
+                imported, failed = archive.import_json_files(args.target or "circuit_*.json")
+                print(f"📥 {imported} مدار به آرشیو اضافه شد، {failed} فایل قابل خواندن نبود.")
+                return 0 if not failed else 1
+            if args.action == 'export':
+                paths = archive.export_json(args.target or '.')
+                print(f"📤 {len(paths)} فایل JSON نوشته شد.")
+                return 0
+            if args.action == 'show':
+                if not args.target:
+                    print("❌ شناسه یا نام فایل مدار لازم است.")
+                    return 1
+                record_id = int(args.target) if args.target.isdigit() else archive.find(args.target)
+                if record_id is None or not 0 <= record_id < len(archive):
+                    print(f"❌ مدار '{args.target}' در آرشیو یافت نشد.")
+                    return 1
+                start = time.perf_counter()
+                circuit = archive.get(record_id)
+                elapsed = time.perf_counter() - start
+                print(f"📝 {circuit.get('description') or 'بدون توضیحات'} "
+                      f"({len(circuit['components'])} قطعه، {elapsed * 1e6:.0f} µs)")
+                print(circuit['spice_code'])
+                return 0
+            print(f"🗄 {len(archive)} مدار، {os.path.getsize(args.archive) / 2**20:.2f} MiB")
+            return 0
+    
+    if args.command == 'list':
+        list_saved_circuits(args.page, args.page_size, args.search, args.type)
+        return 0
+    
+    if args.command == 'dedup':
+        store = get_circuit_store()
+        groups = store.duplicates()
+        if not groups:
+            print("✅ مدار تکراری یافت نشد.")
+            return 0
+        removed = 0
+        for group in groups:
+            keep, extra = group[0], group[1:]
+            print(f"🔁 {keep['filename'] or keep['id']} ({len(extra)} تکراری)")
+            for row in extra:
+                print(f"   - {row['filename'] or row['id']}")
+                if args.delete:
+                    if row['filename'] and os.path.exists(row['filename']):
+                        os.remove(row['filename'])
+                    store.delete(row['id'])
+                    removed += 1
+        if args.delete:
+            print(f"🗑 {removed} مدار تکراری حذف شد.")
+        return 0
+    
+    if args.command == 'import-circuits':
+        imported, failed = get_circuit_store().import_json_files(args.pattern)
+        print(f"📥 {imported} مدار وارد شد، {failed} فایل قابل خواندن نبود.")
+        return 0 if not failed else 1
+    
+    if args.command == 'bench-startup':
+        report = startup_report(args.target, runs=args.runs)
+        text = format_startup_report(report)
+        print(text)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text)
+        if report['heavy_modules'] or report['wall_median_s'] > args.budget:
+            print(f"❌ زمان شروع از بودجه {args.budget}s عبور کرد یا ماژول سنگین بارگذاری شد.")
+            return 1
+        return 0
+    
+    if args.command == 'bench':
+        results = run_benchmarks(args.kinds, args.sizes, repeat=args.repeat,
+                                 memory=not args.no_memory, render=not args.no_render)
+        print(format_benchmark_results(results))
+        if args.save_baseline:
+            os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump({'python': sys.version.split()[0],
+                           'created': datetime.now().isoformat(timespec='seconds'),
+                           'results': results}, f, indent=2)
+            print(f"💾 خط پایه ذخیره شد: {args.baseline}")
+            return 0
+        if not os.path.exists(args.baseline):
+            print(f"⚠️ خط پایه {args.baseline} وجود ندارد؛ مقایسه انجام نشد.")
+            return 0
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_benchmarks(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"❌ پسرفت {r['key']} ({r['metric']}): {r['baseline']} → {r['current']}")
+        if regressions:
+            return 1
+        print("✅ هیچ مرحله‌ای از خط پایه عقب نیفتاد.")
+        return 0
+    
+    if args.command == 'bench-render':
+        results = benchmark_render_backends(args.backends, args.kinds, args.sizes,
+                                            repeat=args.repeat, fmt=args.format)
+        print(format_render_benchmark(results))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        return 1 if any(r['status'] == 'invalid' for r in results) else 0
+    
+    if args.command == 'bench-edit':
+        report = benchmark_edit_session(args.kind, args.size, args.repeat)
+        print(f"{report['kind']} / {report['components']} قطعه")
+        for edit, seconds in report['seconds'].items():
+            print(f"  {edit:<8}{seconds * 1000:>9.2f} ms")
+        print(f"  {'full':<8}{report['full_seconds'] * 1000:>9.2f} ms (پارس و اعتبارسنجی کامل)")
+        print(f"  speedup {report['speedup']:>9.1f}x")
+        if not report['parity']:
+            print("❌ نتیجه جلسه ویرایش با parse_netlist و اعتبارسنجی کامل برابر نیست.")
+            return 1
+        if report['speedup'] < args.min_speedup:
+            print(f"❌ ویرایش افزایشی کمتر از {args.min_speedup:g} برابر سریع‌تر از اعتبارسنجی کامل است.")
+            return 1
+        return 0
+    
+    if args.command == 'voice':
+        capture = AudioFileCapture(args.files) if args.files else MicrophoneCapture()
+        session = VoiceCapture(capture, make_speech_backend(args.backend), workers=args.workers)
+        session.start()
+        if not args.files:
+            print("🎙️ در حال گوش دادن... (Ctrl+C برای پایان)")
+        recognized = 0
+        try:
+            for text in session:
+                print(f"✅ {text}")
+                recognized += 1
+                if args.count and recognized >= args.count:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            session.stop()
+        return 0 if recognized else 1
+    
+    if args.command == 'serve':
+        run_service(args.host, args.port,
+                    backend=make_llm_backend(args.backend, args.url, delay=args.stub_delay),
+                    queue_size=args.queue_size, workers=args.workers,
+                    render_jobs=args.render_jobs, use_cache=not args.no_cache,
+                    render_cache_dir=None if args.no_cache else RENDER_CACHE_DIR)
+        return 0
+    
+    if args.command == 'load-test':
+        report = run_load_test(args.url, args.endpoint, args.requests, args.concurrency)
+        print(json.dumps(report, indent=2))
+        return 0 if report['statuses'].get('200') else 1
+    
+    if args.command == 'fake-model':
+        server = serve_fake_model(args.host, args.port, delay=args.delay)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        return 0
+    
+    return 0
 
 if __name__ == "__main__":
 
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     main()
@@ -0,0 +1,25 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_module():
+    # نام فایل برنامه فاصله دارد و با import معمولی قابل بارگذاری نیست
+    spec = importlib.util.spec_from_file_location('prg', os.path.join(ROOT, 'prg 2.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['prg'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+PRG = _load_module()
+
+
+@pytest.fixture
+def prg():
+    return PRG
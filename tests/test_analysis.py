@@ -0,0 +1,30 @@
+import math
+
+import pytest
+
+
+def test_dc_divider_and_current_source(prg):
+    components = prg.parse_netlist("V1 1 0 10\nR1 1 2 1k\nR2 2 0 3k\nI1 0 3 1m\nR3 3 0 2k\n")
+    solution = prg.solve_dc(components)
+    assert solution.converged
+    assert solution.node_voltages['2'] == pytest.approx(7.5, rel=1e-6)
+    assert solution.node_voltages['3'] == pytest.approx(2.0, rel=1e-6)
+    assert solution.branch_currents['R1'] == pytest.approx(2.5e-3, rel=1e-6)
+
+
+def test_dc_diode_drop(prg):
+    solution = prg.solve_dc(prg.parse_netlist("V1 1 0 5\nD1 1 2 DMOD\nR1 2 0 1k\n"))
+    assert solution.converged
+    assert 0.5 < 5 - solution.node_voltages['2'] < 0.8
+
+
+def test_ac_rc_lowpass_corner(prg):
+    components = prg.parse_netlist("V1 in 0 1\nR1 in out 1k\nC1 out 0 1u\n")
+    corner = 1 / (2 * math.pi * 1e3 * 1e-6)
+    result = prg.ac_sweep(components, 'out', corner / 100, corner * 100, 5)
+    magnitude = [abs(v) for v in result.response]
+    assert magnitude[0] == pytest.approx(1, rel=1e-3)
+    assert magnitude[2] == pytest.approx(1 / math.sqrt(2), rel=1e-6)
+    assert magnitude[4] == pytest.approx(0.01, rel=1e-3)
+    assert math.degrees(math.atan2(result.response[2].imag, result.response[2].real)) == \
+        pytest.approx(-45, abs=1e-4)
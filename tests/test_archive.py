@@ -0,0 +1,74 @@
+import json
+import os
+
+
+def _circuit(prg, i):
+    return {'description': f"مدار {i}", 'spice_code': prg.generate_netlist('ladder', 20, seed=i),
+            'date': '2025-01-01T00:00:00', 'version': '3.0', 'filename': f"circuit_{i}.json"}
+
+
+def test_round_trip_after_reopen(prg, tmp_path):
+    path = str(tmp_path / 'a.prga')
+    circuits = [_circuit(prg, i) for i in range(3)]
+    with prg.CircuitArchive(path) as archive:
+        for circuit in circuits:
+            archive.append(circuit)
+
+    with prg.CircuitArchive(path) as archive:
+        assert len(archive) == 3
+        for i, circuit in enumerate(circuits):
+            stored = archive.get(i)
+            assert stored['spice_code'] == circuit['spice_code']
+            assert stored['description'] == circuit['description']
+            assert [c.to_dict() for c in archive.components(i)] == \
+                prg.parse_netlist(circuit['spice_code'])
+        assert archive.find('circuit_2.json') == 2
+
+
+def test_torn_tail_is_truncated(prg, tmp_path):
+    path = str(tmp_path / 'a.prga')
+    with prg.CircuitArchive(path) as archive:
+        archive.append(_circuit(prg, 0))
+        archive.append(_circuit(prg, 1))
+    size = os.path.getsize(path)
+    # نوشتن نیمه‌کاره رکورد سوم (مثلاً قطع برق)
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 7)
+
+    with prg.CircuitArchive(path) as archive:
+        assert len(archive) == 2
+        assert archive.spice_code(1) == _circuit(prg, 1)['spice_code']
+    assert os.path.getsize(path) == size
+
+
+def test_corrupt_record_fails_crc_on_rebuild(prg, tmp_path):
+    path = str(tmp_path / 'a.prga')
+    with prg.CircuitArchive(path) as archive:
+        archive.append(_circuit(prg, 0))
+        archive.append(_circuit(prg, 1))
+    with open(path, 'r+b') as f:
+        f.seek(-3, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-3, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+    os.remove(path + '.idx')
+
+    with prg.CircuitArchive(path) as archive:
+        assert len(archive) == 1
+        assert archive.get(0)['spice_code'] == _circuit(prg, 0)['spice_code']
+
+
+def test_import_twice_does_not_duplicate(prg, tmp_path):
+    for i in range(2):
+        circuit = _circuit(prg, i)
+        del circuit['filename']
+        (tmp_path / f"circuit_{i}.json").write_text(json.dumps(circuit), encoding='utf-8')
+    pattern = str(tmp_path / 'circuit_*.json')
+
+    with prg.CircuitArchive(str(tmp_path / 'a.prga')) as archive:
+        assert archive.import_json_files(pattern) == (2, 0)
+        assert archive.import_json_files(pattern) == (0, 0)
+    with prg.CircuitArchive(str(tmp_path / 'a.prga')) as archive:
+        assert archive.import_json_files(pattern) == (0, 0)
+        assert len(archive) == 2
+        assert archive.find('circuit_1.json') == 1
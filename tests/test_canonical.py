@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+
+def _shuffled_renumbered(prg, text, seed):
+    rng = random.Random(seed)
+    lines = [line.split() for line in text.splitlines() if prg.parse_component_line(line)]
+    pin_counts = [prg.parse_component_line(' '.join(line))['pins'] for line in lines]
+    nodes = sorted({p for line, n in zip(lines, pin_counts) for p in line[1:1 + n]} - {'0'})
+    mapping = dict(zip(nodes, map(str, rng.sample(range(100, 100 + len(nodes)), len(nodes)))))
+    out = []
+    for line, n in zip(lines, pin_counts):
+        pins = [mapping.get(p, p) for p in line[1:1 + n]]
+        if line[0][0] in 'RCL' and rng.random() < 0.5:
+            pins.reverse()
+        out.append(' '.join([line[0]] + pins + line[1 + n:]))
+    rng.shuffle(out)
+    return '\n'.join(out)
+
+
+@pytest.mark.parametrize('kind', ['ladder', 'mesh', 'random', 'transistor_chain'])
+def test_hash_ignores_order_numbering_and_symmetric_pins(prg, kind):
+    text = prg.generate_netlist(kind, 64, seed=3)
+    reference = prg.canonical_hash(text)
+    for seed in range(5):
+        assert prg.canonical_hash(_shuffled_renumbered(prg, text, seed)) == reference
+
+
+def test_hash_detects_real_changes(prg):
+    text = "V1 1 0 5\nR1 1 2 1k\nR2 2 0 2k\nC1 2 0 1u\n"
+    reference = prg.canonical_hash(text)
+    assert prg.canonical_hash(text.replace('2k', '3k')) != reference
+    assert prg.canonical_hash(text.replace('C1 2 0', 'C1 1 0')) != reference
+    assert prg.canonical_hash("Q1 c b e N\nR1 c 0 1k\n") != prg.canonical_hash("Q1 e b c N\nR1 c 0 1k\n")
+
+
+def test_names_only_matter_when_requested(prg):
+    a = "V1 1 0 5\nR1 1 0 1k\n"
+    b = "V9 1 0 5\nRLOAD 1 0 1k\n"
+    assert prg.canonical_hash(a) == prg.canonical_hash(b)
+    assert prg.canonical_hash(a, names=True) != prg.canonical_hash(b, names=True)
@@ -0,0 +1,16 @@
+def test_compact_netlist_matches_parse(prg):
+    text = prg.generate_netlist('transistor_chain', 50)
+    components = prg.parse_netlist(text)
+    net = prg.CompactNetlist.from_source(text)
+    assert len(net) == len(components)
+    assert [net[i].to_dict() for i in range(len(net))] == components
+
+
+def test_non_ascii_lines_are_not_components(prg, tmp_path):
+    text = "V1 1 0 5\nاین مدار یک تقسیم کننده ولتاژ است\nR1 1 0 1k\n"
+    assert [c['name'] for c in prg.parse_netlist(text)] == ['V1', 'R1']
+    assert len(prg.CompactNetlist.from_source(text)) == 2
+    
+    archive = prg.CircuitArchive(str(tmp_path / 'c.prga'))
+    record_id = archive.append({'description': '', 'spice_code': text, 'date': '', 'version': '3.0'})
+    assert [c['name'] for c in archive.components(record_id)] == ['V1', 'R1']
@@ -0,0 +1,71 @@
+import random
+
+
+def _assert_parity(prg, session):
+    reference = prg.parse_netlist(session.text)
+    assert session.components == reference
+    errors, warnings = prg.validate_components(reference)
+    assert sorted(session.errors) == sorted(errors)
+    assert sorted(session.warnings) == sorted(warnings)
+
+
+def test_directives_are_not_components(prg):
+    session = prg.EditSession("V1 1 0 5\nR1 1 0 1k\n")
+    session.insert_line(1, ".tran 1m 10m")
+    session.insert_line(2, "+ 0 0.01m")
+    assert [c['name'] for c in session.components] == ['V1', 'R1']
+    _assert_parity(prg, session)
+
+
+def test_lines_after_end_are_ignored(prg):
+    session = prg.EditSession("V1 1 0 5\nR1 1 0 1k\n.end\nR9 9 0 1k\n")
+    assert [c['name'] for c in session.components] == ['V1', 'R1']
+    session.insert_line(3, "C1 1 0 1u")
+    assert [c['name'] for c in session.components] == ['V1', 'R1']
+    session.delete_line(2)
+    assert [c['name'] for c in session.components] == ['V1', 'R1', 'C1', 'R9']
+    session.insert_line(1, ".END")
+    assert [c['name'] for c in session.components] == ['V1']
+    _assert_parity(prg, session)
+
+
+def test_random_edits_match_parse_netlist(prg):
+    rng = random.Random(1)
+    session = prg.EditSession("V1 1 0 5\nR1 1 2 1k\n.tran 1m 10m 0 0.01m\nR2 2 0\n+ 2k\n"
+                              "C1 2 0 1u\n* c\n.end\nR9 9 0 1k\n")
+    pool = ['R5 2 3 1k', '.end', '.tran 1 2', '+ 5k', '* x', '', 'C7 3 0 1n',
+            'V2 3 0 1', '.model D1 D', 'R8 3 9 2k']
+    for _ in range(500):
+        n = len(session.lines)
+        op = rng.random()
+        if op < 0.4 or n == 0:
+            session.insert_line(rng.randint(0, n), rng.choice(pool))
+        elif op < 0.7:
+            session.delete_line(rng.randrange(n))
+        else:
+            session.set_line(rng.randrange(n), rng.choice(pool))
+        _assert_parity(prg, session)
+
+
+def test_benchmark_edit_session_reports_parity(prg):
+    report = prg.benchmark_edit_session('ladder', 200, repeat=2)
+    assert report['parity']
+    assert set(report['seconds']) == {'value', 'insert', 'delete'}
+
+
+def test_edits_stay_fast_on_large_netlist(prg):
+    report = prg.benchmark_edit_session('ladder', 5000, repeat=3)
+    assert report['parity']
+    assert report['speedup'] >= 10
+
+
+def test_dc_path_warnings_follow_edits(prg):
+    session = prg.EditSession("V1 1 0 5\nR1 1 2 1k\nR2 2 3 1k\nR3 3 0 1k\n")
+    assert session.warnings == []
+    session.delete_line(3)
+    assert sorted(session.warnings) == sorted(prg.validate_components(session.components)[1])
+    assert any('نود 3' in w for w in session.warnings)
+    session.insert_line(3, "R4 3 0 2k")
+    assert session.warnings == []
+    session.delete_line(0)
+    _assert_parity(prg, session)
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+INVALID = "V1 1 0 5\nR1 1 0 -1k\n"
+VALID = "V1 1 0 5\nR1 1 0 1k\n"
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_generate_caches_only_valid_code(prg, tmp_path, stream):
+    cache = prg.ResponseCache(str(tmp_path / 'r.db'))
+    prg.generate_spice_code('bad', backend=prg.StubBackend(INVALID), cache=cache, stream=stream)
+    assert cache.stats()['entries'] == 0
+    assert prg.generate_spice_code('good', backend=prg.StubBackend(VALID), cache=cache,
+                                   stream=stream) == VALID.strip()
+    assert cache.stats()['entries'] == 1
+
+
+@pytest.mark.parametrize('batch_size', [1, 2])
+def test_batch_caches_only_valid_code(prg, tmp_path, batch_size):
+    cache = prg.ResponseCache(str(tmp_path / 'r.db'))
+    backend = prg.StubBackend(INVALID)
+
+    async def collect():
+        return [r async for r in prg.generate_spice_batch(['a', 'b'], backend=backend, cache=cache,
+                                                          batch_size=batch_size, retries=0)]
+
+    results = asyncio.run(collect())
+    assert {r['status'] for r in results} != {'ok'}
+    assert cache.stats()['entries'] == 0
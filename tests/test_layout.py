@@ -0,0 +1,31 @@
+import pytest
+
+
+def _levels_and_columns(prg, components):
+    nodes_of = [prg.component_nodes(c) for c in components]
+    levels, net_comps = prg._net_levels(components, nodes_of)
+    return levels, prg._order_columns(levels, net_comps, nodes_of)
+
+
+def test_levels_follow_bfs_from_source(prg):
+    components = prg.parse_netlist("V1 1 0 5\nR1 1 a 1k\nR2 1 b 1k\nR3 1 c 1k\n"
+                                   "R4 a 2 1k\nR5 b 2 1k\nR6 c 0 1k\nR7 2 0 1k\n")
+    levels, columns = _levels_and_columns(prg, components)
+    assert levels == {'1': 0, 'a': 1, 'b': 1, 'c': 1, '2': 2}
+    assert columns == ['1', 'a', 'b', 'c', '2']
+
+
+@pytest.mark.parametrize('kind', ['ladder', 'mesh', 'random', 'transistor_chain'])
+def test_columns_are_grouped_by_level(prg, kind):
+    components = prg.parse_netlist(prg.generate_netlist(kind, 300, seed=2))
+    levels, columns = _levels_and_columns(prg, components)
+    assert sorted(columns) == sorted(levels)
+    assert [levels[net] for net in columns] == sorted(levels[net] for net in columns)
+
+
+def test_layout_wires_are_orthogonal_and_cover_all_parts(prg):
+    components = prg.parse_netlist(prg.generate_netlist('transistor_chain', 60))
+    layout = prg.compute_layout(components)
+    assert len(layout.placements) == len(components)
+    for (x1, y1), (x2, y2) in layout.wires:
+        assert x1 == x2 or y1 == y2
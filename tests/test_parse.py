@@ -0,0 +1,37 @@
+import io
+
+
+def test_parse_matches_streaming_sources(prg, tmp_path):
+    text = "* title\nV1 1 0 DC 5\nR1 1 2\n+ 1k\nQ1 3 2 0 2N2222\n.tran 1m 10m\nC1 2 0 1u\n.end\nR9 9 0 1\n"
+    expected = prg.parse_netlist(text)
+    assert [c['name'] for c in expected] == ['V1', 'R1', 'Q1', 'C1']
+    assert expected[0]['value'] == '5'
+    assert expected[1]['value'] == '1k'
+    assert expected[2]['base'] == '2'
+    
+    path = tmp_path / 'a.cir'
+    path.write_text(text, encoding='utf-8')
+    assert list(prg.iter_netlist_file(str(path))) == expected
+    assert list(prg.iter_netlist_file(str(path), use_mmap=False)) == expected
+    assert list(prg.iter_components(io.BytesIO(text.encode('utf-8')))) == expected
+
+
+def test_include_is_resolved_relative_to_file(prg, tmp_path):
+    (tmp_path / 'models.lib').write_text("R2 2 0 2k\n", encoding='utf-8')
+    path = tmp_path / 'top.cir'
+    path.write_text("V1 1 0 5\nR1 1 2 1k\n.include models.lib\n", encoding='utf-8')
+    assert [c['name'] for c in prg.iter_netlist_file(str(path))] == ['V1', 'R1', 'R2']
+
+
+def test_include_in_text_is_ignored_by_default(prg, tmp_path):
+    (tmp_path / 'secret.cir').write_text("R9 9 0 1k\n", encoding='utf-8')
+    text = f"V1 1 0 5\nR1 1 0 1k\n.include {tmp_path / 'secret.cir'}\n"
+    assert [c['name'] for c in prg.parse_netlist(text)] == ['V1', 'R1']
+    assert [c['name'] for c in prg.parse_netlist(text, allow_include=True)] == ['V1', 'R1', 'R9']
+
+
+def test_missing_include_is_skipped(prg, capsys):
+    components = prg.parse_netlist("V1 1 0 5\n.include no_such_models.lib\nR1 1 0 1k\n",
+                                   allow_include=True)
+    assert [c['name'] for c in components] == ['V1', 'R1']
+    assert 'no_such_models.lib' in capsys.readouterr().out
@@ -0,0 +1,48 @@
+def test_key_distinguishes_printed_values_and_nodes(prg):
+    key = prg.RenderCache.make_key
+    base = key("V1 in 0 5\nR1 in out 1k\nR2 out 0 1k\n", fmt='svg', backend='svg')
+    assert base != key("V1 in 0 5\nR1 in out 1000\nR2 out 0 1k\n", fmt='svg', backend='svg')
+    assert base != key("V1 in 0 5\nR1 in out 2K\nR2 out 0 1k\n", fmt='svg', backend='svg')
+    assert base != key("V1 1 0 5\nR1 1 2 1k\nR2 2 0 1k\n", fmt='svg', backend='svg')
+    assert base != key("V1 in 0 5\nR1 in out 1k\nR2 out 0 1k\n", fmt='png', backend='svg')
+
+
+def test_key_is_stable_for_text_and_parsed_input(prg):
+    text = "V1 in 0 5\nR1 in out 1k\nR2 out 0 1k\n"
+    key = prg.RenderCache.make_key
+    assert key(text, fmt='svg', backend='svg') == key(text, fmt='svg', backend='svg')
+    assert key(text, fmt='svg', backend='svg') == key(prg.parse_netlist(text), fmt='svg',
+                                                      backend='svg')
+
+
+def test_canonical_hash_still_dedups_equivalent_values(prg):
+    assert prg.canonical_hash("V1 1 0 5\nR1 1 0 1k\n") == prg.canonical_hash("V1 7 0 5\nR1 7 0 1000\n")
+
+
+def test_cache_round_trip(prg, tmp_path):
+    cache = prg.RenderCache(str(tmp_path), max_bytes=1 << 20)
+    key = prg.RenderCache.make_key("R1 1 0 1k\n", fmt='svg', backend='svg')
+    assert cache.get(key, 'svg') is None
+    cache.put(key, b'<svg/>', 'svg')
+    assert cache.get(key, 'svg') == b'<svg/>'
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_parallel_batch_render_respects_cache_limit(prg, tmp_path):
+    inputs = tmp_path / 'in'
+    inputs.mkdir()
+    for i in range(12):
+        (inputs / f"c{i}.cir").write_text(f"V1 1 0 5\nR1 1 2 {i + 1}k\nR2 2 0 1k\n")
+    cache_dir = tmp_path / 'cache'
+    results = prg.batch_render([str(inputs)], str(tmp_path / 'out'), jobs=2, fmt='svg',
+                               cache_dir=str(cache_dir), backend='svg')
+    assert all(r['status'] == 'ok' for r in results)
+    size = max(f.stat().st_size for f in (tmp_path / 'out').iterdir())
+    limit = 3 * size
+
+    cache_dir2 = tmp_path / 'cache2'
+    prg.batch_render([str(inputs)], str(tmp_path / 'out2'), jobs=3, fmt='svg',
+                     cache_dir=str(cache_dir2), cache_max_bytes=limit, backend='svg')
+    stored = [f for f in cache_dir2.iterdir() if not f.name.endswith('.tmp')]
+    assert sum(f.stat().st_size for f in stored) <= limit
+    assert len(stored) >= 2
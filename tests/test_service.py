@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import pytest
+
+
+class _NoBackend:
+    model = 'none'
+
+
+def _run(prg, scenario, **options):
+    async def main():
+        options.setdefault('render_cache_dir', None)
+        service = await prg.CircuitService(backend=_NoBackend(), **options).start('127.0.0.1', 0)
+        try:
+            return await scenario(service)
+        finally:
+            await service.close()
+    return asyncio.run(main())
+
+
+async def _send(service, raw):
+    reader, writer = await asyncio.open_connection(*service.address)
+    writer.write(raw)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+    body = await reader.readexactly(int(headers['Content-Length']))
+    writer.close()
+    return int(lines[0].split()[1]), headers, body
+
+
+def _post(path, data):
+    body = json.dumps(data).encode('utf-8')
+    return (f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n").encode('latin-1') + body
+
+
+@pytest.mark.parametrize('length', ['abc', '-5', '1.5'])
+def test_bad_content_length_is_400(prg, length):
+    raw = f"POST /validate HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode('latin-1')
+    status, _, body = _run(prg, lambda service: _send(service, raw))
+    assert status == 400
+    assert 'Content-Length' in json.loads(body)['error']
+
+
+def test_invalid_json_is_400(prg):
+    raw = b"POST /validate HTTP/1.1\r\nContent-Length: 3\r\nConnection: close\r\n\r\n{x}"
+    status, _, _ = _run(prg, lambda service: _send(service, raw))
+    assert status == 400
+
+
+def test_oversized_body_is_413(prg):
+    raw = f"POST /validate HTTP/1.1\r\nContent-Length: {prg.SERVICE_MAX_BODY + 1}\r\n\r\n"
+    status, _, _ = _run(prg, lambda service: _send(service, raw.encode('latin-1')))
+    assert status == 413
+
+
+def test_full_queue_is_429_with_retry_after(prg):
+    async def scenario(service):
+        release = asyncio.Event()
+
+        async def block():
+            await release.wait()
+
+        # اولی را کارگر برمی‌دارد و دومی تنها جای صف را پر می‌کند
+        pending = []
+        for _ in range(2):
+            pending.append(asyncio.ensure_future(service.submit(block)))
+            await asyncio.sleep(0.02)
+        try:
+            return await _send(service, _post('/validate', {'netlist': 'R1 1 0 1k'}))
+        finally:
+            release.set()
+            await asyncio.gather(*pending)
+
+    status, headers, _ = _run(prg, scenario, queue_size=1, workers=1)
+    assert status == 429
+    assert headers['Retry-After'] == str(prg.SERVICE_RETRY_AFTER)
+
+
+def test_validate_ignores_include(prg, tmp_path):
+    included = tmp_path / 'secret.cir'
+    included.write_text("R9 1 0 1k\n")
+    netlist = f"V1 1 0 5\nR1 1 0 1k\n.include {included}\n"
+
+    status, _, body = _run(prg, lambda service: _send(service, _post('/validate', {'netlist': netlist})))
+    assert status == 200
+    report = json.loads(body)
+    assert report['components'] == 2
+    assert len(prg.parse_netlist(netlist, allow_include=True)) == 3
+
+
+def test_render_uses_cache_on_repeat(prg, tmp_path):
+    request = _post('/render', {'netlist': 'V1 1 0 5\nR1 1 2 1k\nR2 2 0 1k', 'backend': 'svg'})
+
+    async def scenario(service):
+        first = await _send(service, request)
+        second = await _send(service, request)
+        return first, second, prg.get_render_cache(service.render_cache_dir)
+
+    first, second, cache = _run(prg, scenario, render_cache_dir=str(tmp_path))
+    assert first[0] == second[0] == 200
+    assert first[2] == second[2] and first[2].lstrip().startswith(b'<')
+    assert cache.hits >= 1
+
+
+def _get(path):
+    return f"GET {path} HTTP/1.1\r\nConnection: close\r\n\r\n".encode('latin-1')
+
+
+def test_add_circuit_validates_filename_and_ignores_include(prg, tmp_path):
+    (tmp_path / 'secret.cir').write_text("L1 1 0 1m\n")
+    store = prg.CircuitStore(str(tmp_path / 'store.db'))
+    spice = f"V1 1 0 5\nR1 1 0 1k\n.include {tmp_path / 'secret.cir'}\n"
+
+    async def scenario(service):
+        results = []
+        for filename in ['../escape.json', 'circuit_1.json', 'circuit_1.json']:
+            status, _, body = await _send(service, _post('/circuits', {
+                'spice_code': spice, 'filename': filename}))
+            results.append((status, json.loads(body)))
+        return results
+
+    (bad, _), (created, body), (conflict, _) = _run(prg, scenario, store=store)
+    assert (bad, created, conflict) == (400, 201, 409)
+    assert store.get(body['id'])['filename'] == 'circuit_1.json'
+    assert store.search(component_type='L') == []
+    assert store.get(body['id'])['canonical_hash'] == prg.canonical_hash("V1 1 0 5\nR1 1 0 1k\n")
+
+
+def test_list_circuits_page_bounds(prg, tmp_path):
+    store = prg.CircuitStore(str(tmp_path / 'store.db'))
+    for i in range(3):
+        store.add({'description': f"c{i}", 'spice_code': "R1 1 0 1k", 'date': f"2025-01-0{i + 1}"})
+
+    async def scenario(service):
+        return [await _send(service, _get(path)) for path in
+                ['/circuits?page_size=-1', '/circuits?page=0', '/circuits?page_size=1000']]
+
+    (small, _, body), (bad, _, _), (large, _, large_body) = _run(prg, scenario, store=store)
+    assert small == large == 200 and bad == 400
+    assert len(json.loads(body)['circuits']) == 1
+    assert len(json.loads(large_body)['circuits']) == 3
@@ -0,0 +1,28 @@
+import pytest
+
+
+def _parse(prg, text, chunk=7):
+    parser = prg.SpiceStreamParser()
+    for start in range(0, len(text), chunk):
+        parser.feed(text[start:start + chunk])
+    parser.close()
+    return parser
+
+
+@pytest.mark.parametrize('prose', ['RC Low Pass', 'This circuit is a simple divider',
+                                   'Circuit: RC filter with cutoff 1kHz', 'Here is the netlist:'])
+def test_title_and_prose_lines_are_skipped(prg, prose):
+    text = f"{prose}\nV1 1 0 5\nR1 1 2 1k\n+ \nC1 2 0 1u\n.tran 1m 10m\n.end\n"
+    parser = _parse(prg, text)
+    assert [c['name'] for c in parser.components] == ['V1', 'R1', 'C1']
+    assert parser.errors == []
+
+
+def test_invalid_component_aborts(prg):
+    with pytest.raises(prg.StreamAborted):
+        _parse(prg, "V1 1 0 5\nR1 1 n@de 1k\nC1 2 0 1u\n")
+
+
+def test_stream_matches_non_stream_components(prg):
+    text = "RC Low Pass\nV1 in 0 5\nR1 in out\n+ 1k\nC1 out 0 1u\n"
+    assert _parse(prg, text).components == prg.parse_netlist(text)
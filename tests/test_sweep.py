@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def test_stacked_linear_dc_matches_single_solves(prg):
+    components = prg.parse_netlist("V1 1 0 10\nR1 1 2 1k\nR2 2 0 1k\nR3 2 3 2k\nR4 3 0 2k\nI1 0 3 1m\n")
+    parameters, values = prg.build_variant_values(components, {'R1': [500, 1000, 2000]},
+                                                  {'R4': 0.05}, samples=7, seed=1)
+    # دسته کوچک تا حل چندمرحله‌ای هم پوشش داده شود
+    names, voltages = prg._stacked_linear_dc(components, parameters, values, max_batch_elements=40)
+    assert voltages.shape == (21, 3)
+    for row, solution in zip(values, voltages):
+        expected = prg._solve_variant(components, dict(zip(parameters, row.tolist())))
+        assert np.allclose(solution, [expected[name] for name in names], rtol=1e-6)
+
+
+def test_run_sweep_marks_non_positive_values_invalid(prg):
+    components = prg.parse_netlist("V1 1 0 5\nR1 1 2 1k\nR2 2 0 1k\n")
+    result = prg.run_sweep(components, sweeps={'R2': [-1e3, 1e3]})
+    assert result.valid.tolist() == [False, True]
+    assert np.isnan(result.voltages[0]).all()
+    assert abs(result.voltages[1][result.node_names.index('2')] - 2.5) < 1e-6
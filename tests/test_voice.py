@@ -0,0 +1,97 @@
+import atexit
+import queue
+import time
+
+import pytest
+
+
+class _FeedCapture:
+    """ورودی ساختگی که جمله‌ها را از صف تست می‌گیرد"""
+
+    def __init__(self):
+        self.feed = queue.Queue()
+        self.closed = 0
+
+    def open(self):
+        pass
+
+    def listen(self, timeout=1.0):
+        try:
+            item = self.feed.get(timeout=0.05)
+        except queue.Empty:
+            return None
+        if item is EOFError:
+            raise EOFError
+        return item
+
+    def close(self):
+        self.closed += 1
+
+
+def test_scripted_session_returns_texts_in_order(prg):
+    capture = prg.ScriptedCapture(['a', 'b', 'c'])
+    session = prg.VoiceCapture(capture, prg.StubSpeechBackend(), workers=2).start()
+    try:
+        assert list(session) == ['a', 'b', 'c']
+    finally:
+        session.stop()
+
+
+def test_paused_session_drops_speech_from_before_resume(prg):
+    capture = _FeedCapture()
+    session = prg.VoiceCapture(capture, prg.StubSpeechBackend()).start(paused=True)
+    try:
+        session.resume()
+        capture.feed.put('first')
+        assert session.next_text(timeout=2) == 'first'
+        # گفتاری که بعد از پایان درخواست ضبط شده
+        capture.feed.put('stale')
+        while not capture.feed.empty():
+            time.sleep(0.01)
+        session.pause()
+        time.sleep(0.1)
+
+        session.resume()
+        capture.feed.put('second')
+        assert session.next_text(timeout=2) == 'second'
+    finally:
+        capture.feed.put(EOFError)
+        session.stop()
+
+
+def test_get_voice_capture_stops_dead_session_and_registers_once(prg, monkeypatch):
+    voice_capture = prg.VoiceCapture
+
+    def make_session():
+        return voice_capture(prg.ScriptedCapture([]), prg.StubSpeechBackend())
+
+    registered = []
+    monkeypatch.setattr(prg, 'VoiceCapture', make_session)
+    monkeypatch.setattr(prg, '_voice_capture', None)
+    monkeypatch.setattr(atexit, 'register', registered.append)
+
+    first = prg.get_voice_capture()
+    first.resume()
+    assert first.next_text(timeout=2) is None
+    second = prg.get_voice_capture()
+    assert second is not first
+    assert first._thread is None and first._executor is None
+    assert registered == [prg._stop_voice_capture]
+    second.stop()
+
+
+class _FakeRecognizer:
+    def __init__(self, reply):
+        self.reply = reply
+
+    def recognize_vosk(self, audio):
+        return self.reply
+
+
+def test_vosk_json_result_is_unwrapped(prg):
+    pytest.importorskip('speech_recognition')
+    backend = prg.SpeechRecognizerBackend('vosk')
+    backend._recognizer = _FakeRecognizer('{\n  "text" : "یک مقاومت"\n}')
+    assert backend.recognize(None) == 'یک مقاومت'
+    backend._recognizer = _FakeRecognizer('{\n  "text" : ""\n}')
+    assert backend.recognize(None) is None